@@ -1,21 +1,29 @@
 from collections import defaultdict
 import os
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, render_template, request, jsonify, redirect, url_for, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 import pandas as pd
 import plotly.graph_objs as go
 import json
 from plotly.utils import PlotlyJSONEncoder
 from datetime import datetime
-from sqlalchemy import create_engine, func
+from sqlalchemy import create_engine, func, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker
 from flask import Flask, jsonify
-from threading import Thread
+from threading import Thread, Lock
 from get_quotes import get_quotes
 from datetime import date, timedelta
 import logging
 import numpy as np
-from smile import smile_route, get_smile_data
+import payoff
+import greeks
+import sqlite3
+from smile import smile_route, get_smile_data, get_smile_cache_stats
+from parquet_archive import read_daily as read_archived_daily, read_bars as read_archived_bars
+import chart_data
+from conditional import make_etag, not_modified, tagged
+from live_feed import LiveFeed, event_stream
 import subprocess
 
 STRIKE_PRICE_MAX = 45
@@ -25,6 +33,8 @@ app = Flask(__name__)
 db_path = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'options.db')
 app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
 db = SQLAlchemy(app)
+# Newest VIX bar and expiration watermarks, refreshed when ingestion commits
+live = LiveFeed(db_path)
 
 # Assuming your models are defined using db.Model
 class DailyOption(db.Model):
@@ -57,25 +67,51 @@ class VixData(db.Model):
     def __repr__(self):
         return f"<VixData(symbol='{self.symbol}', date='{self.date}', close={self.close})>"
 
+# Dropdown values for index(), rebuilt only when the ingestion generation changes
+index_catalog = {'generation': None}
+index_catalog_lock = Lock()
+
+def ingestion_generation():
+    # Bumped by DBWriter on every committed batch; None on databases that predate it
+    try:
+        row = db.session.execute(text("SELECT value FROM ingest_meta WHERE key = 'generation'")).fetchone()
+    except OperationalError:
+        db.session.rollback()
+        return None
+    return row[0] if row else 0
+
+def get_index_catalog():
+    generation = ingestion_generation()
+    with index_catalog_lock:
+        if generation is not None and index_catalog['generation'] == generation:
+            return index_catalog
+
+        # One pass over the daily_option key instead of a DISTINCT scan per dropdown
+        rows = db.session.query(DailyOption.quote_type, DailyOption.symbol, DailyOption.expiration,
+                                DailyOption.strike, DailyOption.right).distinct().all()
+        index_catalog.update({
+            'generation': generation,
+            'quote_types': [(value,) for value in sorted({row[0] for row in rows})],
+            'symbols': [(value,) for value in sorted({row[1] for row in rows})],
+            'expirations': sorted({row[2] for row in rows}),
+            'strikes': [(value,) for value in sorted({row[3] for row in rows})],
+            'rights': [(value,) for value in sorted({row[4] for row in rows})],
+            'current_vix': get_current_vix(),
+        })
+        print(f"Rebuilt index catalog for generation {generation}: {len(rows)} contracts")
+        return index_catalog
+
 @app.route('/')
 def index():
-    # Fetch unique values for dropdowns
-    quote_types = db.session.query(DailyOption.quote_type.distinct()).all()
-    symbols = db.session.query(DailyOption.symbol.distinct()).all()
-    # Fetch expirations and filter out past dates
+    # Fetch unique values for dropdowns from the catalog, refreshed when ingestion commits
+    catalog = get_index_catalog()
+    # Filter out past expirations
     today = date.today()
-    expirations = db.session.query(DailyOption.expiration.distinct()).filter(DailyOption.expiration >= today).all()
-    expiration_dates = [exp[0].strftime('%Y-%m-%d') for exp in expirations]
-    
-    strikes = db.session.query(DailyOption.strike.distinct()).all()
-    rights = db.session.query(DailyOption.right.distinct()).all()
+    expiration_dates = [exp.strftime('%Y-%m-%d') for exp in catalog['expirations'] if exp >= today]
 
-    # Get the current VIX value
-    current_vix = get_current_vix_value()
-
-    return render_template('index.html', symbols=symbols,
-                           expirations=expiration_dates, strikes=strikes, rights=rights,
-                           current_vix=current_vix)
+    return render_template('index.html', symbols=catalog['symbols'],
+                           expirations=expiration_dates, strikes=catalog['strikes'], rights=catalog['rights'],
+                           current_vix=catalog['current_vix'])
 
 @app.route('/get_chart_data')
 def get_chart_data():
@@ -83,25 +119,115 @@ def get_chart_data():
     expiration = request.args.get('expiration')
     strike = request.args.get('strike')
     right = request.args.get('right')
+    # Optional: start/end (YYYY-MM-DD), max_points, resolution=daily|hourly
+    start = request.args.get('start')
+    end = request.args.get('end')
+    max_points = request.args.get('max_points', type=int)
+    resolution = request.args.get('resolution', 'daily')
+
+    print(f"Fetching data for: {symbol}, {expiration}, {strike}, {right}, {start}..{end}, {resolution}")  # Debug print
+    if not strike:
+        return jsonify([])
+    try:
+        strike = float(strike)
+    except ValueError:
+        return jsonify([])
+    try:
+        start, end = chart_data.date_bounds(start, end)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid start/end: {str(e)}'}), 400
 
-    print(f"Fetching data for: {symbol}, {expiration}, {strike}, {right}")  # Debug print
-
-    # Query the daily_option view using SQLAlchemy ORM
-    data = db.session.query(DailyOption.date, DailyOption.open, DailyOption.high, DailyOption.low, DailyOption.close) \
-        .filter(DailyOption.symbol == symbol,
-                DailyOption.expiration == expiration,
-                DailyOption.strike == strike,
-                DailyOption.right == right,
-                # DailyOption.strike >= STRIKE_PRICE_MIN,
-                # DailyOption.strike <= STRIKE_PRICE_MAX
-                 ).all()
+    conn = sqlite3.connect(db_path)
+    try:
+        # Unchanged since the client's copy: answer from its cache before reading any bars
+        etag = make_etag(chart_data.contract_watermark(conn, symbol, expiration, strike, right))
+        unchanged = not_modified(etag)
+        if unchanged is not None:
+            return unchanged
+        sql, params = chart_data.bar_query(symbol, expiration, strike, right, start, end, resolution)
+        if chart_data.should_stream(chart_data.count_bars(conn, sql, params), max_points):
+            # Long history with nothing to downsample: straight from a cursor, in chunks
+            return tagged(chart_data.stream_response(db_path, sql, params, resolution), etag)
+        if resolution == 'hourly':
+            data = chart_data.load_hourly(conn, symbol, expiration, strike, right, start, end)
+        else:
+            data = chart_data.load_daily(conn, symbol, expiration, strike, right, start, end)
+    finally:
+        conn.close()
 
     print(f"Data points fetched: {len(data)}")  # Debug print
 
-    # Convert to a list of dictionaries for D3.js
-    result = [{'date': d[0].isoformat(), 'open': d[1], 'high': d[2], 'low': d[3], 'close': d[4]} for d in data]
+    if data.empty:
+        # Expired expirations are moved to the Parquet archive by parquet_archive.py
+        if resolution == 'hourly':
+            archived = read_archived_bars(symbol, expiration)
+            if archived is not None:
+                archived = archived[(archived['strike'] == float(strike)) & (archived['right'] == right)
+                                    & (archived['quote_type'] == 'TRADES')]
+        else:
+            archived = read_archived_daily(symbol, expiration, strike, right, 'TRADES')
+        if archived is not None and not archived.empty:
+            archived = archived.assign(date=pd.to_datetime(archived['date']))
+            data = chart_data.clip_range(archived, start, end)
+            print(f"Data points fetched from archive: {len(data)}")
+
+    # Shape-preserving OHLC re-bucketing down to the point budget
+    data = chart_data.downsample_ohlc(data, max_points)
+
+    # List of {date, open, high, low, close} for D3.js
+    return tagged(chart_data.json_response(data), etag)
+
+@app.route('/get_chart_data_batch', methods=['GET', 'POST'])
+def get_chart_data_batch():
+    # GET: symbol, expiration and optional min_strike/max_strike/right for a strike ladder
+    # POST: {"contracts": [{"symbol", "expiration", "strike", "right"}, ...]} for an explicit list
+    # Both take optional start, end and max_points, like /get_chart_data
+    args = request.args.to_dict()
+    contracts = None
+    if request.method == 'POST':
+        payload = request.get_json(silent=True) or {}
+        args.update({key: value for key, value in payload.items() if key != 'contracts'})
+        try:
+            # Each contract once: a repeated one would come back with its bars repeated
+            contracts = list(dict.fromkeys((c['symbol'], c['expiration'], float(c['strike']), c['right'])
+                                           for c in payload.get('contracts') or []))
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({'error': f'Invalid contract: {str(e)}'}), 400
+        if not contracts:
+            return jsonify({'error': 'No contracts provided'}), 400
+        if len(contracts) > chart_data.MAX_BATCH_CONTRACTS:
+            return jsonify({'error': f'At most {chart_data.MAX_BATCH_CONTRACTS} contracts per request'}), 400
+    elif not args.get('symbol') or not args.get('expiration'):
+        return jsonify({'error': 'symbol and expiration are required'}), 400
 
-    return jsonify(result)
+    try:
+        max_points = int(args['max_points']) if args.get('max_points') else None
+        min_strike = float(args['min_strike']) if args.get('min_strike') else None
+        max_strike = float(args['max_strike']) if args.get('max_strike') else None
+        start, end = chart_data.date_bounds(args.get('start'), args.get('end'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid argument: {str(e)}'}), 400
+
+    conn = sqlite3.connect(db_path)
+    try:
+        # Only the strike-ladder form is tagged; an explicit contract list is always recomputed
+        etag = None if contracts else make_etag(chart_data.expiration_watermark(conn, args['symbol'], args['expiration']))
+        unchanged = not_modified(etag)
+        if unchanged is not None:
+            return unchanged
+        data = chart_data.load_daily_batch(conn, contracts, args.get('symbol'), args.get('expiration'),
+                                           min_strike, max_strike, args.get('right'), start, end)
+        symbols = sorted(set(data['symbol'])) or [args.get('symbol') or contracts[0][0]]
+        underlying = chart_data.load_underlying(conn, symbols[0], start, end)
+    finally:
+        conn.close()
+
+    print(f"Batch chart data: {data.groupby(['strike', 'right']).ngroups} contracts, {len(data)} bars")
+    return tagged(jsonify({
+        'columns': chart_data.BATCH_COLUMNS,
+        'contracts': chart_data.columnar(data, max_points),
+        'underlying': {'symbol': symbols[0], 'date': underlying['day'].tolist(), 'close': underlying['close'].tolist()},
+    }), etag)
 
 @app.route('/check_db')
 def check_db():
@@ -125,6 +251,16 @@ def get_option_chain():
     symbol = request.args.get('symbol')
     quote_type = request.args.get('quote_type')
 
+    conn = sqlite3.connect(db_path)
+    try:
+        expiration_latest = chart_data.expiration_watermark(conn, symbol, expiration, quote_type)
+    finally:
+        conn.close()
+    etag = make_etag(expiration_latest, latest_vix_date())
+    unchanged = not_modified(etag)
+    if unchanged is not None:
+        return unchanged
+
     option_chain_data = get_option_chain_data(symbol, expiration, quote_type)    
     df = pd.DataFrame(option_chain_data)
     
@@ -148,7 +284,7 @@ def get_option_chain():
         'quoteDate': quote_date
     }
 
-    return jsonify(result)
+    return tagged(jsonify(result), etag)
 
 class OptionDayQuote:
     def __init__(self, strike=0, call=0, put=0, call_volume=0, put_volume=0):
@@ -231,8 +367,9 @@ def option_calculator():
         shares = int(request.form.get('shares'))
         options = []
         
-        # Process options data
-        for i in range(10):  # Assume max 10 options
+        # Process options data, as many legs as the form posted
+        indexes = sorted({int(key.split('_')[1]) for key in request.form if key.startswith('strike_') and key.split('_')[1].isdigit()})
+        for i in indexes:
             strike = request.form.get(f'strike_{i}')
             if strike:
                 options.append({
@@ -244,52 +381,63 @@ def option_calculator():
                 })
         
         # Calculate profit/loss chart data
-        chart_data = calculate_profit_loss(stock, shares, options)
+        try:
+            chart_data = calculate_profit_loss(stock, shares, options, **grid_args(request.form))
+        except ValueError as e:
+            return jsonify({'error': f'Invalid price grid: {str(e)}'}), 400
         
         return jsonify(chart_data)
     
     return render_template('option_calculator.html')
 
-def calculate_profit_loss(stock, shares, options):
+def grid_args(values):
+    # Optional price grid overrides: points, min_price, max_price
+    args = {}
+    if values.get('points'):
+        args['points'] = int(values.get('points'))
+    for key in ('min_price', 'max_price'):
+        if values.get(key) not in (None, ''):
+            args[key] = float(values.get(key))
+    return args
+
+def calculate_profit_loss(stock, shares, options, points=payoff.DEFAULT_POINTS, min_price=None, max_price=None):
     # Generate a range of potential stock prices
-    min_price = min(option['strike'] for option in options) * 0.5
-    max_price = max(option['strike'] for option in options) * 1.5
-    stock_prices = np.linspace(min_price, max_price, 100)
-    
-    profits = []
-    for price in stock_prices:
-        profit = (price - float(stock)) * shares
-        for option in options:
-            if option['type'] == 'call':
-                option_profit = max(0, price - option['strike']) - option['price']
-            else:  # put
-                option_profit = max(0, option['strike'] - price) - option['price']
-            
-            if option['position'] == 'short':
-                option_profit = -option_profit
-            
-            profit += option_profit * 100 * option['contracts']  # 100 shares per contract
-        profits.append(profit)
-    
+    stock_prices = payoff.price_grid([option['strike'] for option in options], points, min_price, max_price)
+    profits = payoff.strategy_profits(options, stock_prices, stock, shares)
+
     return {
         'stockPrices': stock_prices.tolist(),
-        'profits': profits
+        'profits': profits.tolist()
     }
 
 @app.route('/start_get_quotes', methods=['POST'])
 def start_get_quotes():
     get_quotes()
 
-def get_current_vix():    
-    latest_vix = VixData.query.order_by(VixData.date.desc()).first()
-    return float(latest_vix.close) if latest_vix else None
+def get_current_vix():
+    latest_vix = live.latest_vix()
+    return float(latest_vix[1]) if latest_vix else None
+
+
+def latest_vix_date():
+    latest_vix = live.latest_vix()
+    return latest_vix[0] if latest_vix else None
 
+@app.route('/live_updates')
+def live_updates():
+    # Server-sent events: 'vix' {date, vix} and 'chain' {symbol, expiration, latest} as ingestion commits
+    return Response(stream_with_context(event_stream(live)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/get_current_vix_value', methods=['GET'])
 def get_current_vix_value():
     app.logger.info("get_current_vix_value endpoint called")
+    etag = make_etag(latest_vix_date())
+    unchanged = not_modified(etag)
+    if unchanged is not None:
+        return unchanged
     latest_vix = get_current_vix()
-    return jsonify({'vix': latest_vix})
+    return tagged(jsonify({'vix': latest_vix}), etag)
 
 @app.route('/expiration_profit_loss', methods=['GET', 'POST'])
 def expiration_profit_loss():
@@ -320,39 +468,45 @@ def expiration_profit_loss():
         
         print(f"Processed options: {options}")
         if options:
-            chart_data = calculate_expiration_profit_loss(options)            
+            try:
+                chart_data = calculate_expiration_profit_loss(options, **grid_args(request.form))
+            except ValueError as e:
+                return jsonify({'error': f'Invalid price grid: {str(e)}'}), 400
             return jsonify(chart_data)
         else:            
             return jsonify({'error': 'No valid options provided'}), 400
     
     return render_template('expiration_profit_loss.html')
 
-def calculate_expiration_profit_loss(options):
-    strikes = [option['strike'] for option in options]
-    min_price = min(strikes) * 0.5
-    max_price = max(strikes) * 1.5
-    stock_prices = np.linspace(min_price, max_price, 100)
-    
-    profits = []
-    for price in stock_prices:
-        profit = 0
-        for option in options:
-            if option['type'] == 'call':
-                option_profit = max(0, price - option['strike']) - option['cost']
-            else:  # put
-                option_profit = max(0, option['strike'] - price) - option['cost']
-            
-            if option['position'] == 'short':
-                option_profit = -option_profit
-            
-            profit += option_profit * 100 * option['number']  # 100 shares per contract, multiplied by number of contracts
-        profits.append(profit)
-    
+def calculate_expiration_profit_loss(options, points=payoff.DEFAULT_POINTS, min_price=None, max_price=None):
+    stock_prices = payoff.price_grid([option['strike'] for option in options], points, min_price, max_price)
+    profits = payoff.strategy_profits(options, stock_prices)
+
     return {
         'stockPrices': stock_prices.tolist(),
-        'profits': profits
+        'profits': profits.tolist()
     }
 
+@app.route('/batch_profit_loss', methods=['POST'])
+def batch_profit_loss():
+    # {"strategies": [[leg, ...], ...], "points": 200, "min_price": 5, "max_price": 60}
+    payload = request.get_json(silent=True) or {}
+    strategies = payload.get('strategies') or []
+    try:
+        strikes = [float(leg['strike']) for legs in strategies for leg in legs]
+        if not strikes:
+            return jsonify({'error': 'No valid strategies provided'}), 400
+        stock_prices = payoff.price_grid(strikes, **grid_args(payload))
+        profits = payoff.batch_profits(strategies, stock_prices)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid strategy: {str(e)}'}), 400
+
+    return jsonify({
+        'stockPrices': stock_prices.tolist(),
+        'profits': profits.tolist(),
+        **payoff.summarize(profits, stock_prices)
+    })
+
 def get_expirations():
     # This is a placeholder function. Replace this with actual logic to fetch expirations from your data source.
     today = datetime.now()
@@ -371,6 +525,31 @@ def smile():
 def smile_data():
     return get_smile_data()
 
+@app.route('/get_smile_cache_stats')
+def smile_cache_stats():
+    return get_smile_cache_stats()
+
+@app.route('/get_greeks')
+def get_greeks():
+    # IV and Greeks of one stored chain, in the smile page's figure format
+    symbol = request.args.get('symbol', 'VIX')
+    expiration = request.args.get('expiration')
+    date = request.args.get('date')
+    if not expiration:
+        return jsonify({'error': 'expiration is required'}), 400
+
+    # Keyed on the ingestion generation, so new or rebuilt bars are never answered from an old computation
+    generation = ingestion_generation()
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = greeks.chain_on(conn, symbol, expiration, date, generation)
+    finally:
+        conn.close()
+    if rows is None or rows.empty:
+        return jsonify({'error': f'No data for {symbol} {expiration} {date or ""}'.strip()}), 404
+
+    return jsonify({'symbol': symbol, 'figures': [greeks.smile_figure(rows, expiration)]})
+
 @app.route('/get_commit_info')
 def get_commit_info():
     try:
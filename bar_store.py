@@ -0,0 +1,136 @@
+"""
+Schema v2 storage for option bars.
+
+Contracts live once in the `contract` dimension table (small integer id,
+unique IB conId and symbol/expiration/strike/right); bars reference it by
+id and store `ts` as integer epoch seconds. Timestamps are the exchange
+(US/Eastern) wall-clock time counted as if it were UTC, so SQLite's
+datetime(ts, 'unixepoch') gives back exactly the old 'YYYY-MM-DD HH:MM:SS'
+text and a day is always ts // 86400. The `option_data` and `quote_status`
+views keep the old layout readable. Migrate an existing database with:
+
+    python migrate_schema_v2.py
+"""
+import pandas as pd
+
+QUOTE_TYPES = ('TRADES', 'MIDPOINT', 'BID', 'ASK', 'BID_ASK')
+
+# Kept in step with create_table.sql
+CREATE_TABLES = '''
+    CREATE TABLE IF NOT EXISTS contract (
+        id INTEGER PRIMARY KEY,
+        conId INTEGER UNIQUE,
+        symbol VARCHAR(10) NOT NULL,
+        expiration DATE NOT NULL,
+        strike REAL NOT NULL,
+        right CHAR(1) NOT NULL,
+        UNIQUE (symbol, expiration, strike, right)
+    );
+
+    CREATE TABLE IF NOT EXISTS quote_type (
+        id INTEGER PRIMARY KEY,
+        name VARCHAR(10) NOT NULL UNIQUE
+    );
+
+    CREATE TABLE IF NOT EXISTS bar (
+        contract_id INTEGER NOT NULL REFERENCES contract (id),
+        quote_type INTEGER NOT NULL REFERENCES quote_type (id),
+        ts INTEGER NOT NULL,
+        open REAL,
+        high REAL,
+        low REAL,
+        close REAL,
+        volume INTEGER,
+        average REAL,
+        barCount INTEGER,
+        PRIMARY KEY (contract_id, quote_type, ts)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS bar_status (
+        contract_id INTEGER NOT NULL REFERENCES contract (id),
+        quote_type INTEGER NOT NULL REFERENCES quote_type (id),
+        latest INTEGER NOT NULL,
+        PRIMARY KEY (contract_id, quote_type)
+    ) WITHOUT ROWID;
+'''
+
+# The old option_data / quote_status layout, for readers that predate v2
+CREATE_VIEWS = '''
+    CREATE VIEW IF NOT EXISTS option_data AS
+    SELECT q.name AS quote_type, c.symbol, c.expiration, c.strike, c.right, datetime(b.ts, 'unixepoch') AS date,
+        b.open, b.high, b.low, b.close, b.volume, b.average, b.barCount
+    FROM bar b JOIN contract c ON c.id = b.contract_id JOIN quote_type q ON q.id = b.quote_type;
+
+    CREATE VIEW IF NOT EXISTS quote_status AS
+    SELECT q.name AS quote_type, c.symbol, c.expiration, c.strike, c.right, datetime(s.latest, 'unixepoch') AS latest
+    FROM bar_status s JOIN contract c ON c.id = s.contract_id JOIN quote_type q ON q.id = s.quote_type;
+'''
+
+QUOTE_TYPE_INSERT = 'INSERT OR IGNORE INTO quote_type (name) VALUES (?)'
+
+# Lookups the inserts use in place of the strings the old rows repeated
+CONTRACT_ID = '(SELECT id FROM contract WHERE symbol = ? AND expiration = ? AND strike = ? AND right = ?)'
+QUOTE_TYPE_ID = '(SELECT id FROM quote_type WHERE name = ?)'
+
+CONTRACT_UPSERT = '''
+    INSERT INTO contract (conId, symbol, expiration, strike, right) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (symbol, expiration, strike, right) DO UPDATE SET conId = COALESCE(excluded.conId, contract.conId)
+'''
+
+BAR_INSERT = f'''
+    INSERT OR REPLACE INTO bar (contract_id, quote_type, ts, open, high, low, close, volume, average, barCount)
+    VALUES ({CONTRACT_ID}, {QUOTE_TYPE_ID}, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+STATUS_INSERT = f'''
+    INSERT OR REPLACE INTO bar_status (contract_id, quote_type, latest)
+    VALUES ({CONTRACT_ID}, {QUOTE_TYPE_ID}, ?)
+'''
+
+
+def to_epoch(dates):
+    """'YYYY-MM-DD HH:MM:SS' exchange-time strings (Series or scalar) to ts seconds."""
+    if isinstance(dates, str):
+        return int(pd.Timestamp(dates).value // 10**9)
+    return (pd.to_datetime(dates).astype('int64') // 10**9).astype(int)
+
+
+def contract_rows(df):
+    """Distinct (conId, symbol, expiration, strike, right) rows for CONTRACT_UPSERT."""
+    columns = ['symbol', 'expiration', 'strike', 'right']
+    contracts = df[(['conId'] if 'conId' in df else []) + columns].drop_duplicates(columns)
+    con_ids = contracts['conId'].tolist() if 'conId' in contracts else [None] * len(contracts)
+    # conId 0 means the contract was never qualified
+    return [(con_id or None, symbol, expiration, float(strike), right)
+            for con_id, symbol, expiration, strike, right
+            in zip(con_ids, contracts['symbol'], contracts['expiration'], contracts['strike'], contracts['right'])]
+
+
+def is_v2(conn):
+    kind = conn.execute("SELECT type FROM sqlite_master WHERE name = 'option_data'").fetchone()
+    return kind is None or kind[0] == 'view'
+
+
+def ensure_schema(conn):
+    """Create the v2 tables and views; refuses to run on a database that still has v1 tables."""
+    if not is_v2(conn):
+        raise RuntimeError('options.db still uses the v1 option_data table, run migrate_schema_v2.py first')
+    conn.executescript(CREATE_TABLES)
+    conn.executemany(QUOTE_TYPE_INSERT, [(name,) for name in QUOTE_TYPES])
+    conn.executescript(CREATE_VIEWS)
+    conn.commit()
+
+
+def queue_bars(writer, df):
+    """Queue df (old option_data columns, plus conId when known) on a DBWriter."""
+    if df is None or df.empty:
+        return 0
+    writer.write(QUOTE_TYPE_INSERT, [(name,) for name in df['quote_type'].unique().tolist()])
+    writer.write(CONTRACT_UPSERT, contract_rows(df))
+    rows = list(zip(
+        df['symbol'].tolist(), df['expiration'].tolist(), df['strike'].astype(float).tolist(), df['right'].tolist(),
+        df['quote_type'].tolist(),
+        to_epoch(df['date']).tolist(), df['open'].tolist(), df['high'].tolist(), df['low'].tolist(),
+        df['close'].tolist(), df['volume'].tolist(), df['average'].tolist(), df['barCount'].tolist()))
+    writer.write(BAR_INSERT, rows)
+    return len(rows)
@@ -0,0 +1,135 @@
+"""
+Throughput benchmark for the ingestion scripts against fake_ib_gateway.
+
+Each script runs as a subprocess in a scratch directory holding a fresh
+options.db (created from create_table.sql), while the fake gateway listens
+on 7496/7497 in this process and counts what it served. Reports
+contracts/sec and rows/sec per script.
+
+    python benchmark_ingestion.py --latency 0.02 --expirations 4
+"""
+import argparse
+import csv
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+from fake_ib_gateway import FakeGateway, Faults, RecordedChain, SyntheticChain
+
+REPO_DIR = os.path.abspath(os.path.dirname(__file__))
+
+# script -> (table or csv the script writes, gateway counter used as "contracts")
+SCRIPTS = {
+    'get_vix.py': ('vix_data', 'historical_contracts'),
+    'get_quotes.py': ('option_data', 'historical_contracts'),
+    'concurrent_get_quotes.py': ('option_data', 'historical_contracts'),
+    'concurrent_get_current_quotes.py': ('vix_options_data.csv', 'mktdata_contracts'),
+}
+
+
+def create_database(work_dir):
+    conn = sqlite3.connect(os.path.join(work_dir, 'options.db'))
+    with open(os.path.join(REPO_DIR, 'create_table.sql')) as sql_file:
+        conn.executescript(sql_file.read())
+    conn.commit()
+    conn.close()
+
+
+def count_rows(work_dir, target):
+    path = os.path.join(work_dir, target)
+    if target.endswith('.csv'):
+        if not os.path.exists(path):
+            return 0
+        with open(path) as f:
+            return max(sum(1 for _ in csv.reader(f)) - 1, 0)
+    conn = sqlite3.connect(os.path.join(work_dir, 'options.db'))
+    try:
+        return conn.execute(f'SELECT COUNT(*) FROM {target}').fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+    finally:
+        conn.close()
+
+
+def run_script(gateway, script, work_dir, timeout):
+    target, counter = SCRIPTS[script]
+    rows_before = count_rows(work_dir, target)
+    gateway.reset_stats()
+
+    start = time.perf_counter()
+    try:
+        proc = subprocess.run(
+            [sys.executable, os.path.join(REPO_DIR, script)],
+            cwd=work_dir, capture_output=True, text=True, timeout=timeout,
+            env=dict(os.environ, PYTHONPATH=REPO_DIR))
+        status = 'ok' if proc.returncode == 0 else f'exit {proc.returncode}'
+    except subprocess.TimeoutExpired:
+        status = 'timeout'
+    elapsed = time.perf_counter() - start
+
+    stats = gateway.snapshot()
+    rows = count_rows(work_dir, target) - rows_before
+    return {
+        'script': script,
+        'status': status,
+        'seconds': elapsed,
+        'contracts': stats[counter],
+        'rows': rows,
+        'contracts_per_sec': stats[counter] / elapsed if elapsed else 0.0,
+        'rows_per_sec': rows / elapsed if elapsed else 0.0,
+        'pacing_errors': stats['pacing_errors'],
+        'hung_requests': stats['hung_requests'],
+    }
+
+
+def print_report(results):
+    header = f"{'script':<36}{'status':<10}{'secs':>8}{'contracts':>11}{'rows':>9}{'contracts/s':>13}{'rows/s':>10}{'pacing':>8}{'hung':>6}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f"{r['script']:<36}{r['status']:<10}{r['seconds']:>8.2f}{r['contracts']:>11}{r['rows']:>9}"
+              f"{r['contracts_per_sec']:>13.2f}{r['rows_per_sec']:>10.1f}{r['pacing_errors']:>8}{r['hung_requests']:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ingestion scripts against the fake IB gateway')
+    parser.add_argument('scripts', nargs='*', default=list(SCRIPTS), help='scripts to run (default: all)')
+    parser.add_argument('--expirations', type=int, default=4)
+    parser.add_argument('--record-db', help='replay bars from this options.db')
+    parser.add_argument('--latency', type=float, default=0.01)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--pacing-error-rate', type=float, default=0.0)
+    parser.add_argument('--hang-rate', type=float, default=0.0)
+    parser.add_argument('--enforce-pacing', action='store_true')
+    parser.add_argument('--warm', action='store_true', help='reuse one database across scripts instead of a fresh one each')
+    parser.add_argument('--timeout', type=float, default=1800, help='per-script timeout in seconds')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    chain = RecordedChain(args.record_db) if args.record_db else SyntheticChain(args.expirations)
+    faults = Faults(args.latency, args.jitter, args.pacing_error_rate, args.hang_rate,
+                    args.enforce_pacing, seed=args.seed)
+    gateway = FakeGateway(chain, faults).start_in_thread()
+
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as shared_dir:
+            create_database(shared_dir)
+            for script in args.scripts:
+                if args.warm:
+                    results.append(run_script(gateway, script, shared_dir, args.timeout))
+                    continue
+                with tempfile.TemporaryDirectory() as work_dir:
+                    create_database(work_dir)
+                    results.append(run_script(gateway, script, work_dir, args.timeout))
+    finally:
+        gateway.stop()
+
+    print_report(results)
+
+
+if __name__ == '__main__':
+    main()
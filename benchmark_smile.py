@@ -0,0 +1,98 @@
+"""
+Offline benchmark for smile.fetch_option_data against a fake chain source.
+
+FakeChainSource stands in for yfinance: it sleeps `latency` per call,
+fails a fraction of expirations and hangs others, so the parallel fetch,
+its timeout and the partial-result path can be timed without network.
+
+    python benchmark_smile.py --expirations 30 --latency 0.5 --workers 1 8 16
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+import smile
+import smile_store
+
+
+class FakeChainSource:
+    def __init__(self, expirations=30, strikes=80, latency=0.5, failure_rate=0.0, hang_rate=0.0, seed=0):
+        today = date.today()
+        self.expiration_list = tuple((today + timedelta(days=7 * (i + 1))).isoformat() for i in range(expirations))
+        self.strikes = strikes
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.hang_rate = hang_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.released = threading.Event()  # set to end hung calls so the process can exit
+
+    def expirations(self, symbol):
+        time.sleep(self.latency)
+        return self.expiration_list
+
+    def option_chain(self, symbol, expiration):
+        self.calls += 1
+        roll = self.random.random()
+        if roll < self.hang_rate:
+            self.released.wait()
+        time.sleep(self.latency)
+        if roll < self.hang_rate + self.failure_rate:
+            raise ConnectionError(f'fake failure for {expiration}')
+        strikes = np.linspace(300, 700, self.strikes)
+        side = pd.DataFrame({
+            'strike': strikes,
+            'impliedVolatility': 0.2 + ((strikes - 500) / 500) ** 2,
+            'lastTradeDate': pd.Timestamp(datetime.now()),
+        })
+        return SimpleNamespace(calls=side, puts=side.copy())
+
+
+def run(source, workers, timeout, deadline):
+    # Snapshots go to a scratch database, so every run starts cold
+    smile_store.DB_PATH = os.path.join(tempfile.mkdtemp(prefix='smile-bench-'), 'options.db')
+    smile.CHAIN_WORKERS = workers
+    smile.CHAIN_TIMEOUT = timeout
+    smile.CHAIN_DEADLINE = deadline
+    smile.set_data_source(source)
+    started = time.perf_counter()
+    data = smile.fetch_option_data('SPY')
+    cold = time.perf_counter() - started
+    started = time.perf_counter()
+    smile.fetch_option_data('SPY')
+    warm = time.perf_counter() - started
+    source.released.set()
+    return cold, warm, len(data.get('figures', [])), len(data.get('failed', []))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark smile chain fetching against a fake source')
+    parser.add_argument('--expirations', type=int, default=30)
+    parser.add_argument('--strikes', type=int, default=80)
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--hang-rate', type=float, default=0.0)
+    parser.add_argument('--timeout', type=float, default=smile.CHAIN_TIMEOUT)
+    parser.add_argument('--deadline', type=float, default=smile.CHAIN_DEADLINE)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, smile.CHAIN_WORKERS])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'workers':>8} {'cold s':>8} {'warm ms':>8} {'figures':>8} {'failed':>7}")
+    for workers in args.workers:
+        source = FakeChainSource(args.expirations, args.strikes, args.latency,
+                                 args.failure_rate, args.hang_rate, args.seed)
+        cold, warm, figures, failed = run(source, workers, args.timeout, args.deadline)
+        print(f"{workers:>8} {cold:>8.2f} {warm * 1000:>8.2f} {figures:>8} {failed:>7}")
+
+
+if __name__ == "__main__":
+    main()
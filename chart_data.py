@@ -0,0 +1,255 @@
+"""
+Bar series for /get_chart_data: range-limited reads, OHLC downsampling
+and chunked JSON responses.
+
+A range with more than STREAM_THRESHOLD bars and nothing to downsample
+is streamed straight from a cursor (stream_response), CHUNK_ROWS rows at
+a time, so a long hourly history never sits in memory as a whole.
+Everything else is loaded into a DataFrame first.
+
+Downsampling re-buckets consecutive bars into at most `max_points`
+buckets (open of the first bar, high/low over the bucket, close of the
+last), so candles keep their true extremes; with a single close series
+this would be LTTB's job, but for OHLC bars the exact envelope is
+cheaper and loses nothing a chart can show.
+"""
+import datetime
+import json
+import sqlite3
+
+import numpy as np
+import pandas as pd
+from flask import Response, stream_with_context
+
+from bar_store import CONTRACT_ID, QUOTE_TYPE_ID, to_epoch
+
+STREAM_THRESHOLD = 2000  # rows; smaller results go out as one body
+CHUNK_ROWS = 1000
+MAX_BATCH_CONTRACTS = 200  # 4 variables each plus 3 stays under SQLite's 999 bound variables (before 3.32)
+
+DAILY_QUERY = '''
+    SELECT date, open, high, low, close, volume FROM daily_option
+    WHERE symbol = ? AND expiration = ? AND strike = ? AND right = ? AND quote_type = ?
+      AND date >= ? AND date <= ?
+    ORDER BY date
+'''
+
+HOURLY_QUERY = f'''
+    SELECT ts, open, high, low, close, volume FROM bar
+    WHERE contract_id = {CONTRACT_ID} AND quote_type = {QUOTE_TYPE_ID} AND ts >= ? AND ts <= ?
+    ORDER BY ts
+'''
+
+
+# Watermarks behind the ETags of the chart endpoints (see conditional.py)
+CONTRACT_WATERMARK = f'SELECT latest FROM bar_status WHERE contract_id = {CONTRACT_ID} AND quote_type = {QUOTE_TYPE_ID}'
+
+EXPIRATION_WATERMARK = f'''
+    SELECT MAX(s.latest), COUNT(*) FROM contract c JOIN bar_status s ON s.contract_id = c.id
+    WHERE c.symbol = ? AND c.expiration = ? AND s.quote_type = {QUOTE_TYPE_ID}
+'''
+
+
+def contract_watermark(conn, symbol, expiration, strike, right, quote_type='TRADES'):
+    """Latest stored bar (ts) of one contract, None if unknown or on a v1 database."""
+    try:
+        row = conn.execute(CONTRACT_WATERMARK, (symbol, expiration, float(strike), right, quote_type)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+def expiration_watermark(conn, symbol, expiration, quote_type='TRADES'):
+    """(latest bar ts, contract count) over an expiration, None if unknown or on a v1 database."""
+    try:
+        latest, count = conn.execute(EXPIRATION_WATERMARK, (symbol, expiration, quote_type)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return (latest, count) if count else None
+
+
+def parse_bound(value, end_of_day=False):
+    """'YYYY-MM-DD[ HH:MM:SS]' of an ISO date or datetime; a bare end date means its last second."""
+    moment = datetime.datetime.fromisoformat(value)  # ValueError on anything else
+    if len(value) > 10:
+        return moment.strftime('%Y-%m-%d %H:%M:%S')
+    return moment.strftime('%Y-%m-%d 23:59:59' if end_of_day else '%Y-%m-%d')
+
+
+def date_bounds(start, end):
+    """Inclusive 'YYYY-MM-DD[ HH:MM:SS]' bounds; missing ends are open. Raises ValueError on a malformed date."""
+    return parse_bound(start or '1970-01-01'), parse_bound(end or '2200-12-31', end_of_day=True)
+
+
+def bar_query(symbol, expiration, strike, right, start=None, end=None, resolution='daily', quote_type='TRADES'):
+    """(sql, params) of one contract's bars in the range, oldest first."""
+    start, end = date_bounds(start, end)
+    if resolution == 'hourly':
+        return HOURLY_QUERY, (symbol, expiration, float(strike), right, quote_type, to_epoch(start), to_epoch(end))
+    return DAILY_QUERY, (symbol, expiration, float(strike), right, quote_type, start[:10], end[:10])
+
+
+def count_bars(conn, sql, params):
+    return conn.execute(f'SELECT COUNT(*) FROM ({sql})', params).fetchone()[0]
+
+
+def should_stream(count, max_points=None):
+    """Large and not going to be downsampled."""
+    return count > STREAM_THRESHOLD and (not max_points or max_points <= 0 or count <= max_points)
+
+
+def load_daily(conn, symbol, expiration, strike, right, start=None, end=None, quote_type='TRADES'):
+    sql, params = bar_query(symbol, expiration, strike, right, start, end, 'daily', quote_type)
+    df = pd.read_sql_query(sql, conn, params=params)
+    df['date'] = pd.to_datetime(df['date'])
+    return df
+
+
+def load_hourly(conn, symbol, expiration, strike, right, start=None, end=None, quote_type='TRADES'):
+    sql, params = bar_query(symbol, expiration, strike, right, start, end, 'hourly', quote_type)
+    df = pd.read_sql_query(sql, conn, params=params)
+    df['date'] = pd.to_datetime(df.pop('ts'), unit='s')
+    return df[['date', 'open', 'high', 'low', 'close', 'volume']]
+
+
+def clip_range(df, start=None, end=None):
+    """The same inclusive range on an already loaded frame (used for archived bars)."""
+    start, end = date_bounds(start, end)
+    return df[(df['date'] >= pd.Timestamp(start)) & (df['date'] <= pd.Timestamp(end))].reset_index(drop=True)
+
+
+def downsample_ohlc(df, max_points):
+    """At most max_points bars, each merging a run of consecutive bars; dated at the run's first bar."""
+    n = len(df)
+    if not max_points or max_points <= 0 or n <= max_points:
+        return df
+    starts = np.unique((np.arange(max_points) * n) // max_points)
+    ends = np.append(starts[1:], n) - 1
+    result = {
+        'date': df['date'].to_numpy()[starts],
+        'open': df['open'].to_numpy(dtype=float)[starts],
+        'high': np.maximum.reduceat(df['high'].to_numpy(dtype=float), starts),
+        'low': np.minimum.reduceat(df['low'].to_numpy(dtype=float), starts),
+        'close': df['close'].to_numpy(dtype=float)[ends],
+    }
+    if 'volume' in df:
+        result['volume'] = np.add.reduceat(df['volume'].fillna(0).to_numpy(), starts)
+    return pd.DataFrame(result)
+
+
+def _records(df):
+    dates = df['date'].dt.strftime('%Y-%m-%dT%H:%M:%S').tolist()
+    # NaN is not valid JSON
+    columns = [[None if value != value else value for value in df[name].astype(float).tolist()]
+               for name in ('open', 'high', 'low', 'close')]
+    for date, open_, high, low, close in zip(dates, *columns):
+        yield {'date': date, 'open': open_, 'high': high, 'low': low, 'close': close}
+
+
+def json_response(df):
+    """An in-memory frame of bars as a JSON list of {date, open, high, low, close}."""
+    return Response(json.dumps(list(_records(df))), mimetype='application/json')
+
+
+def _row_record(row, resolution):
+    # Same shape as _records(): hourly ts is epoch seconds of wall-clock time, daily date is 'YYYY-MM-DD'
+    when, open_, high, low, close = row[:5]
+    if resolution == 'hourly':
+        date = datetime.datetime.fromtimestamp(when, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+    else:
+        date = f'{str(when)[:10]}T00:00:00'
+    open_, high, low, close = (None if value is None else float(value) for value in (open_, high, low, close))
+    return {'date': date, 'open': open_, 'high': high, 'low': low, 'close': close}
+
+
+def stream_response(db_path, sql, params, resolution='daily'):
+    """bar_query() rows read from a cursor CHUNK_ROWS at a time and sent as one chunked JSON list."""
+    def generate():
+        # Its own connection: the request's is closed by the time the body is sent
+        conn = sqlite3.connect(db_path)
+        try:
+            cursor = conn.execute(sql, params)
+            yield '['
+            first = True
+            while True:
+                rows = cursor.fetchmany(CHUNK_ROWS)
+                if not rows:
+                    break
+                chunk = json.dumps([_row_record(row, resolution) for row in rows])[1:-1]
+                yield chunk if first else ',' + chunk
+                first = False
+            yield ']'
+        finally:
+            conn.close()
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+BATCH_COLUMNS = ['date', 'open', 'high', 'low', 'close', 'volume']
+
+# Daily close of the underlying, the last hourly bar of each day
+UNDERLYING_QUERY = '''
+    SELECT day, close FROM (
+        SELECT DATE(date) AS day, close, ROW_NUMBER() OVER (PARTITION BY DATE(date) ORDER BY date DESC) AS latest
+        FROM vix_data WHERE symbol = ? AND date >= ? AND date <= ?
+    )
+    WHERE latest = 1 ORDER BY day
+'''
+
+
+def load_daily_batch(conn, contracts=None, symbol=None, expiration=None, min_strike=None, max_strike=None,
+                     right=None, start=None, end=None, quote_type='TRADES'):
+    """Daily bars of many contracts in one query on the daily_option key.
+
+    Either an explicit list of (symbol, expiration, strike, right) or a
+    symbol/expiration with an optional strike range and right.
+    """
+    start, end = date_bounds(start, end)
+    select = 'SELECT d.symbol, d.expiration, d.strike, d.right, d.date, d.open, d.high, d.low, d.close, d.volume'
+    if contracts:
+        wanted = ', '.join(['(?, ?, ?, ?)'] * len(contracts))
+        sql = f'''
+            WITH wanted (symbol, expiration, strike, right) AS (VALUES {wanted})
+            {select} FROM wanted w JOIN daily_option d
+              ON d.symbol = w.symbol AND d.expiration = w.expiration AND d.strike = w.strike AND d.right = w.right
+            WHERE d.quote_type = ? AND d.date >= ? AND d.date <= ?
+            ORDER BY d.strike, d.right, d.date
+        '''
+        params = [value for contract in contracts for value in contract] + [quote_type, start[:10], end[:10]]
+    else:
+        sql = f'''
+            {select} FROM daily_option d
+            WHERE d.symbol = ? AND d.expiration = ? AND d.strike >= ? AND d.strike <= ?
+              AND d.quote_type = ? AND d.date >= ? AND d.date <= ? {'AND d.right = ?' if right else ''}
+            ORDER BY d.strike, d.right, d.date
+        '''
+        params = [symbol, expiration, float(min_strike) if min_strike is not None else 0.0,
+                  float(max_strike) if max_strike is not None else 1e9, quote_type, start[:10], end[:10]]
+        if right:
+            params.append(right)
+    df = pd.read_sql_query(sql, conn, params=params)
+    df['date'] = pd.to_datetime(df['date'])
+    df['strike'] = df['strike'].astype(float)
+    return df
+
+
+def load_underlying(conn, symbol, start=None, end=None):
+    start, end = date_bounds(start, end)
+    return pd.read_sql_query(UNDERLYING_QUERY, conn, params=(symbol, start, end))
+
+
+def _column(values):
+    return [None if value != value else value for value in values]
+
+
+def columnar(df, max_points=None):
+    """One entry per contract with a list per column, each series downsampled to max_points."""
+    series = []
+    for (symbol, expiration, strike, right), bars in df.groupby(['symbol', 'expiration', 'strike', 'right'], sort=False):
+        bars = downsample_ohlc(bars.reset_index(drop=True), max_points)
+        entry = {'symbol': symbol, 'expiration': expiration, 'strike': strike, 'right': right,
+                 'date': bars['date'].dt.strftime('%Y-%m-%dT%H:%M:%S').tolist()}
+        for name in BATCH_COLUMNS[1:]:
+            entry[name] = _column(bars[name].astype(float).tolist())
+        series.append(entry)
+    return series
@@ -1,9 +1,19 @@
 from ib_insync import *
+import argparse
 import concurrent.futures
 import time
 import asyncio
 import nest_asyncio
 import sys
+from db_writer import DBWriter
+from bar_store import CONTRACT_UPSERT
+from tick_ring import TickRing, CREATE_QUOTE_SNAPSHOT, QUOTE_SNAPSHOT_INSERT, DEFAULT_CAPACITY, ticker_values
+from watermarks import normalize_expiration
+from market_data_scheduler import MarketDataLineScheduler, chain_priority
+from ib_pool import IBPool, POOL_SIZE
+
+FLUSH_INTERVAL = 5  # seconds between quote_snapshot flushes in capture mode
+MAX_LINES = 100  # market data lines of a default IB account
 
 # Apply nest_asyncio to allow nested use of asyncio
 nest_asyncio.apply()
@@ -11,11 +21,11 @@ nest_asyncio.apply()
 # Connect to IBKR API
 ib = IB()
 
-def attempt_connection(max_attempts=3, delay=5):
+def attempt_connection(max_attempts=3, delay=5, port=7496):
     for attempt in range(max_attempts):
         try:
             print(f"Attempting to connect (attempt {attempt + 1}/{max_attempts})...")
-            ib.connect('127.0.0.1', 7496, clientId=1, timeout=30)
+            ib.connect('127.0.0.1', port, clientId=1, timeout=30)
             print("Successfully connected to IB")
             return True
         except Exception as e:
@@ -27,55 +37,66 @@ def attempt_connection(max_attempts=3, delay=5):
                 print("All connection attempts failed.")
                 return False
 
-if not attempt_connection():
-    print("Please check that IB Gateway or TWS is running and properly configured.")
-    print("Ensure that API connections are enabled and that the port (7496) is correct.")
-    sys.exit(1)
-
-# Define the VIX Index
-vix_index = Index(symbol='VIX', exchange='CBOE')
-ib.qualifyContracts(vix_index)
-
-# Retrieve option parameters for VIX
-opt_params = ib.reqSecDefOptParams(
-    underlyingSymbol=vix_index.symbol,
-    futFopExchange='',
-    underlyingSecType=vix_index.secType,
-    underlyingConId=vix_index.conId
-)
-
-# Collect all expiration dates and strike prices
-expirations = set()
-strikes = set()
-
-for param in opt_params:
-    expirations.update(param.expirations)
-    strikes.update(param.strikes)
-
-# Convert strikes to sorted list for consistency
-strikes = [s for s in sorted(strikes) if 15 == s]
-
-# Prepare option contracts for all combinations
-contracts = []
-rights = ['C']  # Call and Put options
-
-for expiration in expirations:
-    for strike in strikes:
-        for right in rights:
-            contract = Option(
-                symbol='VIX',
-                lastTradeDateOrContractMonth=expiration,
-                strike=strike,
-                right=right,
-                exchange='CBOE',
-                currency='USD'
-            )
-            contracts.append(contract)
+def option_params():
+    # Define the VIX Index
+    vix_index = Index(symbol='VIX', exchange='CBOE')
+    ib.qualifyContracts(vix_index)
+
+    # Retrieve option parameters for VIX
+    opt_params = ib.reqSecDefOptParams(
+        underlyingSymbol=vix_index.symbol,
+        futFopExchange='',
+        underlyingSecType=vix_index.secType,
+        underlyingConId=vix_index.conId
+    )
+
+    # Collect all expiration dates and strike prices
+    expirations = set()
+    strikes = set()
+
+    for param in opt_params:
+        expirations.update(param.expirations)
+        strikes.update(param.strikes)
+    return vix_index, expirations, strikes
+
+def snapshot_contracts(expirations, strikes):
+    # Convert strikes to sorted list for consistency
+    strikes = [s for s in sorted(strikes) if 15 == s]
+
+    # Prepare option contracts for all combinations
+    contracts = []
+    rights = ['C']  # Call and Put options
+
+    for expiration in expirations:
+        for strike in strikes:
+            for right in rights:
+                contract = Option(
+                    symbol='VIX',
+                    lastTradeDateOrContractMonth=expiration,
+                    strike=strike,
+                    right=right,
+                    exchange='CBOE',
+                    currency='USD'
+                )
+                contracts.append(contract)
+                break
             break
-        break
 
-# Qualify contracts (resolve any ambiguities)
-qualified_contracts = ib.qualifyContracts(*contracts)
+    # Qualify contracts (resolve any ambiguities)
+    return ib.qualifyContracts(*contracts)
+
+def chain_contracts(expirations, strikes, min_strike, max_strike):
+    return [Option('VIX', expiration, strike, right, exchange='CBOE', currency='USD')
+            for expiration in sorted(expirations)
+            for strike in sorted(strikes) if min_strike <= strike <= max_strike
+            for right in ('C', 'P')]
+
+def capture_contracts(expirations, strikes, min_strike, max_strike, max_lines):
+    # Nearest expirations first, both rights, until the market data lines are used up
+    contracts = chain_contracts(expirations, strikes, min_strike, max_strike)
+    qualified = [c for c in ib.qualifyContracts(*contracts[:max_lines]) if c.conId]
+    print(f"Capturing {len(qualified)} of {len(contracts)} contracts ({max_lines} lines)")
+    return qualified
 
 # Function to request market data for a contract
 def request_market_data(contract):
@@ -110,39 +131,156 @@ def request_market_data(contract):
         # Close the event loop
         loop.close()
 
-# Limit the number of threads to avoid exceeding rate limits
-max_workers = 50  # Adjust this number based on your rate limit
-
-# Use ThreadPoolExecutor for multi-threading
-results = []
-with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-    # Submit tasks
-    futures = {executor.submit(request_market_data, contract): contract for contract in qualified_contracts}
-    # Collect results as they complete
-    for future in concurrent.futures.as_completed(futures):
-        result = future.result()
-        if result:
-            results.append(result)
-        # Introduce delay to comply with rate limits
-        time.sleep(0.1)  # Adjust as needed
-
-# Disconnect from IBKR API
-ib.disconnect()
-
-# Process or save the collected data as needed
-# For example, save to a CSV file
-import pandas as pd
-
-df = pd.DataFrame([{
-    'Symbol': res['contract'].localSymbol,
-    'Expiration': res['contract'].lastTradeDateOrContractMonth,
-    'Strike': res['contract'].strike,
-    'Right': res['contract'].right,
-    'LastPrice': res['last_price'],
-    'BidPrice': res['bid_price'],
-    'AskPrice': res['ask_price'],
-    'ImpliedVolatility': res['implied_volatility']
-} for res in results])
-
-df.to_csv('vix_options_data.csv', index=False)
-print("Data saved to vix_options_data.csv")
+def snapshot(qualified_contracts):
+    # Limit the number of threads to avoid exceeding rate limits
+    max_workers = 50  # Adjust this number based on your rate limit
+
+    # Use ThreadPoolExecutor for multi-threading
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Submit tasks
+        futures = {executor.submit(request_market_data, contract): contract for contract in qualified_contracts}
+        # Collect results as they complete
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            if result:
+                results.append(result)
+            # Introduce delay to comply with rate limits
+            time.sleep(0.1)  # Adjust as needed
+
+    # Process or save the collected data as needed
+    # For example, save to a CSV file
+    import pandas as pd
+
+    df = pd.DataFrame([{
+        'Symbol': res['contract'].localSymbol,
+        'Expiration': res['contract'].lastTradeDateOrContractMonth,
+        'Strike': res['contract'].strike,
+        'Right': res['contract'].right,
+        'LastPrice': res['last_price'],
+        'BidPrice': res['bid_price'],
+        'AskPrice': res['ask_price'],
+        'ImpliedVolatility': res['implied_volatility']
+    } for res in results])
+
+    df.to_csv('vix_options_data.csv', index=False)
+    print("Data saved to vix_options_data.csv")
+
+def flush_ring(ring, writer):
+    rows = ring.compact()
+    writer.write(QUOTE_SNAPSHOT_INSERT, rows)
+    print(f"Flushed {len(rows)} quote snapshots ({ring.overwritten} ticks overwritten so far)")
+
+def capture(contracts, db_path='options.db', flush_interval=FLUSH_INTERVAL, capacity=DEFAULT_CAPACITY, duration=0):
+    # Streaming subscriptions stay open; ticks land in the ring and are flushed every flush_interval
+    keys, ring = capture_ring(contracts, capacity)
+    index = {c.conId: i for i, c in enumerate(contracts)}
+
+    def on_pending_tickers(tickers):
+        now = time.time()
+        for ticker in tickers:
+            i = index.get(ticker.contract.conId)
+            if i is not None:
+                ring.record(i, ticker_values(ticker, now))
+
+    with DBWriter(db_path) as writer:
+        writer.execute(CREATE_QUOTE_SNAPSHOT)
+        writer.write(CONTRACT_UPSERT, [(c.conId, *key) for c, key in zip(contracts, keys)])
+        ib.pendingTickersEvent += on_pending_tickers
+        for contract in contracts:
+            ib.reqMktData(contract, '', False, False)
+        started = time.monotonic()
+        try:
+            while not duration or time.monotonic() - started < duration:
+                ib.sleep(flush_interval)
+                flush_ring(ring, writer)
+        except KeyboardInterrupt:
+            print("Capture stopped.")
+        finally:
+            for contract in contracts:
+                ib.cancelMktData(contract)
+            ib.pendingTickersEvent -= on_pending_tickers
+            flush_ring(ring, writer)
+    return ring
+
+def capture_ring(contracts, capacity):
+    keys = [(c.symbol, normalize_expiration(c.lastTradeDateOrContractMonth), float(c.strike), c.right)
+            for c in contracts]
+    return keys, TickRing(keys, capacity)
+
+def rotate(vix_index, expirations, strikes, min_strike, max_strike, db_path='options.db', max_lines=MAX_LINES,
+           cycles=None, clients=1):
+    # The whole chain in the strike band, quoted by snapshot within the line budget, best contracts first;
+    # with several clients the snapshots and qualification are spread over a pool of connections
+    source = IBPool.around(ib, clients).connect() if clients > 1 else ib
+    scheduler = MarketDataLineScheduler(source, max_lines=max_lines)
+    spot = ib.run(scheduler.snapshot(vix_index))
+    spot = spot.marketPrice() if spot is not None else (min_strike + max_strike) / 2
+    contracts = [c for c in source.qualifyContracts(*chain_contracts(expirations, strikes, min_strike, max_strike))
+                 if c.conId]
+    contracts = chain_priority(contracts, spot)
+    print(f"Rotating {len(contracts)} contracts around VIX {spot:.2f} through {max_lines} lines")
+
+    keys, ring = capture_ring(contracts, capacity=1)
+
+    def on_cycle(tickers, seconds):
+        now = time.time()
+        for i, ticker in enumerate(tickers):
+            if ticker is not None:
+                ring.record(i, ticker_values(ticker, now))
+        flush_ring(ring, writer)
+        median_age, max_age = scheduler.staleness(contracts)
+        print(f"Quote age: median {median_age:.1f}s, max {max_age:.1f}s; {scheduler.stats()}")
+
+    with DBWriter(db_path) as writer:
+        writer.execute(CREATE_QUOTE_SNAPSHOT)
+        writer.write(CONTRACT_UPSERT, [(c.conId, *key) for c, key in zip(contracts, keys)])
+        try:
+            ib.run(scheduler.rotate(contracts, cycles, on_cycle))
+        except KeyboardInterrupt:
+            print("Rotation stopped.")
+        finally:
+            if source is not ib:
+                print(f"IB pool: {source.stats()}")
+                source.disconnect()
+    return scheduler
+
+def main():
+    parser = argparse.ArgumentParser(description='Current VIX option quotes: a one-off CSV snapshot or a streaming capture')
+    parser.add_argument('--port', type=int, default=7496)
+    parser.add_argument('--capture', action='store_true', help='keep subscriptions open and flush to quote_snapshot')
+    parser.add_argument('--rotate', action='store_true',
+                        help='snapshot the whole chain in priority order within --max-lines, flushing each pass')
+    parser.add_argument('--cycles', type=int, default=None, help='full-chain passes for --rotate, default until interrupted')
+    parser.add_argument('--db', default='options.db')
+    parser.add_argument('--flush-interval', type=float, default=FLUSH_INTERVAL)
+    parser.add_argument('--capacity', type=int, default=DEFAULT_CAPACITY, help='ring rows per contract')
+    parser.add_argument('--duration', type=float, default=0, help='seconds to capture, 0 until interrupted')
+    parser.add_argument('--min-strike', type=float, default=10)
+    parser.add_argument('--max-strike', type=float, default=40)
+    parser.add_argument('--max-lines', type=int, default=MAX_LINES)
+    parser.add_argument('--clients', type=int, default=POOL_SIZE,
+                        help='IB connections (clientIds from 1) sharing the work of --rotate')
+    args = parser.parse_args()
+
+    if not attempt_connection(port=args.port):
+        print("Please check that IB Gateway or TWS is running and properly configured.")
+        print(f"Ensure that API connections are enabled and that the port ({args.port}) is correct.")
+        sys.exit(1)
+
+    try:
+        vix_index, expirations, strikes = option_params()
+        if args.rotate:
+            rotate(vix_index, expirations, strikes, args.min_strike, args.max_strike, args.db, args.max_lines, args.cycles,
+                   args.clients)
+        elif args.capture:
+            contracts = capture_contracts(expirations, strikes, args.min_strike, args.max_strike, args.max_lines)
+            capture(contracts, args.db, args.flush_interval, args.capacity, args.duration)
+        else:
+            snapshot(snapshot_contracts(expirations, strikes))
+    finally:
+        # Disconnect from IBKR API
+        ib.disconnect()
+
+if __name__ == "__main__":
+    main()
@@ -8,99 +8,54 @@ import sqlite3
 import sys
 import time
 from get_vix import main as get_vix_main
+from request_scheduler import HistoricalRequestScheduler
+from ingestion_pipeline import run_pipeline
+from watermarks import WatermarkIndex
+from db_writer import DBWriter, connect
+from bar_store import queue_bars
+from daily_rollup import ensure_table, queue_rollup
+from contract_cache import QualificationCache
+from strike_universe import StrikeUniverse, TierProgress, option_spec
+from ib_pool import IBPool, POOL_SIZE
 import traceback  # Add this import at the top of your file
 
 STRIKE_PRICE_LIMIT = 100
+MAX_IN_FLIGHT = 50
+REQUEST_TIMEOUT = 20  # seconds before a historical request counts as a straggler
+MAX_ATTEMPTS = 3
+STORE_BATCH_SIZE = 50
 
-# Create a global SQLite connection and cursor
-conn = sqlite3.connect('options.db')
-cursor = conn.cursor()
-
-def store_option_data(df: pd.DataFrame) -> None:
+def store_option_data(df: pd.DataFrame, watermarks: WatermarkIndex, writer: DBWriter) -> None:
     try:
         if df is not None and not df.empty:
-            # Convert DataFrame to list of tuples for SQLite insertion
-            data_to_insert = df.to_records(index=False).tolist()
-            
-            # Store the data in SQLite
-            cursor.executemany('''
-                INSERT OR REPLACE INTO option_data (symbol, expiration, strike, right, date, open, high, low, close, volume, average, barCount, quote_type)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', data_to_insert)
-            
-            latest = df['date'].max()
-        else:
-            latest = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        
-        conn.commit()
-        if df is not None and not df.empty:
-            print(f"Data stored in SQLite. Row count: {len(df)}")
+            # Hand the bars and their contract rows to the writer thread
+            queue_bars(writer, df)
+            queue_rollup(writer, df)
+            print(f"Data queued for SQLite. Row count: {len(df)}")
 
-    except Exception as e:
-        print(f"store_option_data: An error occurred while storing data: {str(e)}")
+        # Queued after the bars, so watermarks never commit ahead of the data they cover
+        print(f"Updated {watermarks.flush(writer)} quote_status rows")
 
-def get_days_back(symbol: str, expiration: str, strike: float, right: str, quote_type: str) -> int:
-    try:
-        expiration_date = datetime.datetime.strptime(expiration, '%Y%m%d').date().isoformat()
-        
-        cursor.execute('''
-            SELECT latest FROM quote_status
-            WHERE symbol = ? AND expiration = ? AND strike = ? AND right = ? AND quote_type = ?
-        ''', (symbol, expiration_date, strike, right, quote_type))
-        
-        result = cursor.fetchone()
-                
-        if result:
-            latest = datetime.datetime.strptime(result[0], '%Y-%m-%d %H:%M:%S').replace(tzinfo=pytz.timezone('US/Eastern'))
-            current_date = datetime.datetime.now(pytz.timezone('US/Eastern'))
-            # Check if current time is before 9:30 AM
-            if current_date.time() < datetime.time(9, 30):
-                current_date = current_date.replace(hour=16, minute=0, second=0, microsecond=0) - datetime.timedelta(days=1)
-            # Check if current time is after 4:00 PM
-            elif current_date.time() > datetime.time(16, 0):
-                current_date = current_date.replace(hour=16, minute=0, second=0, microsecond=0)
-            # Round down to the nearest hour between 10:00 AM and 4:00 PM
-            elif current_date.time() > datetime.time(10, 0):
-                current_date = current_date.replace(minute=0, second=0, microsecond=0)
-            # Set to 9:30 AM if between 9:30 AM and 10:00 AM
-            else:
-                current_date = current_date.replace(hour=9, minute=30, second=0, microsecond=0)
-            
-            # If latest is more recent than or equal to the adjusted current date, return 0
-            if latest >= current_date:
-                return 0
-            
-            days_back = 0
-            while latest.date() < current_date.date():
-                if latest.weekday() < 5:  # Monday = 0, Friday = 4
-                    days_back += 1
-                latest += datetime.timedelta(days=1)
-            
-            return max(days_back, 1)  # Ensure we always request at least one day of data if there's a gap
-        else:
-            print('No previous data')
-            return 30  # Default to 30 days if no previous data exists
-    
     except Exception as e:
-        print(f"get_days_back: An error occurred while getting days_back: {str(e)}")
-        return 30  # Default to 30 days if there's an error
+        print(f"store_option_data: An error occurred while storing data: {str(e)}")
 
-async def get_option_data(ib: IB, contract: Option, whatToShow: str) -> pd.DataFrame:
+async def get_option_data(ib: IB, contract: Option, whatToShow: str, scheduler: HistoricalRequestScheduler,
+                          watermarks: WatermarkIndex, timeout: float = REQUEST_TIMEOUT) -> pd.DataFrame:
     print('get_option_data', contract)
     symbol = contract.symbol
     expiration = contract.lastTradeDateOrContractMonth
     strike = contract.strike
     exchange = contract.exchange
     right = contract.right
-    days_back = get_days_back(symbol, expiration, strike, right, whatToShow)
+    days_back = watermarks.days_back(symbol, expiration, strike, right, whatToShow)
     print(f"Days back: {days_back}")
     if days_back == 0:
         print(f"No new data to retrieve for {symbol} {exchange} {expiration} {strike} {right}. Data is up to date.")
         return None
 
     try:
-        option = Option(symbol, expiration, strike, right, exchange=exchange, currency='USD')
-        ib.qualifyContracts(option)
+        # Qualified up front by get_quotes (from the cache where possible)
+        option = contract
 
         end_datetime = datetime.datetime.now(pytz.timezone('US/Eastern')).replace(second=0, microsecond=0)
         if end_datetime.time() < datetime.time(9, 30):
@@ -116,19 +71,22 @@ async def get_option_data(ib: IB, contract: Option, whatToShow: str) -> pd.DataF
         start_datetime = start_datetime.replace(hour=9, minute=30)
 
         print('contract:', option)
-        bars = await ib.reqHistoricalDataAsync(
+        bars = await scheduler.submit(
             option,
             endDateTime=end_datetime,
             durationStr=f'{days_back} D',
             barSizeSetting='1 hour',
             whatToShow=whatToShow,
             useRTH=True,
-            timeout=60
+            timeout=timeout
         )
 
         df = util.df(bars)
+        if df is None:
+            # No bars in the window; the contract still counts as checked
+            return pd.DataFrame()
 
-        if df is not None:
+        if not df.empty:
             df['date'] = pd.to_datetime(df['date'], utc=True).dt.tz_convert('US/Eastern')
             df = df[(df['date'] >= start_datetime) & (df['date'] <= end_datetime)]
             
@@ -144,16 +102,18 @@ async def get_option_data(ib: IB, contract: Option, whatToShow: str) -> pd.DataF
             df['strike'] = strike
             df['right'] = right
             df['quote_type'] = whatToShow
+            df['conId'] = option.conId
             
             df['date'] = df['date'].dt.strftime('%Y-%m-%d %H:%M:%S')
             
-            df = df[['symbol', 'expiration', 'strike', 'right', 'date', 'open', 'high', 'low', 'close', 'volume', 'average', 'barCount', 'quote_type']]
+            df = df[['symbol', 'expiration', 'strike', 'right', 'date', 'open', 'high', 'low', 'close', 'volume', 'average', 'barCount', 'quote_type', 'conId']]
             print('number of row:', len(df), contract)    
         return df
 
     except Exception as e:
+        # Let the pipeline put the contract on its retry queue
         print(f"get_option_data: An error occurred: {str(e)}")
-        return None
+        raise
 
 
 def get_option_chain(ib: IB, symbol: str) -> list:
@@ -166,54 +126,101 @@ def get_option_chain(ib: IB, symbol: str) -> list:
     print('filtering chains')
     return chains
 
-async def get_quotes(ib: IB, option_chains: list) -> None:
+async def get_quotes(ib: IB, option_chains: list = None) -> None:
     print('get_quotes')
     symbol = 'VIX'
     rights = ['P', 'C']
     exchanges = ['SMART', 'CBOE']   
     whatToShow = 'TRADES'
 
-    print('processing option chains')
-    contracts = []
-    for chain in option_chains:
-        for expiration in chain.expirations:
-            for strike in chain.strikes:
-                if strike <= STRIKE_PRICE_LIMIT:
-                    for right in rights:
-                        contract = Option(
-                            symbol=symbol,
-                            lastTradeDateOrContractMonth=expiration,
-                            strike=strike,
-                            right=right,
-                            exchange=chain.exchange,
-                            currency='USD')
-                        contracts.append(contract)
+    scheduler = HistoricalRequestScheduler(ib)
+    conn = connect('options.db')
+    ensure_table(conn)
+    watermarks = WatermarkIndex.load(conn)
+    qualifier = QualificationCache.load(conn)
+    universe = StrikeUniverse.load(conn)
+    conn.close()
+
+    # Without explicit chains, today's qualified chain stands in for reqSecDefOptParams and the cross product
+    specs = qualifier.chain_specs(symbol) if option_chains is None else None
+    if specs is not None:
+        print(f'using the chain definition cached today: {len(specs)} contracts')
+        contracts = [Option(symbol, expiration, strike, right, exchange=exchange, currency='USD')
+                     for expiration, strike, right, exchange in specs]
+    else:
+        option_chains = option_chains if option_chains is not None else get_option_chain(ib, symbol)
+        print('processing option chains')
+        contracts = []
+        for chain in option_chains:
+            for expiration in chain.expirations:
+                for strike in chain.strikes:
+                    if strike <= STRIKE_PRICE_LIMIT:
+                        for right in rights:
+                            contract = Option(
+                                symbol=symbol,
+                                lastTradeDateOrContractMonth=expiration,
+                                strike=strike,
+                                right=right,
+                                exchange=chain.exchange,
+                                currency='USD')
+                            contracts.append(contract)
 
     print('number of contracts:', len(contracts))
-    qualified_contracts = ib.qualifyContracts(*contracts)
+    qualified_contracts = await qualifier.qualify_async(ib, contracts)
     print('number of quantified contracts:', len(qualified_contracts))
-        
-    for i in range(0, len(qualified_contracts), 50):
-        try:
-            tasks = [get_option_data(ib, contract, whatToShow) for contract in qualified_contracts[i:min(i+50, len(qualified_contracts))]]    
-            results = await asyncio.gather(*tasks)
-
-            # Check if results contain any valid DataFrames
-            valid_results = [df for df in results if df is not None]
-            if valid_results:
-                merged_df = pd.concat(valid_results, ignore_index=True)
-                # Store the merged DataFrame
-                store_option_data(merged_df)
-            else:
-                print("No valid results to merge. Skipping concatenation.")
-        except Exception as e:  # Fixed exception variable name
-            print("get_quotes:", str(e))
+    if specs is None:
+        qualifier.mark_chain(symbol, {chain.exchange for chain in option_chains})
+    # Strikes near VIX that trade every run, the rest of the chain every few days
+    qualified_contracts = universe.select(qualified_contracts, watermarks)
+    print('number of contracts to request:', len(qualified_contracts))
+    # Front month at the money first, so the contracts the dashboard shows are fresh first
+    qualified_contracts, tiers = universe.prioritize(qualified_contracts)
+
+    writer = DBWriter('options.db')
+    writer.start()
+    results = []
+
+    def flush_results():
+        merged_df = pd.concat(results, ignore_index=True) if results else None
+        store_option_data(merged_df, watermarks, writer)
+        results.clear()
+
+    progress = TierProgress(map(option_spec, qualified_contracts), tiers, writer, before_complete=flush_results)
+
+    def on_result(contract, df):
+        # df is None when the contract was already up to date
+        if df is not None:
+            # Store results as they arrive, a batch of contracts per transaction
+            watermarks.record(contract.symbol, contract.lastTradeDateOrContractMonth, contract.strike,
+                              contract.right, whatToShow, df)
+            if not df.empty:
+                results.append(df)
+            if len(results) >= STORE_BATCH_SIZE:
+                flush_results()
+                print(f"Scheduler queue depth: {scheduler.queue_depth()}, stats: {scheduler.stats()}")
+        progress.done(option_spec(contract))
+
+    try:
+        report = await run_pipeline(
+            qualified_contracts,
+            lambda contract: get_option_data(ib, contract, whatToShow, scheduler, watermarks),
+            on_result,
+            concurrency=MAX_IN_FLIGHT,
+            max_attempts=MAX_ATTEMPTS,
+            describe=lambda contract: contract.localSymbol or str(contract),
+            on_failure=lambda contract, error: progress.done(option_spec(contract), failed=True))
+        flush_results()
+    finally:
+        writer.close()
+    print(report.summary())
+    print(f"Scheduler stats: {scheduler.stats()}")
 
 # Example usage
 if __name__ == "__main__":
     nest_asyncio.apply()
     symbol = 'VIX'
     ib = IB()
+    pool = None
     
     try:
         # Attempt to connect to port 7497
@@ -228,17 +235,17 @@ if __name__ == "__main__":
             time.sleep(1)
             print('Connected to IB on port 7497')
 
-        # Call the main function from get_vix.py
+        # Call the main function from get_vix.py (ib_insync, so on its own connection)
         get_vix_main()
-        print('getting option chains')
-        option_chains = get_option_chain(ib, symbol)
-
-        asyncio.run(get_quotes(ib, option_chains))
+        # Qualification and historical requests spread over POOL_SIZE clientIds under one pacing budget
+        pool = IBPool.around(ib, POOL_SIZE).connect()
+        # The option chain is requested only when today's cached definition is missing
+        asyncio.run(get_quotes(pool))
+        print(f"IB pool: {pool.stats()}")
 
     except Exception as e:
         print(f"main: An error occurred: {str(e)}")
         traceback.print_exc()  # This will print the traceback of the exception
     finally:
-        conn.close()  # Close the connection when done
-        ib.disconnect()
+        (pool or ib).disconnect()
         print("IB connection closed.")
\ No newline at end of file
@@ -0,0 +1,41 @@
+"""
+Conditional GET for the read endpoints.
+
+Each endpoint tags its response with the watermark of the data behind it
+(bar_status.latest of a contract or expiration, the newest vix_data row,
+the smile snapshot time) hashed together with the request's arguments. A
+request whose If-None-Match carries that tag gets a 304 before any of the
+payload is queried or built, so pollers only pay for a watermark lookup
+until a new bar lands.
+"""
+import hashlib
+
+from flask import Response, make_response, request
+
+
+def make_etag(*watermark):
+    """Tag for this request's path and arguments at the given watermark; None if there is no watermark."""
+    if not watermark or all(part is None for part in watermark):
+        return None
+    key = repr((request.path, sorted(request.args.items(multi=True)), watermark))
+    return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+
+def not_modified(etag):
+    """A 304 response when the client already has etag, else None."""
+    if etag is None or not request.if_none_match.contains_weak(etag):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def tagged(response, etag):
+    """response (anything a view may return) with the ETag attached; errors are left untagged."""
+    response = make_response(response)
+    if etag is not None and response.status_code == 200:
+        response.set_etag(etag)
+        # Revalidate every time instead of trusting a heuristic freshness lifetime
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
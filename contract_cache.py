@@ -0,0 +1,175 @@
+"""
+On-disk cache of qualified option contracts.
+
+qualifyContracts is one reqContractDetails round-trip per contract, and
+every ingestion run used to repeat it for the whole chain. The answers are
+kept in the qualified_contract table of options.db, keyed by the spec the
+scripts build (symbol, expiration, strike, right, exchange), so a repeat
+run fills conId/localSymbol/tradingClass from the table and only asks IB
+about contracts it has never seen. Rows of expired options are deleted
+when the cache is loaded.
+
+The same rows are the chain definition: after a run has expanded
+reqSecDefOptParams into contracts and qualified them, mark_chain() records
+the day in chain_definition, and until the next day chain_specs() hands
+later runs just the (expiration, strike, right, exchange) combinations IB
+knew, with no index qualification, reqSecDefOptParams or contract details
+requests at all.
+
+    cache = QualificationCache.load(conn)
+    qualified = cache.qualify(ib, contracts)   # misses are qualified in one batch
+    specs = cache.chain_specs('VIX')           # None when the chain must be rediscovered
+"""
+import datetime
+import time
+
+from db_writer import connect
+
+# Kept in step with create_table.sql
+CREATE_TABLE = '''
+    CREATE TABLE IF NOT EXISTS qualified_contract (
+        symbol VARCHAR(10) NOT NULL,
+        expiration CHAR(8) NOT NULL,
+        strike REAL NOT NULL,
+        right CHAR(1) NOT NULL,
+        exchange VARCHAR(10) NOT NULL,
+        conId INTEGER NOT NULL,
+        localSymbol TEXT,
+        tradingClass TEXT,
+        multiplier TEXT,
+        qualified INTEGER NOT NULL,
+        PRIMARY KEY (symbol, expiration, strike, right, exchange)
+    ) WITHOUT ROWID
+'''
+
+CREATE_CHAIN_TABLE = '''
+    CREATE TABLE IF NOT EXISTS chain_definition (
+        symbol VARCHAR(10) NOT NULL,
+        exchange VARCHAR(10) NOT NULL,
+        discovered INTEGER NOT NULL,
+        contracts INTEGER NOT NULL,
+        PRIMARY KEY (symbol, exchange)
+    ) WITHOUT ROWID
+'''
+
+CACHE_INSERT = 'INSERT OR REPLACE INTO qualified_contract VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+CHAIN_INSERT = 'INSERT OR REPLACE INTO chain_definition VALUES (?, ?, ?, ?)'
+
+
+def contract_spec(contract):
+    # IB answers with YYYYMMDD; the scripts sometimes build YYYY-MM-DD
+    return (contract.symbol, contract.lastTradeDateOrContractMonth.replace('-', ''), float(contract.strike),
+            contract.right, contract.exchange)
+
+
+class QualificationCache:
+    def __init__(self, rows=(), db_path='options.db', chains=()):
+        self.db_path = db_path
+        # spec -> (conId, localSymbol, tradingClass, multiplier)
+        self.entries = {tuple(row[:5]): tuple(row[5:9]) for row in rows}
+        # (symbol, exchange) -> epoch seconds the chain was last expanded and qualified
+        self.chains = {(symbol, exchange): discovered for symbol, exchange, discovered, _ in chains}
+        self.counters = {'hits': 0, 'misses': 0, 'qualified': 0, 'unknown': 0}
+
+    @classmethod
+    def load(cls, conn, db_path='options.db', today=None):
+        """Entries of unexpired contracts, deleting the expired ones first."""
+        today = (today or datetime.date.today()).strftime('%Y%m%d')
+        conn.execute(CREATE_TABLE)
+        conn.execute(CREATE_CHAIN_TABLE)
+        evicted = conn.execute('DELETE FROM qualified_contract WHERE expiration < ?', (today,)).rowcount
+        conn.commit()
+        rows = conn.execute('SELECT * FROM qualified_contract').fetchall()
+        chains = conn.execute('SELECT * FROM chain_definition').fetchall()
+        print(f"Loaded {len(rows)} qualified contracts, evicted {evicted} expired")
+        return cls(rows, db_path, chains)
+
+    def lookup(self, contract):
+        """Fill contract in place from the cache; True on a hit."""
+        entry = self.entries.get(contract_spec(contract))
+        if entry is None:
+            return False
+        contract.conId, contract.localSymbol, contract.tradingClass, contract.multiplier = entry
+        contract.lastTradeDateOrContractMonth = contract.lastTradeDateOrContractMonth.replace('-', '')
+        return True
+
+    def split(self, contracts):
+        """(filled from the cache, still to qualify)."""
+        hits, misses = [], []
+        for contract in contracts:
+            (hits if self.lookup(contract) else misses).append(contract)
+        self.counters['hits'] += len(hits)
+        self.counters['misses'] += len(misses)
+        return hits, misses
+
+    def store(self, specs, qualified):
+        """Remember contracts IB just qualified under the specs they were asked for."""
+        now = int(time.time())
+        rows = []
+        for spec, contract in zip(specs, qualified):
+            if not contract.conId:
+                self.counters['unknown'] += 1
+                continue
+            self.entries[spec] = (contract.conId, contract.localSymbol, contract.tradingClass, contract.multiplier)
+            rows.append((*spec, *self.entries[spec], now))
+        self.counters['qualified'] += len(rows)
+        if rows:
+            conn = connect(self.db_path)
+            try:
+                with conn:
+                    conn.executemany(CACHE_INSERT, rows)
+            finally:
+                conn.close()
+
+    def _result(self, contracts):
+        print(f"Qualification cache: {self.counters}")
+        return [contract for contract in contracts if contract.conId]
+
+    def qualify(self, ib, contracts):
+        """Qualified contracts in input order: cached ones without a round-trip, the rest in one batch."""
+        hits, misses = self.split(contracts)
+        if misses:
+            # Specs first: qualification may rewrite the exchange
+            specs = [contract_spec(contract) for contract in misses]
+            ib.qualifyContracts(*misses)
+            self.store(specs, misses)
+        return self._result(contracts)
+
+    async def qualify_async(self, ib, contracts):
+        hits, misses = self.split(contracts)
+        if misses:
+            specs = [contract_spec(contract) for contract in misses]
+            await ib.qualifyContractsAsync(*misses)
+            self.store(specs, misses)
+        return self._result(contracts)
+
+    def chain_specs(self, symbol, exchanges=None, today=None):
+        """Qualified (expiration, strike, right, exchange) of symbol if its chain was discovered today, else None.
+
+        exchanges limits the answer to those exchanges (all of them must be
+        fresh); by default every exchange recorded for the symbol.
+        """
+        today = today or datetime.date.today()
+        recorded = {exchange: discovered for (chain_symbol, exchange), discovered in self.chains.items()
+                    if chain_symbol == symbol}
+        exchanges = set(exchanges) if exchanges is not None else set(recorded)
+        if not exchanges or any(exchange not in recorded or datetime.date.fromtimestamp(recorded[exchange]) != today
+                                for exchange in exchanges):
+            return None
+        return sorted(spec[1:] for spec in self.entries
+                      if spec[0] == symbol and spec[4] in exchanges)
+
+    def mark_chain(self, symbol, exchanges):
+        """Record that the chain of symbol on these exchanges was just expanded and qualified."""
+        now = int(time.time())
+        rows = []
+        for exchange in exchanges:
+            self.chains[symbol, exchange] = now
+            contracts = sum(1 for spec in self.entries if spec[0] == symbol and spec[4] == exchange)
+            rows.append((symbol, exchange, now, contracts))
+        conn = connect(self.db_path)
+        try:
+            with conn:
+                conn.executemany(CHAIN_INSERT, rows)
+        finally:
+            conn.close()
@@ -1,30 +1,53 @@
-CREATE TABLE option_data (
-    quote_type VARCHAR(10),
-    symbol VARCHAR(10),
-    expiration DATE,
-    strike DECIMAL(10, 2),
-    right CHAR(1),
-    date DATETIME,
-    open DECIMAL(10, 2),
-    high DECIMAL(10, 2),
-    low DECIMAL(10, 2),
-    close DECIMAL(10, 2),
-    volume INTEGER,
-    average DECIMAL(10, 2),
-    barCount INTEGER,
-    PRIMARY KEY (quote_type,symbol, expiration, strike, right, date)
+-- Schema v2 (see bar_store.py): contracts are stored once, bars reference them
+-- by id and store ts as epoch seconds of the US/Eastern bar time
+CREATE TABLE contract (
+    id INTEGER PRIMARY KEY,
+    conId INTEGER UNIQUE,
+    symbol VARCHAR(10) NOT NULL,
+    expiration DATE NOT NULL,
+    strike REAL NOT NULL,
+    right CHAR(1) NOT NULL,
+    UNIQUE (symbol, expiration, strike, right)
 );
 
-CREATE TABLE quote_status (
-    quote_type VARCHAR(10),
-    symbol VARCHAR(10),
-    expiration DATE,
-    strike DECIMAL(10, 2),
-    right CHAR(1),
-    latest DATETIME,
-    PRIMARY KEY (quote_type, symbol, expiration, strike, right)
+CREATE TABLE quote_type (
+    id INTEGER PRIMARY KEY,
+    name VARCHAR(10) NOT NULL UNIQUE
 );
 
+INSERT INTO quote_type (name) VALUES ('TRADES'), ('MIDPOINT'), ('BID'), ('ASK'), ('BID_ASK');
+
+CREATE TABLE bar (
+    contract_id INTEGER NOT NULL REFERENCES contract (id),
+    quote_type INTEGER NOT NULL REFERENCES quote_type (id),
+    ts INTEGER NOT NULL,
+    open REAL,
+    high REAL,
+    low REAL,
+    close REAL,
+    volume INTEGER,
+    average REAL,
+    barCount INTEGER,
+    PRIMARY KEY (contract_id, quote_type, ts)
+) WITHOUT ROWID;
+
+CREATE TABLE bar_status (
+    contract_id INTEGER NOT NULL REFERENCES contract (id),
+    quote_type INTEGER NOT NULL REFERENCES quote_type (id),
+    latest INTEGER NOT NULL,
+    PRIMARY KEY (contract_id, quote_type)
+) WITHOUT ROWID;
+
+-- The v1 option_data / quote_status layout, read-only
+CREATE VIEW option_data AS
+SELECT q.name AS quote_type, c.symbol, c.expiration, c.strike, c.right, datetime(b.ts, 'unixepoch') AS date,
+    b.open, b.high, b.low, b.close, b.volume, b.average, b.barCount
+FROM bar b JOIN contract c ON c.id = b.contract_id JOIN quote_type q ON q.id = b.quote_type;
+
+CREATE VIEW quote_status AS
+SELECT q.name AS quote_type, c.symbol, c.expiration, c.strike, c.right, datetime(s.latest, 'unixepoch') AS latest
+FROM bar_status s JOIN contract c ON c.id = s.contract_id JOIN quote_type q ON q.id = s.quote_type;
+
 CREATE TABLE IF NOT EXISTS vix_data (
                 symbol TEXT,
                 date TEXT,
@@ -38,22 +61,92 @@ CREATE TABLE IF NOT EXISTS vix_data (
                 PRIMARY KEY (symbol, date)
 );
 
-CREATE VIEW daily_option AS
-SELECT 
-    quote_type,
-    symbol,
-    expiration,
-    strike,
-    right,
-    DATE(MAX(date)) AS date,  -- Date of the last hour
-    FIRST_VALUE(open) OVER (PARTITION BY quote_type, symbol, expiration, strike, right, DATE(date) ORDER BY date) AS open,  -- Open of the first hour
-    MAX(high) AS high,  -- Maximum high of all hours
-    MIN(low) AS low,
-    LAST_VALUE(close) OVER (PARTITION BY quote_type, symbol, expiration, strike, right, DATE(date) ORDER BY date ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING) AS close,  -- Close of the last hour
-    SUM(volume) AS volume  -- Sum of volume of all hours    
-FROM 
-    option_data
-WHERE quote_type = 'TRADES'	
-GROUP BY 
-    quote_type, symbol, expiration, strike, right, DATE(date);
+-- Daily rollup of TRADES bars, maintained by ingestion (see daily_rollup.py)
+CREATE TABLE daily_option (
+    quote_type VARCHAR(10),
+    symbol VARCHAR(10),
+    expiration DATE,
+    strike DECIMAL(10, 2),
+    right CHAR(1),
+    date DATE,
+    open DECIMAL(10, 2),
+    high DECIMAL(10, 2),
+    low DECIMAL(10, 2),
+    close DECIMAL(10, 2),
+    volume INTEGER,
+    PRIMARY KEY (symbol, expiration, strike, right, quote_type, date)
+);
+
+CREATE INDEX idx_daily_option_chain ON daily_option (symbol, expiration, quote_type, date);
+
+-- Smile snapshots written by smile.fetch_option_data (see smile_store.py)
+CREATE TABLE smile_snapshot (
+    id INTEGER PRIMARY KEY,
+    symbol VARCHAR(10) NOT NULL,
+    fetched INTEGER NOT NULL,
+    failed TEXT
+);
+
+CREATE INDEX idx_smile_snapshot_symbol ON smile_snapshot (symbol, fetched);
+
+CREATE TABLE smile_quote (
+    snapshot_id INTEGER NOT NULL REFERENCES smile_snapshot (id),
+    expiration DATE NOT NULL,
+    right CHAR(1) NOT NULL,
+    strike REAL NOT NULL,
+    iv REAL,
+    last_trade INTEGER,
+    PRIMARY KEY (snapshot_id, expiration, right, strike)
+) WITHOUT ROWID;
+
+-- Generation counter bumped by DBWriter on every committed batch (see db_writer.py)
+CREATE TABLE ingest_meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+
+-- Streaming quotes compacted from tick_ring.TickRing by concurrent_get_current_quotes.py --capture
+CREATE TABLE quote_snapshot (
+    contract_id INTEGER NOT NULL REFERENCES contract (id),
+    ts INTEGER NOT NULL,
+    bid REAL,
+    ask REAL,
+    last REAL,
+    bid_size REAL,
+    ask_size REAL,
+    last_size REAL,
+    iv REAL,
+    delta REAL,
+    gamma REAL,
+    vega REAL,
+    theta REAL,
+    und_price REAL,
+    ticks INTEGER NOT NULL,
+    last_high REAL,
+    last_low REAL,
+    PRIMARY KEY (contract_id, ts)
+) WITHOUT ROWID;
+
+-- Contracts qualified by IB, reused by later ingestion runs (see contract_cache.py)
+CREATE TABLE qualified_contract (
+    symbol VARCHAR(10) NOT NULL,
+    expiration CHAR(8) NOT NULL,
+    strike REAL NOT NULL,
+    right CHAR(1) NOT NULL,
+    exchange VARCHAR(10) NOT NULL,
+    conId INTEGER NOT NULL,
+    localSymbol TEXT,
+    tradingClass TEXT,
+    multiplier TEXT,
+    qualified INTEGER NOT NULL,
+    PRIMARY KEY (symbol, expiration, strike, right, exchange)
+) WITHOUT ROWID;
 
+-- Day each option chain was last expanded and qualified; the contracts are in qualified_contract
+CREATE TABLE chain_definition (
+    symbol VARCHAR(10) NOT NULL,
+    exchange VARCHAR(10) NOT NULL,
+    discovered INTEGER NOT NULL,
+    contracts INTEGER NOT NULL,
+    PRIMARY KEY (symbol, exchange)
+) WITHOUT ROWID;
@@ -0,0 +1,124 @@
+"""
+Maintains the daily_option rollup table from hourly TRADES bars.
+
+daily_option used to be a view that re-aggregated all of option_data on
+every query. It is now a real table; ingestion re-aggregates only the
+(contract, day) buckets it just wrote, in the same writer transaction as
+the bars. For backfills, or to migrate a database that still has the view:
+
+    python daily_rollup.py --rebuild
+"""
+import argparse
+import time
+
+from bar_store import CONTRACT_ID, QUOTE_TYPE_ID, ensure_schema, to_epoch
+from db_writer import BUMP_GENERATION, CREATE_INGEST_META, connect
+
+CREATE_DAILY_OPTION = '''
+    CREATE TABLE IF NOT EXISTS daily_option (
+        quote_type VARCHAR(10),
+        symbol VARCHAR(10),
+        expiration DATE,
+        strike DECIMAL(10, 2),
+        right CHAR(1),
+        date DATE,
+        open DECIMAL(10, 2),
+        high DECIMAL(10, 2),
+        low DECIMAL(10, 2),
+        close DECIMAL(10, 2),
+        volume INTEGER,
+        PRIMARY KEY (symbol, expiration, strike, right, quote_type, date)
+    )
+'''
+
+CREATE_DAILY_OPTION_INDEX = '''
+    CREATE INDEX IF NOT EXISTS idx_daily_option_chain ON daily_option (symbol, expiration, quote_type, date)
+'''
+
+# Daily OHLCV of one contract: open of the first hour, close of the last hour
+ROLLUP_SELECT = '''
+    SELECT q.name, c.symbol, c.expiration, c.strike, c.right, DATE(day * 86400, 'unixepoch'),
+        first_open, MAX(high), MIN(low), last_close, SUM(volume)
+    FROM (
+        SELECT contract_id, quote_type, ts / 86400 AS day, high, low, volume,
+            FIRST_VALUE(open) OVER day_bars AS first_open,
+            LAST_VALUE(close) OVER (day_bars ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING) AS last_close
+        FROM bar
+        WHERE {where}
+        WINDOW day_bars AS (PARTITION BY contract_id, quote_type, ts / 86400 ORDER BY ts)
+    )
+    JOIN contract c ON c.id = contract_id
+    JOIN quote_type q ON q.id = quote_type
+    GROUP BY contract_id, quote_type, day
+'''
+
+ROLLUP_INSERT = '''
+    INSERT OR REPLACE INTO daily_option (quote_type, symbol, expiration, strike, right, date, open, high, low, close, volume)
+'''
+
+# One (contract, day) bucket, a range scan on the bar primary key
+ROLLUP_BUCKET = ROLLUP_INSERT + ROLLUP_SELECT.format(where=f'''
+    contract_id = {CONTRACT_ID} AND quote_type = {QUOTE_TYPE_ID} AND ts >= ? AND ts < ?
+''')
+
+ROLLUP_ALL = ROLLUP_INSERT + ROLLUP_SELECT.format(where="quote_type = (SELECT id FROM quote_type WHERE name = 'TRADES')")
+
+
+def touched_buckets(df):
+    """(symbol, expiration, strike, right, quote_type, day start, next day start) for every TRADES bucket in df."""
+    if df is None or df.empty:
+        return []
+    trades = df[df['quote_type'] == 'TRADES']
+    days = (to_epoch(trades['date']) // 86400).tolist()
+    buckets = set(zip(trades['symbol'], trades['expiration'], trades['strike'].astype(float),
+                      trades['right'], trades['quote_type'], days))
+    return [(*bucket[:-1], bucket[-1] * 86400, (bucket[-1] + 1) * 86400) for bucket in sorted(buckets)]
+
+
+def queue_rollup(writer, df):
+    """Re-aggregate the buckets touched by df, after its bars on the same writer."""
+    buckets = touched_buckets(df)
+    writer.write(ROLLUP_BUCKET, buckets)
+    return len(buckets)
+
+
+def ensure_table(conn):
+    """Create daily_option if it is missing or still the old view, backfilling it from bar."""
+    ensure_schema(conn)
+    kind = conn.execute("SELECT type FROM sqlite_master WHERE name = 'daily_option'").fetchone()
+    if kind and kind[0] == 'table':
+        return
+    if kind:
+        print("Replacing daily_option view with a table")
+        conn.execute('DROP VIEW daily_option')
+    conn.execute(CREATE_DAILY_OPTION)
+    conn.execute(CREATE_DAILY_OPTION_INDEX)
+    conn.execute(ROLLUP_ALL)
+    conn.commit()
+
+
+def rebuild(db_path='options.db'):
+    conn = connect(db_path)
+    try:
+        started = time.perf_counter()
+        ensure_table(conn)
+        with conn:
+            conn.execute('DELETE FROM daily_option')
+            rows = conn.execute(ROLLUP_ALL).rowcount
+            # Like a DBWriter commit, so generation-keyed caches and the live feed see the new rollup
+            conn.execute(CREATE_INGEST_META)
+            conn.execute(BUMP_GENERATION)
+        print(f"Rebuilt daily_option: {rows} rows in {time.perf_counter() - started:.1f}s")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Maintain the daily_option rollup table')
+    parser.add_argument('--rebuild', action='store_true', help='recompute daily_option from all stored bars')
+    parser.add_argument('--db', default='options.db')
+    args = parser.parse_args()
+    if args.rebuild:
+        rebuild(args.db)
+    else:
+        parser.print_help()
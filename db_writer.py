@@ -0,0 +1,148 @@
+"""
+Single background writer for options.db.
+
+Ingestion code hands statements to DBWriter instead of opening its own
+connections; one thread owns the only write connection, runs the database
+in WAL mode (so the Flask app can keep reading while we write) and groups
+queued work into large transactions, committing every `max_rows` rows or
+`max_delay` seconds, whichever comes first. When the queue is full the
+producer blocks and the event is counted as backpressure.
+
+    with DBWriter('options.db') as writer:
+        writer.write('INSERT OR REPLACE INTO bar ...', rows)
+"""
+import queue
+import sqlite3
+import threading
+import time
+
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',  # durable at checkpoints, safe with WAL
+    'PRAGMA cache_size=-65536',  # 64 MB page cache
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA busy_timeout=10000',
+)
+
+# Bumped in every transaction that wrote something, so readers (the index
+# page catalog) can tell whether anything changed with one primary key read
+CREATE_INGEST_META = 'CREATE TABLE IF NOT EXISTS ingest_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)'
+BUMP_GENERATION = '''
+    INSERT INTO ingest_meta (key, value) VALUES ('generation', 1)
+    ON CONFLICT (key) DO UPDATE SET value = value + 1
+'''
+
+# Called with no arguments after every commit (e.g. to wake live_feed.LiveFeed)
+commit_listeners = []
+
+_STOP = object()
+
+
+def connect(db_path='options.db'):
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class DBWriter(threading.Thread):
+    def __init__(self, db_path='options.db', max_rows=20000, max_delay=2.0, queue_size=200):
+        super().__init__(name='DBWriter', daemon=True)
+        self.db_path = db_path
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stats = {'transactions': 0, 'rows': 0, 'statements': 0, 'errors': 0,
+                      'backpressure': 0, 'backpressure_seconds': 0.0, 'max_queue_depth': 0}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _put(self, item):
+        depth = self.queue.qsize()
+        self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], depth + 1)
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.stats['backpressure'] += 1
+            print(f"DBWriter: queue full ({self.queue.maxsize} batches), waiting for the writer")
+            started = time.perf_counter()
+            self.queue.put(item)
+            self.stats['backpressure_seconds'] += time.perf_counter() - started
+
+    def write(self, sql, rows):
+        """Queue an executemany; rows are committed with the next transaction."""
+        if rows:
+            self._put((sql, rows, True))
+
+    def execute(self, sql, params=()):
+        """Queue a single statement, ordered with the writes around it."""
+        self._put((sql, params, False))
+
+    def flush(self):
+        """Block until everything queued so far is committed."""
+        done = threading.Event()
+        self._put(done)
+        done.wait()
+
+    def close(self):
+        if self.is_alive():
+            self._put(_STOP)
+            self.join()
+        print(f"DBWriter stats: {self.stats}")
+
+    def run(self):
+        conn = connect(self.db_path)
+        conn.execute(CREATE_INGEST_META)
+        conn.commit()
+        pending_rows = 0
+        batch_started = None
+        try:
+            while True:
+                timeout = None if batch_started is None else max(batch_started + self.max_delay - time.monotonic(), 0)
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+                if item is None or item is _STOP or isinstance(item, threading.Event):
+                    if batch_started is not None:
+                        self._commit(conn, pending_rows)
+                        pending_rows, batch_started = 0, None
+                    if item is _STOP:
+                        break
+                    if item is not None:
+                        item.set()
+                    continue
+
+                sql, params, many = item
+                try:
+                    if many:
+                        conn.executemany(sql, params)
+                        pending_rows += len(params)
+                    else:
+                        conn.execute(sql, params)
+                    self.stats['statements'] += 1
+                except sqlite3.Error as e:
+                    # A failed statement is rolled back on its own; keep the rest of the batch
+                    self.stats['errors'] += 1
+                    print(f"DBWriter: An error occurred while writing: {str(e)}")
+                if batch_started is None:
+                    batch_started = time.monotonic()
+                if pending_rows >= self.max_rows:
+                    self._commit(conn, pending_rows)
+                    pending_rows, batch_started = 0, None
+        finally:
+            conn.close()
+
+    def _commit(self, conn, rows):
+        conn.execute(BUMP_GENERATION)
+        conn.commit()
+        self.stats['transactions'] += 1
+        self.stats['rows'] += rows
+        for listener in commit_listeners:
+            listener()
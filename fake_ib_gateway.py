@@ -0,0 +1,607 @@
+"""
+Local stand-in for TWS / IB Gateway.
+
+Speaks enough of the IB API socket protocol for the ingestion scripts
+(get_quotes.py, concurrent_get_quotes.py, get_vix.py,
+concurrent_get_current_quotes.py) to run unmodified against it:
+handshake/startApi, the account sync requests ib_insync sends on connect,
+reqContractDetails (qualifyContracts), reqSecDefOptParams,
+reqHistoricalData and reqMktData.
+
+The served VIX chain is either synthetic or replayed from an existing
+options.db, and every reply can be delayed, turned into a pacing
+violation (error 162 / 420) or dropped entirely to simulate a hung request.
+With --max-lines, market data requests beyond that many open lines (shared
+by every connection, as IB counts them per account) get error 101.
+
+    python fake_ib_gateway.py --ports 7496 7497 --latency 0.05 --hang-rate 0.01
+"""
+import argparse
+import asyncio
+import datetime
+import math
+import random
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from collections import defaultdict, deque
+
+import pytz
+
+SERVER_VERSION = 176
+ACCOUNT = 'DU0000000'
+VIX_CONID = 13455763
+EASTERN = pytz.timezone('US/Eastern')
+
+# Start times of the 1 hour RTH bars IB returns for CBOE index options
+BAR_TIMES = [datetime.time(9, 30)] + [datetime.time(h, 0) for h in range(10, 16)]
+
+# Tick types used for market data replies
+TICK_BID_SIZE, TICK_BID, TICK_ASK, TICK_ASK_SIZE, TICK_LAST, TICK_LAST_SIZE = 0, 1, 2, 3, 4, 5
+TICK_MODEL_OPTION = 13
+
+
+def synthetic_expirations(count, today=None):
+    # VIX options expire on Wednesdays; the third Wednesday of the month
+    # is the standard (VIX) class, the others are weeklies (VIXW)
+    today = today or datetime.date.today()
+    day = today + datetime.timedelta(days=(2 - today.weekday()) % 7)
+    expirations = []
+    while len(expirations) < count:
+        expirations.append(day.strftime('%Y%m%d'))
+        day += datetime.timedelta(days=7)
+    return expirations
+
+
+def synthetic_strikes(index):
+    # Near expirations list every strike, later ones only the coarse grid
+    strikes = [float(s) for s in range(10, 30)]
+    strikes += [30 + 2.5 * i for i in range(8)]
+    strikes += [float(s) for s in range(50, 101, 5)]
+    if index >= 4:
+        strikes = [s for s in strikes if s < 20 or s % 5 == 0 or (s < 30 and s % 2 == 0)]
+    return strikes
+
+
+def trading_class(expiration):
+    day = datetime.datetime.strptime(expiration, '%Y%m%d').date()
+    return 'VIX' if 15 <= day.day <= 21 else 'VIXW'
+
+
+def contract_id(expiration, strike, right):
+    # Stable across runs so caches keyed by conId stay valid
+    return 100000000 + zlib.crc32(f'{expiration}|{strike:g}|{right}'.encode()) % 800000000
+
+
+def local_symbol(expiration, strike, right):
+    return f'VIX   {expiration[2:]}{right}{int(round(strike * 1000)):08d}'
+
+
+class SyntheticChain:
+    """A VIX option chain generated on the fly with deterministic prices."""
+
+    def __init__(self, num_expirations=8, vix_level=18.0, seed=0):
+        self.vix_level = vix_level
+        self.seed = seed
+        self.contracts = {}  # (expiration, strike, right) -> conId
+        for index, expiration in enumerate(synthetic_expirations(num_expirations)):
+            for strike in synthetic_strikes(index):
+                for right in ('C', 'P'):
+                    self.contracts[(expiration, strike, right)] = contract_id(expiration, strike, right)
+        self.by_conid = {conid: spec for spec, conid in self.contracts.items()}
+
+    def expirations(self):
+        return sorted({spec[0] for spec in self.contracts})
+
+    def underlying(self, ts):
+        # Smooth mean-reverting looking path with a few days period
+        return self.vix_level + 3.0 * math.sin(ts / (86400 * 3.0)) + 1.0 * math.sin(ts / 7919.0)
+
+    def option_price(self, spec, ts, spot):
+        expiration, strike, right = spec
+        expiry = EASTERN.localize(datetime.datetime.strptime(expiration, '%Y%m%d').replace(hour=9, minute=30))
+        years = max((expiry.timestamp() - ts) / (365 * 86400.0), 1.0 / 365)
+        intrinsic = max(spot - strike, 0.0) if right == 'C' else max(strike - spot, 0.0)
+        time_value = 0.9 * spot * math.sqrt(years) * math.exp(-abs(math.log(strike / spot)) * 2.5)
+        return round(max(intrinsic + time_value, 0.05), 2)
+
+    def bar(self, conid, ts):
+        rng = random.Random(hash((self.seed, conid, int(ts))))
+        spot = self.underlying(ts)
+        if conid == VIX_CONID:
+            price, volume = round(spot, 2), 0
+        else:
+            spec = self.by_conid[conid]
+            price = self.option_price(spec, ts, spot)
+            moneyness = abs(math.log(spec[1] / spot))
+            volume = int(rng.expovariate(1.0) * 400 * math.exp(-moneyness * 6)) if moneyness < 0.8 else 0
+        high = round(price * (1 + rng.random() * 0.05), 2)
+        low = round(price * (1 - rng.random() * 0.05), 2)
+        open_ = round(rng.uniform(low, high), 2)
+        return (int(ts), open_, high, low, price, volume, price, volume // 10 if volume else 0)
+
+    def bars(self, conid, end, days):
+        return [self.bar(conid, ts) for ts in rth_bar_times(end, days)]
+
+
+class RecordedChain(SyntheticChain):
+    """Replays bars recorded in an options.db produced by the ingesters."""
+
+    def __init__(self, db_path, vix_level=18.0):
+        super().__init__(num_expirations=0, vix_level=vix_level)
+        conn = sqlite3.connect(db_path)
+        try:
+            rows = conn.execute('''
+                SELECT expiration, strike, right, date, open, high, low, close, volume, average, barCount
+                FROM option_data WHERE symbol = 'VIX' AND quote_type = 'TRADES'
+            ''').fetchall()
+            vix_rows = conn.execute('''
+                SELECT date, open, high, low, close, volume, average, barCount FROM vix_data
+            ''').fetchall()
+        finally:
+            conn.close()
+
+        self.recorded = defaultdict(list)  # conId -> sorted bar tuples
+        for expiration, strike, right, date, *values in rows:
+            expiration = expiration.replace('-', '')
+            spec = (expiration, float(strike), right)
+            conid = self.contracts.setdefault(spec, contract_id(*spec))
+            self.recorded[conid].append((parse_db_time(date), *values))
+        for date, *values in vix_rows:
+            self.recorded[VIX_CONID].append((parse_db_time(date), *values))
+        for bars in self.recorded.values():
+            bars.sort()
+        self.by_conid = {conid: spec for spec, conid in self.contracts.items()}
+
+    def bars(self, conid, end, days):
+        times = rth_bar_times(end, days)
+        if not times:
+            return []
+        start, stop = times[0], times[-1]
+        return [bar for bar in self.recorded.get(conid, []) if start <= bar[0] <= stop]
+
+
+def parse_db_time(text):
+    return int(EASTERN.localize(datetime.datetime.strptime(text, '%Y-%m-%d %H:%M:%S')).timestamp())
+
+
+def parse_ib_time(text):
+    # 'YYYYmmdd HH:MM:SS UTC' as produced by ib_insync.util.formatIBDatetime
+    if not text:
+        return time.time()
+    parts = text.replace('-', ' ').split()
+    tz = pytz.timezone(parts[2]) if len(parts) > 2 else EASTERN
+    return tz.localize(datetime.datetime.strptime(parts[0] + parts[1], '%Y%m%d%H:%M:%S')).timestamp()
+
+
+def parse_duration_days(duration):
+    value, unit = duration.split()
+    scale = {'S': 1.0 / 86400, 'D': 1, 'W': 5, 'M': 21, 'Y': 252}[unit]
+    return max(int(math.ceil(int(value) * scale)), 1)
+
+
+def rth_bar_times(end, days):
+    """Epoch start times of the hourly RTH bars of the last `days` sessions before `end`."""
+    end_dt = datetime.datetime.fromtimestamp(end, EASTERN)
+    day = end_dt.date()
+    sessions = []
+    while len(sessions) < days:
+        if day.weekday() < 5:
+            sessions.append(day)
+        day -= datetime.timedelta(days=1)
+    times = []
+    for session in reversed(sessions):
+        for bar_time in BAR_TIMES:
+            ts = EASTERN.localize(datetime.datetime.combine(session, bar_time)).timestamp()
+            if ts < end:
+                times.append(int(ts))
+    return times
+
+
+class Faults:
+    """Injected behaviour applied to every request the gateway answers."""
+
+    def __init__(self, latency=0.0, jitter=0.0, pacing_error_rate=0.0, hang_rate=0.0,
+                 enforce_pacing=False, tick_interval=0.25, seed=None, max_lines=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.pacing_error_rate = pacing_error_rate
+        self.hang_rate = hang_rate
+        self.enforce_pacing = enforce_pacing
+        self.tick_interval = tick_interval
+        self.max_lines = max_lines  # simultaneous market data lines, None for unlimited
+        self.rng = random.Random(seed)
+
+    def delay(self):
+        return max(self.latency + self.rng.uniform(-self.jitter, self.jitter), 0.0)
+
+    def pacing_violation(self):
+        return self.rng.random() < self.pacing_error_rate
+
+    def hang(self):
+        return self.rng.random() < self.hang_rate
+
+
+class HistoricalPacing:
+    """IB's historical data pacing rules, used when Faults.enforce_pacing is set."""
+
+    def __init__(self):
+        self.recent = deque()  # request times in the last 10 minutes
+        self.identical = {}  # request key -> last time
+        self.per_contract = defaultdict(deque)  # conId -> request times in the last 2 seconds
+
+    def violates(self, conid, key, now):
+        while self.recent and now - self.recent[0] > 600:
+            self.recent.popleft()
+        contract_times = self.per_contract[conid]
+        while contract_times and now - contract_times[0] > 2:
+            contract_times.popleft()
+        violation = (
+            len(self.recent) >= 60
+            or now - self.identical.get(key, -math.inf) < 15
+            or len(contract_times) >= 6)
+        self.recent.append(now)
+        self.identical[key] = now
+        contract_times.append(now)
+        return violation
+
+
+class FakeGateway:
+    """Serve a chain on one or more local ports; see module docstring."""
+
+    def __init__(self, chain=None, faults=None, host='127.0.0.1', ports=(7496, 7497)):
+        self.chain = chain or SyntheticChain()
+        self.faults = faults or Faults()
+        self.host = host
+        self.ports = list(ports)
+        self.pacing = HistoricalPacing()
+        self.lines = set()  # (session, reqId) of open market data requests, across connections
+        self.loop = None
+        self.servers = []
+        self._thread = None
+        self._ready = threading.Event()
+        self._error = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {
+            'connections': 0,
+            'requests': defaultdict(int),
+            'historical_contracts': set(),
+            'mktdata_contracts': set(),
+            'bars_served': 0,
+            'pacing_errors': 0,
+            'hung_requests': 0,
+            'line_errors': 0,
+            'max_lines_used': 0,
+        }
+
+    def snapshot(self):
+        stats = dict(self.stats)
+        stats['requests'] = dict(stats['requests'])
+        stats['historical_contracts'] = len(stats['historical_contracts'])
+        stats['mktdata_contracts'] = len(stats['mktdata_contracts'])
+        return stats
+
+    # server lifecycle
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        for port in self.ports:
+            self.servers.append(await asyncio.start_server(self._handle_client, self.host, port))
+        print(f'Fake IB gateway listening on {self.host}:{",".join(map(str, self.ports))}')
+
+    async def serve_forever(self):
+        await self.start()
+        await asyncio.gather(*(server.serve_forever() for server in self.servers))
+
+    def start_in_thread(self):
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_until_complete(self.start())
+            except OSError as e:
+                self._error = e
+                return
+            finally:
+                self._ready.set()
+            loop.run_forever()
+            for server in self.servers:
+                server.close()
+            loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error:
+            raise self._error
+        return self
+
+    def stop(self):
+        if self.loop and self._thread:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=5)
+
+    # protocol
+
+    async def _handle_client(self, reader, writer):
+        session = _Session(self, writer)
+        self.stats['connections'] += 1
+        try:
+            if await reader.readexactly(4) != b'API\0':
+                return
+            await self._read_message(reader)  # 'v157..176 [options]'
+            session.send_raw(str(SERVER_VERSION), datetime.datetime.now().strftime('%Y%m%d %H:%M:%S EST'))
+            while True:
+                fields = await self._read_message(reader)
+                session.dispatch(fields)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            session.close()
+            writer.close()
+
+    @staticmethod
+    async def _read_message(reader):
+        size = struct.unpack('>I', await reader.readexactly(4))[0]
+        payload = await reader.readexactly(size)
+        return payload.decode(errors='backslashreplace').split('\0')[:-1]
+
+
+class _Session:
+    """One client connection: decodes requests and schedules the replies."""
+
+    def __init__(self, gateway, writer):
+        self.gateway = gateway
+        self.faults = gateway.faults
+        self.chain = gateway.chain
+        self.writer = writer
+        self.tasks = {}  # reqId -> pending reply task
+        self.handlers = {
+            1: self.req_mkt_data,
+            2: self.cancel,
+            5: lambda f: self.send(53, 1),  # openOrderEnd
+            6: lambda f: self.send(54, 1, ACCOUNT),  # accountDownloadEnd
+            7: lambda f: self.send(55, 1, f[2]),  # execDetailsEnd
+            9: self.req_contract_details,
+            20: self.req_historical_data,
+            25: self.cancel,
+            49: lambda f: self.send(49, 1, int(time.time())),
+            59: lambda f: None,  # reqMarketDataType
+            61: lambda f: self.send(62, 1),  # positionEnd
+            71: self.start_api,
+            76: lambda f: self.send(74, 1, f[2]),  # accountUpdateMultiEnd
+            78: self.req_sec_def_opt_params,
+            99: lambda f: self.send(102),  # completedOrdersEnd
+        }
+
+    @property
+    def stats(self):
+        return self.gateway.stats
+
+    def send_raw(self, *fields):
+        if self.writer.is_closing():
+            return
+        payload = ''.join(f'{field}\0' for field in fields).encode()
+        self.writer.write(struct.pack('>I', len(payload)) + payload)
+
+    def send(self, *fields):
+        self.send_raw(*('' if field is None else field for field in fields))
+
+    def error(self, req_id, code, message):
+        self.send(4, 2, req_id, code, message, '')
+
+    def dispatch(self, fields):
+        msg_id = int(fields[0])
+        self.stats['requests'][msg_id] += 1
+        handler = self.handlers.get(msg_id)
+        if handler:
+            handler(fields)
+
+    def later(self, req_id, reply, can_hang=True):
+        # Run reply() after the injected latency unless the request hangs
+        if can_hang and self.faults.hang():
+            self.stats['hung_requests'] += 1
+            return
+
+        async def delayed():
+            await asyncio.sleep(self.faults.delay())
+            await reply()
+            self.tasks.pop(req_id, None)
+
+        self.tasks[req_id] = asyncio.ensure_future(delayed())
+
+    def cancel(self, fields):
+        self.gateway.lines.discard((self, int(fields[2])))
+        task = self.tasks.pop(int(fields[2]), None)
+        if task:
+            task.cancel()
+
+    def close(self):
+        for task in self.tasks.values():
+            task.cancel()
+        self.tasks.clear()
+        self.gateway.lines -= {line for line in self.gateway.lines if line[0] is self}
+
+    def start_api(self, fields):
+        self.send(9, 1, 1)  # nextValidId
+        self.send(15, 1, ACCOUNT)  # managedAccounts
+
+    @staticmethod
+    def parse_contract(fields):
+        conid, symbol, sec_type, expiration, strike, right, multiplier, exchange, \
+            primary_exchange, currency, local, trading_class = fields[:12]
+        return {
+            'conId': int(conid or 0), 'symbol': symbol, 'secType': sec_type,
+            'expiration': expiration, 'strike': float(strike or 0), 'right': right[:1],
+            'exchange': exchange, 'currency': currency}
+
+    def resolve(self, contract):
+        if contract['secType'] == 'IND' or contract['conId'] == VIX_CONID:
+            return VIX_CONID if contract['symbol'] in ('VIX', '') else None
+        if contract['conId']:
+            return contract['conId'] if contract['conId'] in self.chain.by_conid else None
+        spec = (contract['expiration'], contract['strike'], contract['right'])
+        return self.chain.contracts.get(spec)
+
+    def req_contract_details(self, fields):
+        req_id = int(fields[2])
+        contract = self.parse_contract(fields[3:15])
+        conid = self.resolve(contract)
+
+        async def reply():
+            if conid is None:
+                self.error(req_id, 200, 'No security definition has been found for the request')
+                return
+            if conid == VIX_CONID:
+                self.send(10, req_id, 'VIX', 'IND', '', 0, '', 'CBOE', 'USD', 'VIX', 'VIX', 'VIX',
+                          VIX_CONID, 0.01, '', '', 'CBOE', 1, 0, 'CBOE Volatility Index', '', '',
+                          '', '', '', 'US/Central', '', '', '', '', 0, 1, '', '', '', '', '',
+                          1, 1, 1)
+            else:
+                expiration, strike, right = self.chain.by_conid[conid]
+                klass = trading_class(expiration)
+                self.send(10, req_id, 'VIX', 'OPT', expiration, strike, right,
+                          contract['exchange'] or 'SMART', 'USD', local_symbol(expiration, strike, right),
+                          klass, klass, conid, 0.01, 100, 'LMT,MKT', 'SMART,CBOE', 1, VIX_CONID,
+                          'CBOE Volatility Index', 'CBOE', expiration[:6], '', '', '', 'US/Central',
+                          '', '', '', '', 0, 1, 'VIX', 'IND', '', expiration, '', 1, 1, 1)
+            self.send(52, 1, req_id)
+
+        # ib_insync waits forever for contract details, so never hang them
+        self.later(req_id, reply, can_hang=False)
+
+    def req_sec_def_opt_params(self, fields):
+        req_id = int(fields[1])
+
+        async def reply():
+            by_class = defaultdict(lambda: (set(), set()))
+            for expiration, strike, _ in self.chain.contracts:
+                expirations, strikes = by_class[trading_class(expiration)]
+                expirations.add(expiration)
+                strikes.add(strike)
+            for exchange in ('SMART', 'CBOE'):
+                for klass, (expirations, strikes) in sorted(by_class.items()):
+                    self.send(75, req_id, exchange, VIX_CONID, klass, 100,
+                              len(expirations), *sorted(expirations),
+                              len(strikes), *sorted(strikes))
+            self.send(76, req_id)
+
+        self.later(req_id, reply, can_hang=False)
+
+    def req_historical_data(self, fields):
+        req_id = int(fields[1])
+        contract = self.parse_contract(fields[2:14])
+        end_text, bar_size, duration, use_rth, what_to_show = fields[15:20]
+        conid = self.resolve(contract)
+        if conid is not None:
+            self.stats['historical_contracts'].add(conid)
+
+        if self.faults.enforce_pacing:
+            key = (conid, end_text, bar_size, duration, what_to_show)
+            if self.gateway.pacing.violates(conid, key, time.time()):
+                self.stats['pacing_errors'] += 1
+                self.error(req_id, 162, 'Historical Market Data Service error message:Pacing violation')
+                return
+        if self.faults.pacing_violation():
+            self.stats['pacing_errors'] += 1
+            self.error(req_id, 162, 'Historical Market Data Service error message:Pacing violation')
+            return
+
+        async def reply():
+            if conid is None:
+                self.error(req_id, 200, 'No security definition has been found for the request')
+                return
+            end = parse_ib_time(end_text)
+            bars = self.chain.bars(conid, end, parse_duration_days(duration))
+            values = [value for bar in bars for value in bar]
+            self.stats['bars_served'] += len(bars)
+            start = bars[0][0] if bars else int(end)
+            self.send(17, req_id, start, int(end), len(bars), *values)
+
+        self.later(req_id, reply)
+
+    def req_mkt_data(self, fields):
+        req_id = int(fields[2])
+        contract = self.parse_contract(fields[3:15])
+        snapshot = fields[17] == '1' if len(fields) > 17 else False
+        conid = self.resolve(contract)
+        if conid is not None:
+            self.stats['mktdata_contracts'].add(conid)
+
+        if self.faults.pacing_violation():
+            self.stats['pacing_errors'] += 1
+            self.error(req_id, 420, 'Invalid Real-time Query:Pacing violation')
+            return
+
+        lines = self.gateway.lines
+        if self.faults.max_lines and len(lines) >= self.faults.max_lines:
+            self.stats['line_errors'] += 1
+            self.error(req_id, 101, 'Max number of tickers has been reached')
+            return
+        lines.add((self, req_id))
+        self.stats['max_lines_used'] = max(self.stats['max_lines_used'], len(lines))
+
+        async def reply():
+            if conid is None:
+                lines.discard((self, req_id))
+                self.error(req_id, 200, 'No security definition has been found for the request')
+                return
+            while True:
+                self.send_ticks(req_id, conid)
+                if snapshot:
+                    # A snapshot frees its line once it has been delivered
+                    lines.discard((self, req_id))
+                    self.send(57, 1, req_id)
+                    return
+                await asyncio.sleep(self.faults.tick_interval)
+
+        self.later(req_id, reply)
+
+    def send_ticks(self, req_id, conid):
+        now = time.time()
+        last = self.chain.bar(conid, now)[4]
+        spot = self.chain.underlying(now)
+        spread = max(round(last * 0.02, 2), 0.05)
+        size = random.randint(1, 50)
+        self.send(1, 6, req_id, TICK_BID, round(max(last - spread, 0.01), 2), size, 0)
+        self.send(1, 6, req_id, TICK_ASK, round(last + spread, 2), size, 0)
+        self.send(1, 6, req_id, TICK_LAST, last, random.randint(1, 10), 0)
+        if conid != VIX_CONID:
+            expiration, strike, right = self.chain.by_conid[conid]
+            iv = 0.6 + 0.4 * abs(math.log(strike / spot))
+            delta = 0.5 if right == 'C' else -0.5
+            self.send(21, req_id, TICK_MODEL_OPTION, 0, round(iv, 4), delta, last, 0,
+                      0.05, 0.02, -0.03, round(spot, 2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake IB gateway for ingestion benchmarks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--ports', type=int, nargs='+', default=[7496, 7497])
+    parser.add_argument('--expirations', type=int, default=8, help='number of synthetic expirations')
+    parser.add_argument('--record-db', help='replay bars from this options.db instead of synthetic data')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every reply')
+    parser.add_argument('--jitter', type=float, default=0.0, help='uniform +/- seconds around the latency')
+    parser.add_argument('--pacing-error-rate', type=float, default=0.0, help='fraction answered with error 162/420')
+    parser.add_argument('--hang-rate', type=float, default=0.0, help='fraction never answered')
+    parser.add_argument('--enforce-pacing', action='store_true', help='apply IB historical pacing rules')
+    parser.add_argument('--max-lines', type=int, default=None, help='simultaneous market data lines (error 101 beyond)')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    chain = RecordedChain(args.record_db) if args.record_db else SyntheticChain(args.expirations)
+    faults = Faults(args.latency, args.jitter, args.pacing_error_rate, args.hang_rate,
+                    args.enforce_pacing, seed=args.seed, max_lines=args.max_lines)
+    gateway = FakeGateway(chain, faults, args.host, args.ports)
+    try:
+        asyncio.run(gateway.serve_forever())
+    except KeyboardInterrupt:
+        print('Fake IB gateway stopped.')
+
+
+if __name__ == '__main__':
+    main()
@@ -7,98 +7,33 @@ import pytz
 import sqlite3
 import sys
 import time
+from request_scheduler import HistoricalRequestScheduler
+from watermarks import WatermarkIndex, normalize_expiration
+from db_writer import DBWriter, connect
+from bar_store import queue_bars
+from daily_rollup import ensure_table, queue_rollup
+from contract_cache import QualificationCache
+from strike_universe import StrikeUniverse, TierProgress
+from ib_pool import IBPool, POOL_SIZE
 
 STRIKE_PRICE_LIMIT = 100
 
-def store_option_data(df, symbol, expiration, strike, right, quote_type):
+def store_option_data(df, symbol, expiration, strike, right, quote_type, watermarks, writer):
     try:
-        expiration_date = datetime.datetime.strptime(expiration, '%Y%m%d').date().isoformat()
-        conn = sqlite3.connect('options.db')
-        cursor = conn.cursor()
-        
         if df is not None and not df.empty:
-            # Convert DataFrame to list of tuples for SQLite insertion
-            data_to_insert = df.to_records(index=False).tolist()
-            
-            # Store the data in SQLite
-            cursor.executemany('''
-                INSERT OR REPLACE INTO option_data (symbol, expiration, strike, right, date, open, high, low, close, volume, average, barCount, quote_type)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', data_to_insert)
-            
-            latest = df['date'].max()
-        else:
-            latest = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        
-        # Update quote_status table
-        cursor.execute('''
-            INSERT OR REPLACE INTO quote_status (symbol, expiration, strike, right, quote_type, latest)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (symbol, expiration_date, strike, right, quote_type, latest))
-        
-        conn.commit()
-        if df is not None and not df.empty:
-            print(f"Data stored in SQLite. Row count: {len(df)}")
+            # Hand the bars and their contract rows to the writer thread
+            queue_bars(writer, df)
+            queue_rollup(writer, df)
+            print(f"Data queued for SQLite. Row count: {len(df)}")
 
-    except Exception as e:
-        print(f"An error occurred while storing data: {str(e)}")
-    finally:
-        conn.close()
+        # quote_status is written in one go by watermarks.flush() at the end of the run
+        watermarks.record(symbol, expiration, strike, right, quote_type, df)
 
-def get_days_back(symbol, expiration, strike, right, quote_type):
-    conn = sqlite3.connect('options.db')
-    cursor = conn.cursor()
-    
-    try:
-        expiration_date = datetime.datetime.strptime(expiration, '%Y%m%d').date().isoformat()
-        
-        cursor.execute('''
-            SELECT latest FROM quote_status
-            WHERE symbol = ? AND expiration = ? AND strike = ? AND right = ? AND quote_type = ?
-        ''', (symbol, expiration_date, strike, right, quote_type))
-        
-        result = cursor.fetchone()
-                
-        if result:
-            latest = datetime.datetime.strptime(result[0], '%Y-%m-%d %H:%M:%S').replace(tzinfo=pytz.timezone('US/Eastern'))
-            current_date = datetime.datetime.now(pytz.timezone('US/Eastern'))
-            # Check if current time is before 9:30 AM
-            if current_date.time() < datetime.time(9, 30):
-                current_date = current_date.replace(hour=16, minute=0, second=0, microsecond=0) - datetime.timedelta(days=1)
-            # Check if current time is after 4:00 PM
-            elif current_date.time() > datetime.time(16, 0):
-                current_date = current_date.replace(hour=16, minute=0, second=0, microsecond=0)
-            # Round down to the nearest hour between 10:00 AM and 4:00 PM
-            elif current_date.time() > datetime.time(10, 0):
-                current_date = current_date.replace(minute=0, second=0, microsecond=0)
-            # Set to 9:30 AM if between 9:30 AM and 10:00 AM
-            else:
-                current_date = current_date.replace(hour=9, minute=30, second=0, microsecond=0)
-            
-            # If latest is more recent than or equal to the adjusted current date, return 0
-            if latest >= current_date:
-                return 0
-            
-            days_back = 0
-            while latest.date() < current_date.date():
-                if latest.weekday() < 5:  # Monday = 0, Friday = 4
-                    days_back += 1
-                latest += datetime.timedelta(days=1)
-            
-            return max(days_back, 1)  # Ensure we always request at least one day of data if there's a gap
-        else:
-            print('No previous data')
-            return 30  # Default to 30 days if no previous data exists
-    
     except Exception as e:
-        print(f"An error occurred while getting days_back: {str(e)}")
-        return 30  # Default to 30 days if there's an error
-    
-    finally:
-        conn.close()
+        print(f"An error occurred while storing data: {str(e)}")
 
-def get_option_data(ib, symbol, exchange, expiration, strike, right, whatToShow):
-    days_back = get_days_back(symbol, expiration, strike, right, whatToShow)
+def get_option_data(ib, symbol, exchange, expiration, strike, right, whatToShow, scheduler, watermarks, qualifier):
+    days_back = watermarks.days_back(symbol, expiration, strike, right, whatToShow)
     print(f"Days back: {days_back}")
     if days_back == 0:
         print(f"No new data to retrieve for {symbol} {exchange} {expiration} {strike} {right}. Data is up to date.")
@@ -106,7 +41,10 @@ def get_option_data(ib, symbol, exchange, expiration, strike, right, whatToShow)
 
     try:
         option = Option(symbol, expiration, strike, right, exchange=exchange, currency='USD')
-        ib.qualifyContracts(option)
+        # Warmed for the whole chain by get_quotes; a miss means IB does not list the contract
+        if not qualifier.lookup(option):
+            print(f"No contract for {symbol} {exchange} {expiration} {strike} {right}")
+            return None
 
         end_datetime = datetime.datetime.now(pytz.timezone('US/Eastern')).replace(second=0, microsecond=0)
         if end_datetime.time() < datetime.time(9, 30):
@@ -121,7 +59,7 @@ def get_option_data(ib, symbol, exchange, expiration, strike, right, whatToShow)
         start_datetime = end_datetime - datetime.timedelta(days=days_back)
         start_datetime = start_datetime.replace(hour=9, minute=30)
 
-        bars = ib.reqHistoricalData(
+        bars = scheduler.request(
             option,
             endDateTime=end_datetime,
             durationStr=f'{days_back} D',
@@ -149,10 +87,11 @@ def get_option_data(ib, symbol, exchange, expiration, strike, right, whatToShow)
             df['strike'] = strike
             df['right'] = right
             df['quote_type'] = whatToShow
+            df['conId'] = option.conId
             
             df['date'] = df['date'].dt.strftime('%Y-%m-%d %H:%M:%S')
             
-            df = df[['symbol', 'expiration', 'strike', 'right', 'date', 'open', 'high', 'low', 'close', 'volume', 'average', 'barCount', 'quote_type']]
+            df = df[['symbol', 'expiration', 'strike', 'right', 'date', 'open', 'high', 'low', 'close', 'volume', 'average', 'barCount', 'quote_type', 'conId']]
             
         return df
 
@@ -181,6 +120,9 @@ def get_quotes():
     STRIKE_PRICE_LIMIT = 100
 
     ib = IB()
+    pool = None
+    watermarks = None
+    writer = None
     
     try:
         # Attempt to connect to port 7497
@@ -195,41 +137,76 @@ def get_quotes():
             time.sleep(1)
             print('Connected to IB on port 7496')
 
-        # Call the main function from get_vix.py
-        get_vix_main()
-        print('getting option chains')
-        option_chains = get_option_chain(ib, symbol)
-
-        total_options = sum(len(chain.expirations) * len(chain.strikes) * len(rights) * len(whatToShowList) * len(exchanges) for chain in option_chains)
+        # Call the main function from get_vix.py on this connection
+        get_vix_main(ib)
+        # More clientIds to qualify the chain in parallel; historical requests share one pacing budget
+        pool = IBPool.around(ib, POOL_SIZE).connect()
+        scheduler = HistoricalRequestScheduler(pool)
+        conn = connect('options.db')
+        ensure_table(conn)
+        watermarks = WatermarkIndex.load(conn)
+        qualifier = QualificationCache.load(conn)
+        universe = StrikeUniverse.load(conn)
+        conn.close()
+        writer = DBWriter('options.db')
+        writer.start()
+
+        # Today's qualified chain, or reqSecDefOptParams expanded and qualified in one batch
+        specs = qualifier.chain_specs(symbol, exchanges)
+        if specs is None:
+            print('getting option chains')
+            option_chains = get_option_chain(ib, symbol)
+            qualifier.qualify(pool, [Option(symbol, expiration, strike, right, exchange=exchange, currency='USD')
+                                     for chain in option_chains
+                                     for expiration in chain.expirations
+                                     for strike in chain.strikes if strike <= STRIKE_PRICE_LIMIT
+                                     for right in rights
+                                     for exchange in exchanges])
+            qualifier.mark_chain(symbol, exchanges)
+            specs = qualifier.chain_specs(symbol, exchanges)
+        else:
+            print(f'using the chain definition cached today: {len(specs)} contracts')
+        # Strikes near VIX that trade every run, the rest of the chain every few days,
+        # front month at the money first
+        option_key = lambda s: (symbol, normalize_expiration(s[0]), float(s[1]), s[2])
+        specs = universe.select(specs, watermarks, quote_type=whatToShowList[0], spec=option_key)
+        specs, tiers = universe.prioritize(specs, spec=option_key)
+        progress = TierProgress(map(option_key, specs), tiers, writer,
+                                before_complete=lambda: watermarks.flush(writer))
+
+        total_options = len(specs) * len(whatToShowList)
         processed_options = 0
         print('processing option chains')
-        for chain in option_chains:
-            for expiration in chain.expirations:
-                for strike in chain.strikes:
-                    if strike <= STRIKE_PRICE_LIMIT:
-                        for right in rights:
-                            for whatToShow in whatToShowList:
-                                for exchange in exchanges:
-                                    try:
-                                        print('-'*40)
-                                        print(f"Processing {symbol} {expiration} {strike} {right} {whatToShow}")
-                                        df = get_option_data(ib, symbol, exchange, expiration, strike, right, whatToShow)
-                                        store_option_data(df, symbol, expiration, strike, right, whatToShow)
-                                        if df is not None and not df.empty:
-                                            print(f"Data stored. Row count: {len(df)}")
-                                        else:
-                                            print("No new data or retrieval failed.")
-                                    except Exception as e:
-                                        print(f"Error processing option: {str(e)}")
-                                    finally:
-                                        processed_options += 1
+        for expiration, strike, right, exchange in specs:
+            failed = False
+            for whatToShow in whatToShowList:
+                try:
+                    print('-'*40)
+                    print(f"Processing {symbol} {expiration} {strike} {right} {whatToShow}")
+                    df = get_option_data(ib, symbol, exchange, expiration, strike, right, whatToShow, scheduler, watermarks, qualifier)
+                    store_option_data(df, symbol, expiration, strike, right, whatToShow, watermarks, writer)
+                    if df is not None and not df.empty:
+                        print(f"Data stored. Row count: {len(df)}")
+                    else:
+                        print("No new data or retrieval failed.")
+                except Exception as e:
+                    print(f"Error processing option: {str(e)}")
+                    failed = True
+                finally:
+                    processed_options += 1
+            progress.done(option_key((expiration, strike, right)), failed=failed)
+
+        print(f"Scheduler stats: {scheduler.stats()}")
                                                                         
                                     
                                     
     except Exception as e:
         print(f"An error occurred: {str(e)}")
     finally:
-        ib.disconnect()
+        if writer is not None:
+            print(f"Updated {watermarks.flush(writer)} quote_status rows")
+            writer.close()
+        (pool or ib).disconnect()
         print("IB connection closed.")
 
 # Example usage
@@ -2,7 +2,7 @@ from ib_insync import *
 import pandas as pd
 from datetime import datetime, timedelta
 import pytz
-import sqlite3
+from db_writer import DBWriter
 
 def get_vix_data(ib):
     vix = Index('VIX', 'CBOE')
@@ -31,17 +31,14 @@ def get_vix_data(ib):
     else:
         return None
 
-def store_vix_data(df):
+def store_vix_data(df, writer):
     if df is None or df.empty:
         print("No VIX data to store.")
         return
 
-    conn = sqlite3.connect('options.db')
-    cursor = conn.cursor()
-
     try:
         # Create table if it doesn't exist
-        cursor.execute('''
+        writer.execute('''
             CREATE TABLE IF NOT EXISTS vix_data (
                 symbol TEXT,
                 date TEXT,
@@ -56,32 +53,39 @@ def store_vix_data(df):
             )
         ''')
 
-        # Insert data
-        df.to_sql('vix_data', conn, if_exists='replace', index=False)
-
-        conn.commit()
+        # Replace the fetched window, keeping older history
+        writer.execute('DELETE FROM vix_data WHERE symbol = ? AND date >= ?', ('VIX', df['date'].min()))
+        columns = ['symbol', 'date', 'open', 'high', 'low', 'close', 'volume', 'average', 'barCount']
+        writer.write(f'''
+            INSERT INTO vix_data ({', '.join(columns)})
+            VALUES ({', '.join('?' * len(columns))})
+        ''', df[columns].to_records(index=False).tolist())
+        writer.flush()
         print(f"VIX data stored successfully. Rows added: {len(df)}")
     except Exception as e:
         print(f"An error occurred while storing VIX data: {str(e)}")
-    finally:
-        conn.close()
 
-def main():
-    ib = IB()
+def main(ib=None):
+    # Callers already connected with ib_insync pass their connection instead of opening clientId 23
+    own = ib is None
+    ib = ib or IB()
     try:
-        ib.connect('127.0.0.1', 7496, clientId=23)
+        if own:
+            ib.connect('127.0.0.1', 7496, clientId=23)
         vix_data = get_vix_data(ib)
         if vix_data is not None:
             # print(vix_data)
-            store_vix_data(vix_data)
+            with DBWriter('options.db') as writer:
+                store_vix_data(vix_data, writer)
             print("VIX quote stored")
         else:
             print("Failed to retrieve VIX data.")
     except Exception as e:
         print(f"An error occurred: {str(e)}")
     finally:
-        ib.disconnect()
-        print("IB connection closed.")
+        if own:
+            ib.disconnect()
+            print("IB connection closed.")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
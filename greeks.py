@@ -0,0 +1,219 @@
+"""
+Vectorized Black-76 implied volatility and Greeks over stored option chains.
+
+VIX options are priced off the VIX future for their expiration, not the
+spot index, so the forward of each (expiration, date) is implied from
+put-call parity at the strike where call and put closes are closest; the
+spot close from vix_data is only used when a date has no call/put pair.
+
+Everything is computed on whole arrays: chain_history() loads the daily
+closes of one expiration, solves IV for every strike, right and date in
+a single safeguarded Newton pass and caches the result per
+(symbol, expiration, ingest_meta generation), so a commit of new or
+rebuilt bars is never answered from an older computation.
+"""
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from chart_data import load_underlying
+from ttl_cache import TTLCache
+
+RISK_FREE_RATE = 0.04
+MIN_VOL, MAX_VOL = 1e-4, 10.0
+EXPIRY_TIME = datetime.time(9, 30)  # VIX options settle on the opening print
+CLOSE_TIME = datetime.time(16, 0)
+CACHE_SIZE = 64  # expiration histories
+TODAY_TTL = 300  # seconds, for histories that include today
+HISTORY_TTL = 3600  # the generation key already catches changes; this bounds databases without one
+
+SQRT_2PI = np.sqrt(2 * np.pi)
+
+CHAIN_QUERY = '''
+    SELECT date, strike, right, close, volume FROM daily_option
+    WHERE symbol = ? AND expiration = ? AND quote_type = 'TRADES' AND close > 0
+'''
+
+# Abramowitz & Stegun 26.2.17, |error| < 7.5e-8; numpy has no erf and scipy is not a dependency
+_CDF_P = 0.2316419
+_CDF_B = (1.330274429, -1.821255978, 1.781477937, -0.356563782, 0.319381530)
+
+
+def _npdf(x):
+    return np.exp(-0.5 * x * x) / SQRT_2PI
+
+
+def ndtr(x):
+    x = np.asarray(x, dtype=float)
+    z = np.abs(x)
+    t = 1.0 / (1.0 + _CDF_P * z)
+    poly = np.zeros_like(t)
+    for b in _CDF_B:
+        poly = (poly + b) * t
+    upper = _npdf(z) * poly
+    return np.where(x >= 0, 1.0 - upper, upper)
+
+
+def _d1_d2(forward, strike, t, sigma):
+    vol_t = sigma * np.sqrt(t)
+    d1 = (np.log(forward / strike) + 0.5 * vol_t * vol_t) / vol_t
+    return d1, d1 - vol_t
+
+
+def black76_price(forward, strike, t, sigma, is_call, rate=RISK_FREE_RATE):
+    d1, d2 = _d1_d2(forward, strike, t, sigma)
+    discount = np.exp(-rate * t)
+    call = discount * (forward * ndtr(d1) - strike * ndtr(d2))
+    put = discount * (strike * ndtr(-d2) - forward * ndtr(-d1))
+    return np.where(is_call, call, put)
+
+
+def black76_vega(forward, strike, t, sigma, rate=RISK_FREE_RATE):
+    d1, _ = _d1_d2(forward, strike, t, sigma)
+    return np.exp(-rate * t) * forward * _npdf(d1) * np.sqrt(t)
+
+
+def implied_vol(price, forward, strike, t, is_call, rate=RISK_FREE_RATE, tol=1e-8, max_iter=50):
+    """Black-76 IV of every element; NaN where the price is outside the no-arbitrage bounds.
+
+    Newton steps are kept inside a bisection bracket [lo, hi] that shrinks
+    every iteration, so deep ITM/OTM options with tiny vega still converge.
+    """
+    price, forward, strike, t = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (price, forward, strike, t)))
+    is_call = np.broadcast_to(np.asarray(is_call, dtype=bool), price.shape)
+    discount = np.exp(-rate * t)
+    intrinsic = discount * np.maximum(np.where(is_call, forward - strike, strike - forward), 0.0)
+    upper = discount * np.where(is_call, forward, strike)
+    valid = (t > 0) & (forward > 0) & (strike > 0) & (price > intrinsic) & (price < upper)
+
+    lo = np.full(price.shape, MIN_VOL)
+    hi = np.full(price.shape, MAX_VOL)
+    # Brenner-Subrahmanyam starting point, good near the money
+    safe_t = np.where(valid, t, 1.0)
+    safe_forward = np.where(valid, forward, 1.0)
+    sigma = np.clip(np.sqrt(2 * np.pi / safe_t) * price / safe_forward, 0.05, 2.0)
+    active = valid.copy()
+    for _ in range(max_iter):
+        if not active.any():
+            break
+        f, k, tt, s, c = forward[active], strike[active], t[active], sigma[active], is_call[active]
+        diff = black76_price(f, k, tt, s, c, rate) - price[active]
+        vega = black76_vega(f, k, tt, s, rate)
+        # Price is increasing in sigma, so the sign of diff tells which side the root is on
+        lo[active] = np.where(diff < 0, s, lo[active])
+        hi[active] = np.where(diff > 0, s, hi[active])
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            step = s - diff / vega
+        bad = ~np.isfinite(step) | (step <= lo[active]) | (step >= hi[active])
+        step = np.where(bad, 0.5 * (lo[active] + hi[active]), step)
+        done = (np.abs(diff) < tol) | (hi[active] - lo[active] < tol)
+        sigma[active] = np.where(done, s, step)
+        active[np.flatnonzero(active)[done]] = False
+    return np.where(valid, sigma, np.nan)
+
+
+def black76_greeks(forward, strike, t, sigma, is_call, rate=RISK_FREE_RATE):
+    """Delta and gamma with respect to the forward, vega per vol point, theta per calendar day."""
+    d1, d2 = _d1_d2(forward, strike, t, sigma)
+    discount = np.exp(-rate * t)
+    sqrt_t = np.sqrt(t)
+    delta = discount * np.where(is_call, ndtr(d1), ndtr(d1) - 1)
+    gamma = discount * _npdf(d1) / (forward * sigma * sqrt_t)
+    vega = discount * forward * _npdf(d1) * sqrt_t / 100
+    price = black76_price(forward, strike, t, sigma, is_call, rate)
+    theta = (-discount * forward * _npdf(d1) * sigma / (2 * sqrt_t) + rate * price) / 365
+    return {'delta': delta, 'gamma': gamma, 'vega': vega, 'theta': theta}
+
+
+def years_to_expiry(dates, expiration):
+    """Year fraction from each date's close to the expiration's settlement."""
+    expiry = pd.Timestamp(datetime.datetime.combine(datetime.date.fromisoformat(str(expiration)), EXPIRY_TIME))
+    closes = pd.to_datetime(dates).dt.normalize() + pd.Timedelta(hours=CLOSE_TIME.hour, minutes=CLOSE_TIME.minute)
+    return ((expiry - closes).dt.total_seconds() / (365 * 24 * 3600)).to_numpy()
+
+
+def implied_forwards(chain, spot, rate=RISK_FREE_RATE):
+    """Forward per date from put-call parity, F = K + (C - P) * e^{rT}, falling back to spot."""
+    pairs = chain.pivot_table(index=['date', 'strike'], columns='right', values='close').dropna()
+    forwards = pd.Series(dtype=float)
+    if {'C', 'P'} <= set(pairs.columns) and not pairs.empty:
+        pairs = pairs.reset_index()
+        pairs['gap'] = (pairs['C'] - pairs['P']).abs()
+        atm = pairs.loc[pairs.groupby('date')['gap'].idxmin()].set_index('date')
+        t = chain.drop_duplicates('date').set_index('date')['t']
+        forwards = atm['strike'] + (atm['C'] - atm['P']) * np.exp(rate * t.reindex(atm.index))
+    dates = chain['date'].drop_duplicates()
+    result = forwards.reindex(dates)
+    source = pd.Series(np.where(result.notna(), 'parity', 'spot'), index=dates)
+    return result.fillna(spot.reindex(dates)), source
+
+
+def compute_chain(chain, spot, expiration, rate=RISK_FREE_RATE):
+    """Add t, forward, iv and Greeks columns to a chain of (date, strike, right, close) rows."""
+    chain = chain.copy()
+    chain['strike'] = chain['strike'].astype(float)
+    chain['t'] = years_to_expiry(chain['date'], expiration)
+    forwards, source = implied_forwards(chain, spot, rate)
+    chain['forward'] = chain['date'].map(forwards).astype(float)
+    chain['forward_source'] = chain['date'].map(source)
+    is_call = (chain['right'] == 'C').to_numpy()
+    args = chain['forward'].to_numpy(), chain['strike'].to_numpy(), chain['t'].to_numpy()
+    chain['iv'] = implied_vol(chain['close'].to_numpy(dtype=float), *args, is_call, rate)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for name, values in black76_greeks(*args, chain['iv'].to_numpy(), is_call, rate).items():
+            chain[name] = values
+    return chain
+
+
+def _history_ttl(chain):
+    today = datetime.date.today().isoformat()
+    return TODAY_TTL if not chain.empty and chain['date'].max() >= today else HISTORY_TTL
+
+
+# Stale chains are never served (max_stale=0): a miss recomputes the expiration
+cache = TTLCache(HISTORY_TTL, CACHE_SIZE, max_stale=0, name='greeks', ttl_for=_history_ttl)
+
+
+def chain_history(conn, symbol, expiration, rate=RISK_FREE_RATE):
+    """IV and Greeks for every stored date of one expiration, in one pass."""
+    chain = pd.read_sql_query(CHAIN_QUERY, conn, params=(symbol, expiration))
+    if chain.empty:
+        return chain
+    chain['date'] = chain['date'].astype(str).str.slice(0, 10)
+    # Last close of each day, over the chain's dates only
+    spot = load_underlying(conn, symbol, chain['date'].min(), chain['date'].max()).set_index('day')['close']
+    chain = compute_chain(chain, spot, expiration, rate)
+    return chain.sort_values(['date', 'right', 'strike']).reset_index(drop=True)
+
+
+def chain_on(conn, symbol, expiration, date=None, generation=None):
+    """Computed chain for one date (default: the latest stored), from the cache when possible.
+
+    generation is the ingest_meta generation the caller read, None on databases without it.
+    """
+    history = cache.get((symbol, expiration, generation), lambda: chain_history(conn, symbol, expiration))
+    if history.empty:
+        return None
+    date = date or history['date'].max()
+    return history[history['date'] == date].reset_index(drop=True)
+
+
+def smile_figure(rows, expiration):
+    """One expiration in the shape the smile page plots, plus Greeks per strike."""
+    fields = ['iv', 'delta', 'gamma', 'vega', 'theta', 'close', 'volume']
+
+    def side(right):
+        side_rows = rows[(rows['right'] == right) & rows['iv'].notna()]
+        data = {'x': side_rows['strike'].tolist(), 'y': side_rows['iv'].tolist()}
+        data.update({field: side_rows[field].tolist() for field in fields})
+        return data
+
+    return {
+        'expiration': expiration,
+        'date': rows['date'].iloc[0],
+        'forward': float(rows['forward'].iloc[0]),
+        'forward_source': rows['forward_source'].iloc[0],
+        'calls': side('C'),
+        'puts': side('P'),
+    }
@@ -0,0 +1,195 @@
+"""
+Pool of IB API connections (clientIds) to one gateway.
+
+ib_insync / ib_async throttle every connection to 45 messages a second
+and read its replies on one socket, so a single IB() is the ceiling for
+work that isn't bound by historical data pacing: reqContractDetails for
+qualification and reqMktData snapshots. IBPool opens several clientIds
+and stands in for an IB object. Each request goes to the connected member
+with the fewest requests in flight, and qualifyContractsAsync() splits its
+contracts into one shard per member. Errors of every member are re-emitted
+on the pool's errorEvent, so a HistoricalRequestScheduler or
+MarketDataLineScheduler built on the pool keeps one pacing budget and one
+line budget for all of them (IB counts both per account, not per client).
+Anything else (reqSecDefOptParams, run, ...) goes to the primary member.
+
+A member that drops is reconnected in the background with a doubling
+delay. Its requests fail with ConnectionError and are resent on another
+member, so the run carries on with fewer connections in the meantime.
+
+    pool = IBPool.around(ib, size=4)  # ib already connected as clientId 1; adds 2, 3 and 4
+    pool.connect()
+    scheduler = HistoricalRequestScheduler(pool)
+    qualified = await pool.qualifyContractsAsync(*contracts)
+    pool.disconnect()
+"""
+import asyncio
+import math
+from collections import defaultdict
+
+from eventkit import Event
+
+POOL_SIZE = 4  # clientIds per script; TWS allows 32
+RECONNECT_DELAY = 1.0  # seconds before the first reconnect attempt, doubled up to MAX_RECONNECT_DELAY
+MAX_RECONNECT_DELAY = 60.0
+MAX_RESENDS = 2  # times a request is moved to another member after a disconnect
+
+
+class PoolMember:
+    def __init__(self, ib, client_id):
+        self.ib = ib
+        self.client_id = client_id
+        self.in_flight = 0
+        self.requests = 0
+        self.reconnecting = False
+
+
+class IBPool:
+    def __init__(self, ib_class, host, port, client_ids, primary=None, timeout=10):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.errorEvent = Event('errorEvent')
+        self.members = []
+        self.closed = False
+        self.counters = defaultdict(int)
+        if primary is not None:
+            self._add(primary, primary.client.clientId)
+        for client_id in client_ids:
+            self._add(ib_class(), client_id)
+
+    @classmethod
+    def around(cls, ib, size=POOL_SIZE, timeout=10):
+        """A pool of `size` clients: the connected `ib` plus the clientIds that follow its own."""
+        client = ib.client
+        return cls(type(ib), client.host, client.port, range(client.clientId + 1, client.clientId + size),
+                   primary=ib, timeout=timeout)
+
+    def _add(self, ib, client_id):
+        member = PoolMember(ib, client_id)
+        ib.errorEvent += self.errorEvent.emit
+        ib.disconnectedEvent += lambda: self._on_disconnected(member)
+        self.members.append(member)
+
+    @property
+    def clients(self):
+        return len(self.members)
+
+    def __getattr__(self, name):
+        # Only called for attributes the pool doesn't have: hand them to the primary connection
+        if name.startswith('_') or 'members' not in self.__dict__:
+            raise AttributeError(name)
+        return getattr(self.primary(), name)
+
+    def primary(self):
+        """The first connected member (the first member if none is)."""
+        return next((m.ib for m in self.members if m.ib.isConnected()), self.members[0].ib)
+
+    def connected(self):
+        return [m for m in self.members if m.ib.isConnected()]
+
+    def isConnected(self):
+        return bool(self.connected())
+
+    def stats(self):
+        return dict(self.counters, connected=len(self.connected()),
+                    requests={m.client_id: m.requests for m in self.members})
+
+    def run(self, *awaitables, timeout=None):
+        return self.members[0].ib.run(*awaitables, timeout=timeout)
+
+    def connect(self):
+        """Connect every member that isn't; those that fail keep retrying in the background."""
+        return self.run(self.connect_async())
+
+    async def connect_async(self):
+        await asyncio.gather(*(self._connect(m) for m in self.members if not m.ib.isConnected()))
+        if not self.connected():
+            raise ConnectionError(f'no IB client of the pool could connect to {self.host}:{self.port}')
+        print(f"IB pool: {len(self.connected())}/{len(self.members)} clients connected")
+        return self
+
+    async def _connect(self, member):
+        try:
+            await member.ib.connectAsync(self.host, self.port, clientId=member.client_id, timeout=self.timeout)
+        except Exception as e:
+            print(f"IB pool: client {member.client_id} failed to connect: {e!r}")
+            self._schedule_reconnect(member)
+
+    def disconnect(self):
+        self.closed = True
+        for member in self.members:
+            member.ib.disconnect()
+
+    def _on_disconnected(self, member):
+        if self.closed:
+            return
+        self.counters['disconnects'] += 1
+        print(f"IB pool: client {member.client_id} disconnected, {len(self.connected())} still connected")
+        self._schedule_reconnect(member)
+
+    def _schedule_reconnect(self, member):
+        if member.reconnecting or self.closed:
+            return
+        member.reconnecting = True
+        asyncio.ensure_future(self._reconnect(member))
+
+    async def _reconnect(self, member):
+        delay = RECONNECT_DELAY
+        try:
+            while not self.closed and not member.ib.isConnected():
+                await asyncio.sleep(delay)
+                try:
+                    await member.ib.connectAsync(self.host, self.port, clientId=member.client_id,
+                                                 timeout=self.timeout)
+                    self.counters['reconnects'] += 1
+                    print(f"IB pool: client {member.client_id} reconnected")
+                except Exception as e:
+                    delay = min(delay * 2, MAX_RECONNECT_DELAY)
+                    print(f"IB pool: client {member.client_id} reconnect failed ({e!r}), next try in {delay:.0f}s")
+        finally:
+            member.reconnecting = False
+
+    async def _member(self):
+        """The least busy connected member, waiting up to `timeout` seconds for a reconnect if none is."""
+        waited = 0.0
+        while True:
+            members = self.connected()
+            if members:
+                return min(members, key=lambda m: m.in_flight)
+            if waited >= self.timeout:
+                raise ConnectionError('no connected IB client in the pool')
+            await asyncio.sleep(RECONNECT_DELAY)
+            waited += RECONNECT_DELAY
+
+    async def _call(self, method, *args, **kwargs):
+        for attempt in range(MAX_RESENDS + 1):
+            member = await self._member()
+            member.in_flight += 1
+            member.requests += 1
+            try:
+                return await getattr(member.ib, method)(*args, **kwargs)
+            except ConnectionError:
+                if attempt == MAX_RESENDS or self.closed:
+                    raise
+                self.counters['resent'] += 1
+            finally:
+                member.in_flight -= 1
+
+    async def reqHistoricalDataAsync(self, contract, *args, **kwargs):
+        return await self._call('reqHistoricalDataAsync', contract, *args, **kwargs)
+
+    async def reqTickersAsync(self, *contracts, **kwargs):
+        return await self._call('reqTickersAsync', *contracts, **kwargs)
+
+    async def qualifyContractsAsync(self, *contracts, **kwargs):
+        """Qualify in one shard per connected member; contracts are filled in place as with IB."""
+        if not contracts:
+            return []
+        size = math.ceil(len(contracts) / max(len(self.connected()), 1))
+        shards = [contracts[i:i + size] for i in range(0, len(contracts), size)]
+        results = await asyncio.gather(*(self._call('qualifyContractsAsync', *shard, **kwargs) for shard in shards))
+        return [contract for result in results for contract in result]
+
+    def qualifyContracts(self, *contracts, **kwargs):
+        return self.run(self.qualifyContractsAsync(*contracts, **kwargs))
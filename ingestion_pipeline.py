@@ -0,0 +1,63 @@
+"""
+Sliding-window async pipeline for per-contract ingestion work.
+
+Keeps up to `concurrency` workers running at all times and hands each
+result to `on_result` as soon as it arrives, instead of waiting for the
+slowest member of a fixed batch. A worker that raises (including
+asyncio.TimeoutError for a straggler) puts its item on a retry queue;
+retries are dispatched after fresh work and each item gets at most
+`max_attempts` tries. The returned PipelineReport lists what failed, and
+`on_failure(item, error)`, if given, hears about each item as it is given up.
+"""
+import asyncio
+import time
+from collections import deque
+
+
+class PipelineReport:
+    def __init__(self):
+        self.succeeded = 0
+        self.retried = 0
+        self.failed = {}  # item description -> last error
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def summary(self):
+        lines = [
+            f"Pipeline finished in {self.elapsed:.1f}s: {self.succeeded} succeeded, "
+            f"{self.retried} retries, {len(self.failed)} failed"]
+        for item, error in self.failed.items():
+            lines.append(f"  failed: {item}: {error}")
+        return '\n'.join(lines)
+
+
+async def run_pipeline(items, worker, on_result, concurrency=50, max_attempts=3, describe=str, on_failure=None):
+    """Run `await worker(item)` for every item with a sliding window of `concurrency`."""
+    report = PipelineReport()
+    pending = deque(items)
+    retries = deque()  # (item, attempt)
+    in_flight = {}  # task -> (item, attempt)
+
+    while pending or retries or in_flight:
+        while len(in_flight) < concurrency and (pending or retries):
+            item, attempt = (pending.popleft(), 1) if pending else retries.popleft()
+            in_flight[asyncio.ensure_future(worker(item))] = (item, attempt)
+
+        done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            item, attempt = in_flight.pop(task)
+            error = task.exception()
+            if error is None:
+                report.succeeded += 1
+                on_result(item, task.result())
+            elif attempt < max_attempts:
+                report.retried += 1
+                print(f"run_pipeline: {describe(item)} failed ({error!r}), retry {attempt}/{max_attempts - 1}")
+                retries.append((item, attempt + 1))
+            else:
+                report.failed[describe(item)] = repr(error)
+                if on_failure is not None:
+                    on_failure(item, error)
+
+    report.elapsed = time.perf_counter() - report.started
+    return report
@@ -0,0 +1,148 @@
+"""
+Latest-value cache for the dashboard and the fan-out behind /live_updates.
+
+One background thread per app process watches the ingestion generation in
+ingest_meta (bumped by DBWriter on every commit). Only when it moves does
+the thread re-read the newest VIX bar and the per-expiration watermarks in
+bar_status, keep them in memory for get_current_vix() and the ETags, and
+push what changed to every subscribed dashboard as a server-sent event.
+A DBWriter running inside this process (e.g. /start_get_quotes) wakes the
+thread straight after its commit; ingestion scripts in other processes
+are picked up within POLL_INTERVAL.
+"""
+import json
+import queue
+import sqlite3
+import threading
+
+import db_writer
+from bar_store import QUOTE_TYPE_ID
+
+POLL_INTERVAL = 1.0  # seconds between generation checks
+SUBSCRIBER_QUEUE = 100  # events a slow client may fall behind before it is dropped
+
+GENERATION_QUERY = "SELECT value FROM ingest_meta WHERE key = 'generation'"
+
+LATEST_VIX_QUERY = "SELECT date, close FROM vix_data WHERE symbol = 'VIX' ORDER BY date DESC LIMIT 1"
+
+EXPIRATIONS_QUERY = f'''
+    SELECT c.symbol, c.expiration, MAX(s.latest), COUNT(*) FROM contract c JOIN bar_status s ON s.contract_id = c.id
+    WHERE s.quote_type = {QUOTE_TYPE_ID} GROUP BY c.symbol, c.expiration
+'''
+
+
+class LiveFeed:
+    def __init__(self, db_path, poll_interval=POLL_INTERVAL):
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.generation = None
+        self.vix = None  # (date, close) of the newest VIX bar
+        self.expirations = {}  # (symbol, expiration) -> (latest bar ts, contracts)
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.loaded = threading.Event()
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='LiveFeed', daemon=True)
+                self.thread.start()
+                db_writer.commit_listeners.append(self.wake.set)
+        return self
+
+    def latest_vix(self):
+        """(date, close) of the newest VIX bar, without touching the database once loaded."""
+        self.start()
+        self.loaded.wait(5)
+        return self.vix
+
+    def subscribe(self):
+        self.start()
+        events = queue.Queue(maxsize=SUBSCRIBER_QUEUE)
+        with self.lock:
+            self.subscribers.add(events)
+        return events
+
+    def unsubscribe(self, events):
+        with self.lock:
+            self.subscribers.discard(events)
+
+    def snapshot(self):
+        """Events describing the current state, sent to a client when it connects."""
+        events = [('vix', {'date': self.vix[0], 'vix': self.vix[1]})] if self.vix else []
+        return events + [('chain', {'symbol': symbol, 'expiration': expiration, 'latest': latest})
+                         for (symbol, expiration), (latest, _) in sorted(self.expirations.items())]
+
+    def publish(self, event, data):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for events in subscribers:
+            try:
+                events.put_nowait((event, data))
+            except queue.Full:
+                # The browser reconnects and gets a fresh snapshot
+                print(f"LiveFeed: dropping a subscriber {SUBSCRIBER_QUEUE} events behind")
+                self.unsubscribe(events)
+
+    def run(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        try:
+            while True:
+                try:
+                    self.poll(conn)
+                except sqlite3.Error as e:
+                    print(f"LiveFeed: An error occurred while reading: {str(e)}")
+                self.loaded.set()
+                self.wake.wait(self.poll_interval)
+                self.wake.clear()
+        finally:
+            conn.close()
+
+    def poll(self, conn):
+        try:
+            row = conn.execute(GENERATION_QUERY).fetchone()
+            generation = row[0] if row else 0
+        except sqlite3.OperationalError:
+            generation = None  # no DBWriter has run against this database yet
+        if generation is not None and generation == self.generation:
+            return
+        self.generation = generation
+
+        try:
+            vix = conn.execute(LATEST_VIX_QUERY).fetchone()
+        except sqlite3.OperationalError:
+            vix = None
+        try:
+            expirations = {(symbol, expiration): (latest, count) for symbol, expiration, latest, count
+                           in conn.execute(EXPIRATIONS_QUERY, ('TRADES',))}
+        except sqlite3.OperationalError:
+            expirations = {}
+
+        if vix != self.vix:
+            self.vix = vix
+            if vix is not None:
+                self.publish('vix', {'date': vix[0], 'vix': vix[1]})
+        changed = [key for key, value in expirations.items() if self.expirations.get(key) != value]
+        self.expirations = expirations
+        for symbol, expiration in changed:
+            self.publish('chain', {'symbol': symbol, 'expiration': expiration, 'latest': expirations[symbol, expiration][0]})
+
+
+def event_stream(feed, keepalive=15):
+    """text/event-stream lines for one client: the current state, then every change."""
+    events = feed.subscribe()
+    try:
+        for event, data in feed.snapshot():
+            yield f'event: {event}\ndata: {json.dumps(data)}\n\n'
+        while True:
+            try:
+                event, data = events.get(timeout=keepalive)
+            except queue.Empty:
+                # A comment line keeps proxies from closing an idle connection
+                yield ': keepalive\n\n'
+                continue
+            yield f'event: {event}\ndata: {json.dumps(data)}\n\n'
+    finally:
+        feed.unsubscribe(events)
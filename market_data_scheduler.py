@@ -0,0 +1,195 @@
+"""
+Market data line budget for quoting a whole option chain.
+
+IB lets an account hold a fixed number of market data lines at once
+(typically 100) and rejects any request beyond that with error 101, and
+caps API messages at 50 a second. This scheduler treats the lines as a
+counted resource: every quote is a snapshot request that holds one line until IB
+delivers it (or `snapshot_timeout` passes), and requests are released in
+the order they were submitted, so a chain sorted by chain_priority() is
+refreshed nearest expiration and at-the-money first. An error 101 (lines
+used by another client, or streaming subscriptions we don't know about)
+pauses new requests with a doubling backoff, resends the rejected one and
+lowers the line limit by one, so a budget set too high settles on what
+the account really has. That limit is remembered as the line cap: only
+after `probe_interval` seconds does a clean pass try one line more, and
+every probe IB rejects again doubles the wait, so a gateway that really
+has fewer lines than `max_lines` is not hit with a 101 every other pass.
+
+    scheduler = MarketDataLineScheduler(ib, max_lines=100)   # ib may be an ib_pool.IBPool
+    contracts = chain_priority(contracts, spot)
+    tickers, seconds = await scheduler.refresh(contracts)
+    await scheduler.rotate(contracts, on_cycle=store)   # until cancelled
+"""
+import asyncio
+import statistics
+import time
+from collections import defaultdict
+
+from request_scheduler import SlidingWindow
+
+LINE_ERROR_CODES = (101,)
+SNAPSHOT_TIMEOUT = 11  # seconds; IB completes (or abandons) a snapshot within 11 s
+
+
+def chain_priority(contracts, spot):
+    """Nearest expiration first, then by distance of the strike from spot; calls before puts."""
+    return sorted(contracts, key=lambda c: (c.lastTradeDateOrContractMonth, abs(c.strike - spot), c.right))
+
+
+class MarketDataLineScheduler:
+    def __init__(self, ib, max_lines=100, reserved_lines=0, max_rate=40, snapshot_timeout=SNAPSHOT_TIMEOUT,
+                 initial_backoff=1.0, max_backoff=30.0, max_retries=3, probe_interval=60.0, max_probe_interval=3600.0):
+        self.ib = ib
+        self.max_lines = max_lines - reserved_lines  # lines kept free for streaming subscriptions elsewhere
+        self.line_limit = self.max_lines  # lowered on error 101, raised again by probing above line_cap
+        self.line_cap = None  # line_limit after the last pass IB rejected requests in
+        self.initial_probe_interval = probe_interval
+        self.probe_interval = probe_interval  # doubled by every rejected probe, up to max_probe_interval
+        self.max_probe_interval = max_probe_interval
+        self.probe_after = 0.0
+        self.probing = False  # line_limit was raised above line_cap and not rejected yet
+        # Below IB's 50 messages per second, which is per connection: an ib_pool.IBPool has several
+        self.rate_window = SlidingWindow(max_rate * getattr(ib, 'clients', 1), 1)
+        self.snapshot_timeout = snapshot_timeout
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.max_retries = max_retries
+
+        self.backoff = 0.0
+        self.paused_until = 0.0
+        self.lines_in_use = 0
+        self.quoted = {}  # contract key -> monotonic time of its last completed snapshot
+        self.cycle_seconds = []  # duration of every full refresh
+        self.counters = defaultdict(int)
+        self._lines = None  # asyncio.Condition guarding lines_in_use
+        self._rejected = set()  # contract keys that got error 101 while waiting for their snapshot
+        ib.errorEvent += self._on_error
+
+    def stats(self):
+        stats = dict(self.counters, lines_in_use=self.lines_in_use, line_limit=self.line_limit, line_cap=self.line_cap,
+                     backoff=self.backoff)
+        if self.cycle_seconds:
+            stats['last_cycle_seconds'] = round(self.cycle_seconds[-1], 3)
+            stats['median_cycle_seconds'] = round(statistics.median(self.cycle_seconds), 3)
+        return stats
+
+    @staticmethod
+    def contract_key(contract):
+        if contract.conId:
+            return contract.conId
+        return (contract.symbol, contract.lastTradeDateOrContractMonth, contract.strike, contract.right)
+
+    def _on_error(self, reqId, errorCode, errorString, contract):
+        if errorCode in LINE_ERROR_CODES and contract is not None:
+            self._rejected.add(self.contract_key(contract))
+            self.counters['line_errors'] += 1
+            self.line_limit = max(self.line_limit - 1, 1)
+            now = time.monotonic()
+            # Every request sent in the same burst is rejected together; escalate once per pause
+            if now >= self.paused_until:
+                self.backoff = min(max(self.backoff * 2, self.initial_backoff), self.max_backoff)
+                self.paused_until = now + self.backoff
+
+    async def _acquire(self):
+        async with self._lines:
+            await self._lines.wait_for(lambda: self.lines_in_use < self.line_limit)
+            self.lines_in_use += 1
+        try:
+            while True:
+                now = time.monotonic()
+                wait = max(self.paused_until - now, self.rate_window.wait_time(now))
+                if wait <= 0:
+                    break
+                self.counters['wait_seconds'] += wait
+                await asyncio.sleep(wait)
+        except BaseException:
+            # Cancelled (timeout, gather) while waiting: the line was never used
+            await self._release()
+            raise
+        self.rate_window.take(now)
+
+    async def _release(self):
+        async with self._lines:
+            self.lines_in_use -= 1
+            self._lines.notify_all()
+
+    async def snapshot(self, contract):
+        """One snapshot quote within the line budget; the Ticker, or None if it never arrived."""
+        if self._lines is None:
+            self._lines = asyncio.Condition()
+        key = self.contract_key(contract)
+        self.counters['submitted'] += 1
+
+        for attempt in range(self.max_retries + 1):
+            await self._acquire()
+            try:
+                tickers = await asyncio.wait_for(self.ib.reqTickersAsync(contract), self.snapshot_timeout)
+            except asyncio.TimeoutError:
+                # IB gives up on the snapshot itself by now, so the line is free again
+                self.counters['timeouts'] += 1
+                return None
+            finally:
+                await self._release()
+
+            if key not in self._rejected:
+                self.counters['completed'] += 1
+                self.quoted[key] = time.monotonic()
+                if self.backoff:
+                    self.backoff = self.backoff / 2 if self.backoff > self.initial_backoff else 0.0
+                return tickers[0] if tickers else None
+
+            self._rejected.discard(key)
+            self.counters['retries'] += 1
+            print(f"No free market data line for {contract.localSymbol or key}, "
+                  f"retrying in {self.backoff:.0f}s (attempt {attempt + 1}/{self.max_retries})")
+
+        self.counters['failed'] += 1
+        return None
+
+    async def refresh(self, contracts):
+        """Snapshot every contract once, in the given order; returns (tickers, seconds taken)."""
+        started = time.monotonic()
+        line_errors = self.counters['line_errors']
+        tickers = await asyncio.gather(*(self.snapshot(contract) for contract in contracts))
+        self._adjust_limit(self.counters['line_errors'] > line_errors)
+        seconds = time.monotonic() - started
+        self.cycle_seconds.append(seconds)
+        self.counters['cycles'] += 1
+        return tickers, seconds
+
+    def _adjust_limit(self, rejected):
+        now = time.monotonic()
+        if rejected:
+            if self.probing:
+                self.probe_interval = min(self.probe_interval * 2, self.max_probe_interval)
+                self.probing = False
+            self.line_cap = self.line_limit
+            self.probe_after = now + self.probe_interval
+            return
+        if self.probing:
+            # The extra line held for a whole pass: it is part of the cap now
+            self.line_cap = self.line_limit
+            self.probe_interval = self.initial_probe_interval
+        if self.line_limit < self.max_lines and now >= self.probe_after:
+            self.line_limit += 1
+            self.probing = self.line_cap is not None
+
+    def staleness(self, contracts):
+        """(median, max) seconds since each contract's last snapshot; never-quoted contracts count as inf."""
+        now = time.monotonic()
+        ages = [now - self.quoted[key] if key in self.quoted else float('inf')
+                for key in map(self.contract_key, contracts)]
+        return (statistics.median(ages), max(ages)) if ages else (0.0, 0.0)
+
+    async def rotate(self, contracts, cycles=None, on_cycle=None):
+        """Refresh the chain over and over (`cycles` times, or until cancelled), calling on_cycle(tickers, seconds)."""
+        cycle = 0
+        while cycles is None or cycle < cycles:
+            tickers, seconds = await self.refresh(contracts)
+            quoted = sum(ticker is not None for ticker in tickers)
+            print(f"Chain refresh {cycle + 1}: {quoted}/{len(contracts)} contracts in {seconds:.2f}s "
+                  f"({len(contracts) / seconds:.1f} quotes/s, {self.line_limit} lines)")
+            if on_cycle is not None:
+                on_cycle(tickers, seconds)
+            cycle += 1
@@ -0,0 +1,128 @@
+"""
+Migrate options.db from the v1 option_data / quote_status tables to schema v2
+(see bar_store.py).
+
+The old tables are renamed to option_data_v1 / quote_status_v1 (or dropped
+with --drop-old) and replaced by compatibility views of the same name.
+SQLite rewrites a daily_option view to read the renamed option_data_v1, so
+daily_option is rebuilt from bar as a table (see daily_rollup.py) before
+anything is dropped.
+--vacuum rewrites the file afterwards so the freed pages are returned.
+
+    python migrate_schema_v2.py --drop-old --vacuum
+"""
+import argparse
+import os
+import sqlite3
+import time
+
+from bar_store import CREATE_TABLES, CREATE_VIEWS, QUOTE_TYPE_INSERT, QUOTE_TYPES, is_v2
+from daily_rollup import ROLLUP_ALL, ensure_table
+
+MIGRATE = '''
+    INSERT OR IGNORE INTO quote_type (name)
+    SELECT quote_type FROM option_data_v1 UNION SELECT quote_type FROM quote_status_v1;
+
+    INSERT OR IGNORE INTO contract (symbol, expiration, strike, right)
+    SELECT symbol, expiration, strike, right FROM option_data_v1
+    UNION SELECT symbol, expiration, strike, right FROM quote_status_v1
+    ORDER BY 1, 2, 3, 4;
+
+    INSERT OR REPLACE INTO bar (contract_id, quote_type, ts, open, high, low, close, volume, average, barCount)
+    SELECT c.id, q.id, CAST(strftime('%s', o.date) AS INTEGER), o.open, o.high, o.low, o.close, o.volume, o.average, o.barCount
+    FROM option_data_v1 o
+    JOIN contract c ON c.symbol = o.symbol AND c.expiration = o.expiration AND c.strike = o.strike AND c.right = o.right
+    JOIN quote_type q ON q.name = o.quote_type
+    WHERE o.date IS NOT NULL;
+
+    INSERT OR REPLACE INTO bar_status (contract_id, quote_type, latest)
+    SELECT c.id, q.id, CAST(strftime('%s', s.latest) AS INTEGER)
+    FROM quote_status_v1 s
+    JOIN contract c ON c.symbol = s.symbol AND c.expiration = s.expiration AND c.strike = s.strike AND c.right = s.right
+    JOIN quote_type q ON q.name = s.quote_type
+    WHERE s.latest IS NOT NULL;
+'''
+
+
+def db_size(conn):
+    page_count, = conn.execute('PRAGMA page_count').fetchone()
+    page_size, = conn.execute('PRAGMA page_size').fetchone()
+    return page_count * page_size
+
+
+def time_scan(conn, table):
+    started = time.perf_counter()
+    rows, = conn.execute(f"SELECT COUNT(*) FROM (SELECT * FROM {table} WHERE quote_type = 'TRADES' AND symbol = 'VIX')").fetchone()
+    return rows, time.perf_counter() - started
+
+
+def migrate(db_path='options.db', drop_old=False, vacuum=False):
+    if not os.path.exists(db_path):
+        print(f"{db_path} does not exist, nothing to migrate")
+        return
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        if is_v2(conn):
+            print(f"{db_path} is already on schema v2")
+            return
+
+        size_before = db_size(conn)
+        rows_before, scan_before = time_scan(conn, 'option_data')
+        started = time.perf_counter()
+
+        conn.execute('BEGIN')
+        conn.execute('ALTER TABLE option_data RENAME TO option_data_v1')
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'quote_status' AND type = 'table'").fetchone():
+            conn.execute('ALTER TABLE quote_status RENAME TO quote_status_v1')
+        else:
+            conn.execute('CREATE TABLE quote_status_v1 (quote_type, symbol, expiration, strike, right, latest)')
+        for statement in (CREATE_TABLES + MIGRATE).split(';'):
+            if statement.strip():
+                conn.execute(statement)
+        conn.executemany(QUOTE_TYPE_INSERT, [(name,) for name in QUOTE_TYPES])
+        for statement in CREATE_VIEWS.split(';'):
+            if statement.strip():
+                conn.execute(statement)
+        conn.execute('COMMIT')
+        print(f"Migrated {rows_before} TRADES rows in {time.perf_counter() - started:.1f}s")
+
+        # A daily_option view now reads option_data_v1; replace it (or a v1-era table) with the rollup of bar
+        ensure_table(conn)
+        conn.execute('BEGIN')
+        conn.execute('DELETE FROM daily_option')
+        daily_rows = conn.execute(ROLLUP_ALL).rowcount
+        conn.execute('COMMIT')
+        print(f"Rebuilt daily_option: {daily_rows} rows")
+
+        if drop_old:
+            conn.execute('BEGIN')
+            conn.execute('DROP TABLE option_data_v1')
+            conn.execute('DROP TABLE quote_status_v1')
+            conn.execute('COMMIT')
+
+        rows_after, = conn.execute('SELECT COUNT(*) FROM bar').fetchone()
+        contracts, = conn.execute('SELECT COUNT(*) FROM contract').fetchone()
+        print(f"bar: {rows_after} rows, contract: {contracts} rows")
+
+        if vacuum:
+            conn.execute('VACUUM')
+        size_after = db_size(conn)
+        _, scan_after = time_scan(conn, 'option_data')
+        print(f"Database size: {size_before / 1e6:.1f} MB -> {size_after / 1e6:.1f} MB"
+              + ('' if vacuum or drop_old else ' (old tables kept, use --drop-old --vacuum to reclaim space)'))
+        print(f"VIX TRADES scan: {scan_before * 1000:.0f} ms -> {scan_after * 1000:.0f} ms")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Migrate options.db to schema v2')
+    parser.add_argument('--db', default='options.db')
+    parser.add_argument('--drop-old', action='store_true', help='drop option_data_v1 / quote_status_v1 after copying')
+    parser.add_argument('--vacuum', action='store_true', help='VACUUM after migrating to shrink the file')
+    args = parser.parse_args()
+    migrate(args.db, args.drop_old, args.vacuum)
@@ -0,0 +1,144 @@
+"""
+Parquet archive tier for expired expirations.
+
+Bars of expirations that have passed are moved out of options.db into
+archive/<symbol>/<expiration>/, one directory per partition:
+
+    bars.parquet   hourly bars in the old option_data layout, plus ts
+    daily.parquet  the matching daily_option rows, what the chart reads
+
+Archived files are immutable and read with memory mapping, so repeated
+chart requests for old expirations are served from the page cache. The
+contract and bar_status rows stay in the database; they are tiny and keep
+ingestion from asking IB for history of an archived contract again.
+
+    python parquet_archive.py            # archive everything expired before today
+    python parquet_archive.py --vacuum   # and shrink options.db afterwards
+
+pyarrow is only needed for this module; without it the archive job refuses
+to run and the app serves whatever is still in options.db.
+"""
+import argparse
+import datetime
+import os
+import time
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from db_writer import BUMP_GENERATION, CREATE_INGEST_META, connect
+
+ARCHIVE_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'archive')
+
+EXPIRED = '''
+    SELECT DISTINCT c.symbol, c.expiration FROM contract c
+    WHERE c.expiration < ? AND EXISTS (SELECT 1 FROM bar b WHERE b.contract_id = c.id)
+    ORDER BY c.symbol, c.expiration
+'''
+
+PARTITION_BARS = '''
+    SELECT q.name AS quote_type, c.symbol, c.expiration, c.strike, c.right, b.ts, datetime(b.ts, 'unixepoch') AS date,
+        b.open, b.high, b.low, b.close, b.volume, b.average, b.barCount, c.conId
+    FROM contract c JOIN bar b ON b.contract_id = c.id JOIN quote_type q ON q.id = b.quote_type
+    WHERE c.symbol = ? AND c.expiration = ?
+    ORDER BY c.strike, c.right, q.name, b.ts
+'''
+
+PARTITION_DAILY = '''
+    SELECT quote_type, symbol, expiration, strike, right, date, open, high, low, close, volume
+    FROM daily_option WHERE symbol = ? AND expiration = ?
+    ORDER BY strike, right, quote_type, date
+'''
+
+KEYS = {'bars': ['quote_type', 'strike', 'right', 'ts'], 'daily': ['quote_type', 'strike', 'right', 'date']}
+
+
+def partition_dir(symbol, expiration, root=ARCHIVE_DIR):
+    return os.path.join(root, symbol, str(expiration))
+
+
+def _write(df, path, keys):
+    """Write df to path atomically, merged with what an earlier run archived there."""
+    if os.path.exists(path):
+        df = pd.concat([pq.read_table(path, memory_map=True).to_pandas(), df], ignore_index=True)
+        df = df.drop_duplicates(keys, keep='last').sort_values(keys)
+    tmp = f'{path}.tmp'
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp, compression='zstd')
+    os.replace(tmp, path)
+
+
+def archive_partition(conn, symbol, expiration, root=ARCHIVE_DIR):
+    """Copy one symbol/expiration to Parquet, then delete it from the database."""
+    bars = pd.read_sql_query(PARTITION_BARS, conn, params=(symbol, expiration))
+    daily = pd.read_sql_query(PARTITION_DAILY, conn, params=(symbol, expiration))
+    bars['strike'] = bars['strike'].astype(float)
+    daily['strike'] = daily['strike'].astype(float)
+
+    directory = partition_dir(symbol, expiration, root)
+    os.makedirs(directory, exist_ok=True)
+    _write(bars, os.path.join(directory, 'bars.parquet'), KEYS['bars'])
+    _write(daily, os.path.join(directory, 'daily.parquet'), KEYS['daily'])
+
+    # Only delete once both files are on disk
+    with conn:
+        conn.execute('''
+            DELETE FROM bar WHERE contract_id IN (SELECT id FROM contract WHERE symbol = ? AND expiration = ?)
+        ''', (symbol, expiration))
+        conn.execute('DELETE FROM daily_option WHERE symbol = ? AND expiration = ?', (symbol, expiration))
+        # Caches keyed by the generation (index catalog, Greeks) must stop serving the deleted rows
+        conn.execute(CREATE_INGEST_META)
+        conn.execute(BUMP_GENERATION)
+    return len(bars), len(daily)
+
+
+def archive_expired(db_path='options.db', before=None, root=ARCHIVE_DIR, vacuum=False):
+    if pq is None:
+        raise RuntimeError('pyarrow is required to archive to Parquet: pip install pyarrow')
+    before = before or datetime.date.today().isoformat()
+    conn = connect(db_path)
+    try:
+        partitions = conn.execute(EXPIRED, (before,)).fetchall()
+        print(f"Archiving {len(partitions)} expirations before {before} to {root}")
+        for symbol, expiration in partitions:
+            started = time.perf_counter()
+            bars, daily = archive_partition(conn, symbol, expiration, root)
+            print(f"{symbol} {expiration}: {bars} bars, {daily} daily rows in {time.perf_counter() - started:.1f}s")
+        if vacuum and partitions:
+            conn.execute('VACUUM')
+    finally:
+        conn.close()
+    return partitions
+
+
+def read_daily(symbol, expiration, strike, right, quote_type=None, root=ARCHIVE_DIR):
+    """Archived daily_option rows of one contract, or None if it is not archived."""
+    path = os.path.join(partition_dir(symbol, expiration, root), 'daily.parquet')
+    if pq is None or not os.path.exists(path):
+        return None
+    filters = [('strike', '=', float(strike)), ('right', '=', right)]
+    if quote_type:
+        filters.append(('quote_type', '=', quote_type))
+    return pq.read_table(path, memory_map=True, filters=filters).to_pandas()
+
+
+def read_bars(symbol, expiration, root=ARCHIVE_DIR, columns=None):
+    """Archived hourly bars of a whole expiration, or None if it is not archived."""
+    path = os.path.join(partition_dir(symbol, expiration, root), 'bars.parquet')
+    if pq is None or not os.path.exists(path):
+        return None
+    return pq.read_table(path, memory_map=True, columns=columns).to_pandas()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Move expired expirations from options.db to Parquet')
+    parser.add_argument('--db', default='options.db')
+    parser.add_argument('--before', help='archive expirations before this date (YYYY-MM-DD), default today')
+    parser.add_argument('--root', default=ARCHIVE_DIR)
+    parser.add_argument('--vacuum', action='store_true', help='VACUUM options.db afterwards to shrink the file')
+    args = parser.parse_args()
+    archive_expired(args.db, args.before, args.root, args.vacuum)
@@ -0,0 +1,90 @@
+"""
+Vectorized expiration payoff for option strategies.
+
+A strategy is a list of legs, each a dict with 'type' ('call' or 'put'),
+'position' ('long' or 'short'), 'strike', a premium ('price' or 'cost')
+and a contract count ('contracts' or 'number'), as posted by the
+option_calculator and expiration_profit_loss forms. Legs become parallel
+NumPy arrays and are broadcast against the price grid, so the cost does
+not grow with Python loops over prices or legs; batch_profits() evaluates
+many strategies at once by padding them to the same number of legs.
+"""
+import numpy as np
+
+CONTRACT_SIZE = 100
+DEFAULT_POINTS = 100
+MIN_POINTS = 2
+MAX_POINTS = 2000  # the grid is allocated once per leg (and per strategy in a batch)
+
+
+def leg_arrays(legs):
+    """(strike, is_call, signed quantity, premium) arrays for a list of legs."""
+    strike = np.array([float(leg['strike']) for leg in legs])
+    is_call = np.array([leg['type'] == 'call' for leg in legs])
+    sign = np.array([-1.0 if leg['position'] == 'short' else 1.0 for leg in legs])
+    quantity = np.array([float(leg.get('contracts', leg.get('number', 1))) for leg in legs]) * sign
+    premium = np.array([float(leg.get('price', leg.get('cost', 0.0))) for leg in legs])
+    return strike, is_call, quantity, premium
+
+
+def price_grid(strikes, points=DEFAULT_POINTS, min_price=None, max_price=None):
+    """
+    Evenly spaced underlying prices, by default from half the lowest to 1.5x the highest strike.
+    `points` is clamped to MIN_POINTS..MAX_POINTS; raises ValueError unless min_price < max_price.
+    """
+    strikes = np.asarray(strikes, dtype=float)
+    low = float(min_price) if min_price is not None else strikes.min() * 0.5
+    high = float(max_price) if max_price is not None else strikes.max() * 1.5
+    if not (np.isfinite(low) and np.isfinite(high) and low < high):
+        raise ValueError(f'min_price ({low:g}) must be below max_price ({high:g})')
+    return np.linspace(low, high, min(max(int(points), MIN_POINTS), MAX_POINTS))
+
+
+def leg_profits(prices, strike, is_call, quantity, premium):
+    """Profit of every leg at every price; leg arrays of shape (..., legs) give (..., legs, prices)."""
+    prices = np.asarray(prices, dtype=float)
+    moneyness = prices - strike[..., None]
+    intrinsic = np.maximum(np.where(is_call[..., None], moneyness, -moneyness), 0.0)
+    return (intrinsic - premium[..., None]) * quantity[..., None] * CONTRACT_SIZE
+
+
+def strategy_profits(legs, prices, stock=None, shares=0):
+    """Total profit of one strategy over the price grid, optionally with a stock position."""
+    profits = leg_profits(prices, *leg_arrays(legs)).sum(axis=0) if legs else np.zeros(len(prices))
+    if shares:
+        profits = profits + (np.asarray(prices) - float(stock)) * shares
+    return profits
+
+
+def batch_profits(strategies, prices):
+    """Profits of many strategies over one grid, shape (strategies, prices).
+
+    Strategies with fewer legs are padded with zero-quantity legs, so the
+    whole batch is a single broadcast.
+    """
+    width = max((len(legs) for legs in strategies), default=0)
+    strike = np.zeros((len(strategies), width))
+    is_call = np.zeros((len(strategies), width), dtype=bool)
+    quantity = np.zeros((len(strategies), width))
+    premium = np.zeros((len(strategies), width))
+    for row, legs in enumerate(strategies):
+        if legs:
+            n = len(legs)
+            strike[row, :n], is_call[row, :n], quantity[row, :n], premium[row, :n] = leg_arrays(legs)
+    return leg_profits(prices, strike, is_call, quantity, premium).sum(axis=1)
+
+
+def summarize(profits, prices):
+    """Max profit, max loss and approximate breakevens (sign changes on the grid) per row."""
+    profits = np.atleast_2d(profits)
+    crossings = np.diff(np.sign(profits), axis=1) != 0
+    breakevens = []
+    for row, cross in zip(profits, crossings):
+        i = np.flatnonzero(cross)
+        # Linear interpolation between the two grid points around each crossing
+        breakevens.append((prices[i] - row[i] * (prices[i + 1] - prices[i]) / (row[i + 1] - row[i])).tolist())
+    return {
+        'maxProfit': profits.max(axis=1).tolist(),
+        'maxLoss': profits.min(axis=1).tolist(),
+        'breakevens': breakevens,
+    }
@@ -0,0 +1,200 @@
+"""
+Pacing-aware scheduler for IB historical data requests.
+
+IB rejects historical requests (error 162, "pacing violation") when a
+client makes more than 60 requests in 10 minutes, repeats an identical
+request within 15 seconds, or sends 6 or more requests for the same
+contract within 2 seconds. Every rule is enforced here as a sliding
+window over the times requests were sent, the way IB counts them;
+requests wait for all of them before being sent. When IB still
+reports a pacing violation the scheduler backs off (doubling, capped) and
+resends the request.
+
+Works with both ib_insync and ib_async IB objects:
+
+    scheduler = HistoricalRequestScheduler(ib)
+    bars = await scheduler.submit(contract, endDateTime=..., durationStr='5 D', ...)
+    bars = scheduler.request(contract, ...)   # blocking, for synchronous scripts
+"""
+import asyncio
+import math
+import time
+from collections import defaultdict, deque
+
+PACING_ERROR_CODES = (162, 420)
+PACING_SLACK = 1.0  # seconds added to every pacing window
+
+
+class SlidingWindow:
+    """At most `limit` events in any `period` seconds."""
+
+    def __init__(self, limit, period, slack=0.0):
+        self.limit = limit
+        self.period = period + slack  # IB stamps a request when it arrives, a little after we send it
+        self.times = deque()
+
+    def _expire(self, now):
+        while self.times and now - self.times[0] >= self.period:
+            self.times.popleft()
+
+    def wait_time(self, now):
+        self._expire(now)
+        return 0.0 if len(self.times) < self.limit else self.times[0] + self.period - now
+
+    def take(self, now):
+        self._expire(now)
+        self.times.append(now)
+
+    def last(self):
+        return self.times[-1] if self.times else -math.inf
+
+
+class HistoricalRequestScheduler:
+    def __init__(self, ib, max_requests=60, window=600, per_contract=5, per_contract_window=2,
+                 identical_interval=15, max_in_flight=50, initial_backoff=2.0, max_backoff=120.0,
+                 max_retries=5):
+        self.ib = ib
+        self.global_window = SlidingWindow(max_requests, window, PACING_SLACK)
+        self.per_contract = per_contract
+        self.per_contract_window = per_contract_window
+        self.contract_windows = {}
+        self.identical_interval = identical_interval
+        self.last_identical = {}
+        self.max_in_flight = max_in_flight
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.max_retries = max_retries
+
+        self.backoff = 0.0
+        self.paused_until = 0.0
+        self.waiting = 0
+        self.in_flight = 0
+        self.counters = defaultdict(int)
+        self._semaphore = None
+        # (reqId, contract key) of requests that got a pacing error; the contract key keeps
+        # the reqIds of different connections (ib_pool.IBPool) apart
+        self._paced = set()
+        self._evicted = time.monotonic()
+        ib.errorEvent += self._on_error
+
+    def queue_depth(self):
+        """Requests waiting for a pacing slot (not yet sent to IB)."""
+        return self.waiting
+
+    def stats(self):
+        return dict(self.counters, queue_depth=self.waiting, in_flight=self.in_flight,
+                    backoff=self.backoff)
+
+    @staticmethod
+    def contract_key(contract):
+        if contract.conId:
+            return contract.conId
+        return (contract.symbol, contract.lastTradeDateOrContractMonth, contract.strike,
+                contract.right, contract.exchange)
+
+    def _on_error(self, reqId, errorCode, errorString, contract):
+        if errorCode in PACING_ERROR_CODES and 'pacing' in errorString.lower() and contract is not None:
+            self._paced.add((reqId, self.contract_key(contract)))
+            self.counters['pacing_errors'] += 1
+            now = time.monotonic()
+            self.backoff = min(max(self.backoff * 2, self.initial_backoff), self.max_backoff)
+            self.paused_until = max(self.paused_until, now + self.backoff)
+
+    def _evict(self, now):
+        # A contract with no request in its window and an identical request older than the
+        # interval no longer count, so neither needs remembering in a long-running process
+        if now - self._evicted < self.identical_interval:
+            return
+        self._evicted = now
+        for key in [key for key, window in self.contract_windows.items()
+                    if now - window.last() >= window.period]:
+            del self.contract_windows[key]
+        for key in [key for key, sent in self.last_identical.items() if now - sent >= self.identical_interval]:
+            del self.last_identical[key]
+
+    def _window(self, contract_key):
+        window = self.contract_windows.get(contract_key)
+        if window is None:
+            window = self.contract_windows[contract_key] = SlidingWindow(
+                self.per_contract, self.per_contract_window, PACING_SLACK)
+        return window
+
+    async def _acquire(self, contract_key, request_key):
+        self.waiting += 1
+        try:
+            while True:
+                now = time.monotonic()
+                self._evict(now)
+                # Looked up every pass: the window may have been evicted while we slept
+                contract_window = self._window(contract_key)
+                wait = max(
+                    self.paused_until - now,
+                    self.global_window.wait_time(now),
+                    contract_window.wait_time(now),
+                    self.last_identical.get(request_key, -self.identical_interval) + self.identical_interval - now)
+                if wait <= 0:
+                    break
+                self.counters['wait_seconds'] += wait
+                await asyncio.sleep(wait)
+        finally:
+            self.waiting -= 1
+
+        self.global_window.take(now)
+        contract_window.take(now)
+        self.last_identical[request_key] = now
+
+    async def submit(self, contract, endDateTime='', durationStr='1 D', barSizeSetting='1 hour',
+                     whatToShow='TRADES', useRTH=True, formatDate=1, timeout=60, ib=None):
+        """
+        Send one reqHistoricalData once the pacing rules allow it; returns the bars.
+        Raises asyncio.TimeoutError if IB did not answer within `timeout` seconds.
+        """
+        ib = ib or self.ib
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        contract_key = self.contract_key(contract)
+        request_key = (contract_key, str(endDateTime), durationStr, barSizeSetting, whatToShow, useRTH)
+        self.counters['submitted'] += 1
+
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(contract_key, request_key)
+            async with self._semaphore:
+                self.in_flight += 1
+                sent = time.monotonic()
+                try:
+                    bars = await ib.reqHistoricalDataAsync(
+                        contract,
+                        endDateTime=endDateTime,
+                        durationStr=durationStr,
+                        barSizeSetting=barSizeSetting,
+                        whatToShow=whatToShow,
+                        useRTH=useRTH,
+                        formatDate=formatDate,
+                        timeout=timeout)
+                finally:
+                    self.in_flight -= 1
+
+            paced = (getattr(bars, 'reqId', None), contract_key)
+            if paced not in self._paced:
+                if not bars and timeout and time.monotonic() - sent >= timeout:
+                    # ib_insync cancels a request that hits its timeout and
+                    # returns no bars; surface that so callers can retry it
+                    self.counters['timeouts'] += 1
+                    raise asyncio.TimeoutError(f'historical request timed out after {timeout}s')
+                self.counters['completed'] += 1
+                if self.backoff:
+                    self.backoff = self.backoff / 2 if self.backoff > self.initial_backoff else 0.0
+                return bars
+
+            self._paced.discard(paced)
+            self.counters['retries'] += 1
+            print(f"Pacing violation for {contract.localSymbol or contract_key}, "
+                  f"retrying in {self.backoff:.0f}s (attempt {attempt + 1}/{self.max_retries})")
+
+        self.counters['failed'] += 1
+        return []
+
+    def request(self, contract, **kwargs):
+        """Blocking version of submit() for scripts that don't run an event loop."""
+        return self.ib.run(self.submit(contract, **kwargs))
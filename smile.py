@@ -3,87 +3,198 @@ import yfinance as yf
 import pandas as pd
 import json
 import numpy as np
-from datetime import datetime, timedelta
-from functools import lru_cache, wraps
+from datetime import datetime
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from ttl_cache import cached
+import smile_store
+from conditional import make_etag, not_modified, tagged
+import sqlite3
 
 def smile_route():
     return render_template('smile.html')
 
-# Custom time-based cache decorator
-def timed_lru_cache(seconds: int, maxsize: int = 128):
-    def wrapper_cache(func):
-        func = lru_cache(maxsize=maxsize)(func)
-        func.lifetime = seconds
-        func.expiration = time.time() + seconds
+CHAIN_WORKERS = 8  # concurrent option_chain downloads per chain fetch
+CHAIN_TIMEOUT = 15  # seconds one expiration may take once it has started
+CHAIN_DEADLINE = 60  # seconds for the whole chain, including waiting for a free worker
+SMILE_TTL = 3600
+PARTIAL_SMILE_TTL = 300  # retry failed expirations sooner
 
-        @wraps(func)
-        def wrapped_func(*args, **kwargs):
-            if time.time() > func.expiration:
-                func.cache_clear()
-                func.expiration = time.time() + func.lifetime
 
-            return func(*args, **kwargs)
+class YFinanceSource:
+    """
+    Where smile chains come from; anything with these two methods can replace it (see set_data_source).
+    A new one is made for every fetch_option_data call, so its Tickers live as long as that fetch.
+    """
 
-        return wrapped_func
+    def __init__(self):
+        self.tickers = {}
 
-    return wrapper_cache
+    def ticker(self, symbol):
+        # One Ticker per symbol so option_chain() reuses the expiration list expirations() downloaded;
+        # a Ticker never refreshes that list, which is why it mustn't outlive the fetch
+        if symbol not in self.tickers:
+            self.tickers[symbol] = yf.Ticker(symbol)
+        return self.tickers[symbol]
 
-@timed_lru_cache(seconds=3600)  # Cache for 1 hour
-def fetch_option_data(symbol):
-    # Fetch option chain data
-    stock = yf.Ticker(symbol)
-    
-    # Get all expiration dates
-    expirations = stock.options
-    if not expirations:
-        return {"error": "No options data available for this symbol"}
-    
-    # Create a list to hold all the figures
-    figures_data = []
+    def expirations(self, symbol):
+        return self.ticker(symbol).options
+
+    def option_chain(self, symbol, expiration):
+        """Object with .calls and .puts DataFrames (strike, impliedVolatility, lastTradeDate)."""
+        return self.ticker(symbol).option_chain(expiration)
+
+
+data_source = YFinanceSource  # called once per fetch for a fresh source
 
-    # Get current date
-    current_date = datetime.now().date()
+
+def set_data_source(source):
+    """Use `source` for every fetch from now on; a callable is called for a new source per fetch."""
+    global data_source
+    data_source = source if callable(source) else (lambda: source)
+    fetch_option_data.cache.invalidate()
+
+
+def fetch_chains(source, symbol, expirations, timeout=None, deadline=None):
+    """Download every expiration in parallel; returns ({expiration: chain}, [failures])."""
+    timeout = timeout or CHAIN_TIMEOUT
+    deadline = deadline or CHAIN_DEADLINE
+    started = {}
+    give_up = time.monotonic() + deadline
+
+    def fetch(expiration):
+        started[expiration] = time.monotonic()
+        return source.option_chain(symbol, expiration)
+
+    # Workers of this call only: a download that hangs past its timeout can't be stopped, but it
+    # keeps just this executor's thread and never starves later requests of workers
+    executor = ThreadPoolExecutor(max_workers=CHAIN_WORKERS, thread_name_prefix='smile-chain')
+    try:
+        futures = {executor.submit(fetch, expiration): expiration for expiration in expirations}
+        chains, failed = {}, []
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                expiration = futures[future]
+                try:
+                    chains[expiration] = future.result()
+                except Exception as e:
+                    print(f"fetch_chains: {symbol} {expiration} failed: {str(e)}")
+                    failed.append({'expiration': expiration, 'error': str(e)})
+            now = time.monotonic()
+            for future in list(pending):
+                expiration = futures[future]
+                if expiration in started and now - started[expiration] > timeout:
+                    # The worker thread keeps running until the download returns; we just stop waiting
+                    error = f'timed out after {timeout}s'
+                elif now > give_up:
+                    # Workers are all busy (possibly with hung downloads); don't queue behind them forever
+                    future.cancel()
+                    error = f'not fetched within {deadline}s'
+                else:
+                    continue
+                print(f"fetch_chains: {symbol} {expiration} {error}")
+                failed.append({'expiration': expiration, 'error': error})
+                pending.discard(future)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return chains, failed
+
+
+def smile_figures(symbol, quotes, fetched, failed):
+    """Response for one snapshot: a figure per expiration with recent trades, plus the failures."""
+    # Filter out strikes whose last trade is more than 30 days older than the snapshot
+    recent = quotes[quotes['last_trade'] > fetched - 30 * 24 * 3600].sort_values(['expiration', 'right', 'strike'])
 
     # Create a chart for each expiration date
-    for expiration in expirations:
-        # Fetch option chain for the expiration
-        opt = stock.option_chain(expiration)
-        
-        # Filter out data rows with last trade date older than 30 days
-        calls = opt.calls[opt.calls['lastTradeDate'].dt.date > (current_date - timedelta(days=30))]
-        puts = opt.puts[opt.puts['lastTradeDate'].dt.date > (current_date - timedelta(days=30))]
-        
-        # Sort calls and puts separately
-        calls = calls.sort_values('strike')
-        puts = puts.sort_values('strike')
-        
-        # Skip this expiration if no data is left after filtering
-        if calls.empty and puts.empty:
-            continue
-        
-        # Create the plot data
-        figure_data = {
+    figures_data = []
+    for expiration, rows in recent.groupby('expiration', sort=True):
+        calls = rows[rows['right'] == 'C']
+        puts = rows[rows['right'] == 'P']
+        figures_data.append({
             'expiration': expiration,
             'calls': {
                 'x': calls['strike'].tolist(),
-                'y': calls['impliedVolatility'].tolist(),
+                'y': calls['iv'].tolist(),
             },
             'puts': {
                 'x': puts['strike'].tolist(),
-                'y': puts['impliedVolatility'].tolist(),
+                'y': puts['iv'].tolist(),
             }
-        }
+        })
 
-        figures_data.append(figure_data)
+    return {'symbol': symbol, 'figures': figures_data,
+            'fetched': datetime.fromtimestamp(fetched).isoformat(timespec='seconds'),
+            'failed': sorted(failed, key=lambda failure: failure['expiration'])}
+
+
+def smile_ttl(data):
+    if 'fetched' not in data:
+        return PARTIAL_SMILE_TTL
+    # Fresh for SMILE_TTL after the download, however old the snapshot was when we loaded it
+    age = time.time() - datetime.fromisoformat(data['fetched']).timestamp()
+    return max(min(SMILE_TTL, PARTIAL_SMILE_TTL if data['failed'] else SMILE_TTL) - age, 0)
+
+
+@cached(ttl=SMILE_TTL, maxsize=64, ttl_for=smile_ttl)  # Per symbol, refreshed in the background when expired
+def fetch_option_data(symbol):
+    # A snapshot stored within the freshness window is as good as a new download
+    snapshot = smile_store.load_snapshot(symbol, max_age=SMILE_TTL)
+    if snapshot is not None and not snapshot[2]:
+        return smile_figures(symbol, *snapshot)
+
+    # Get all expiration dates
+    source = data_source()
+    expirations = source.expirations(symbol)
+    if not expirations:
+        return {"error": "No options data available for this symbol"}
+
+    chains, failed = fetch_chains(source, symbol, expirations)
+    fetched = int(time.time())
+    quotes = smile_store.chain_quotes(chains)
+    try:
+        smile_store.save_snapshot(symbol, quotes, failed, fetched)
+    except sqlite3.Error as e:
+        print(f"fetch_option_data: could not store the {symbol} snapshot: {str(e)}")
+
+    return smile_figures(symbol, quotes, fetched, failed)
+
+def smile_etag(symbol, asof=None):
+    """ETag of the snapshot /get_smile_data would serve, or None when it would have to download."""
+    try:
+        snapshot = smile_store.latest_fetched(symbol, asof=smile_store.parse_asof(asof) if asof else None)
+    except (ValueError, sqlite3.Error):
+        return None
+    if snapshot is None:
+        return None
+    fetched, partial = snapshot
+    if not asof and fetched < time.time() - (PARTIAL_SMILE_TTL if partial else SMILE_TTL):
+        return None
+    return make_etag(symbol, fetched)
 
-    return {'symbol': symbol, 'figures': figures_data}
 
 def get_smile_data():
     symbol = request.args.get('symbol', 'SPY')
-    
-    # Fetch data (will use cached data if available and not expired)
-    data = fetch_option_data(symbol)
+    asof = request.args.get('asof')
+
+    etag = smile_etag(symbol, asof)
+    unchanged = not_modified(etag)
+    if unchanged is not None:
+        return unchanged
+
+    if asof:
+        # Historical smile: the newest stored snapshot at or before asof
+        try:
+            snapshot = smile_store.load_snapshot(symbol, asof=smile_store.parse_asof(asof))
+        except ValueError:
+            return json.dumps({'error': f'Invalid asof {asof}, expected YYYY-MM-DD or YYYY-MM-DDTHH:MM'})
+        if snapshot is None:
+            return json.dumps({'error': f'No stored smile for {symbol} at or before {asof}'})
+        data = smile_figures(symbol, *snapshot)
+    else:
+        # Fetch data (will use cached data if available and not expired)
+        data = fetch_option_data(symbol)
 
     # Custom JSON encoder to handle NumPy types
     class NumpyEncoder(json.JSONEncoder):
@@ -96,5 +207,9 @@ def get_smile_data():
                 return obj.tolist()
             return super(NumpyEncoder, self).default(obj)
 
-    # Convert all figures data to JSON using the custom encoder
-    return json.dumps(data, cls=NumpyEncoder)
+    # Convert all figures data to JSON using the custom encoder; tagged by the snapshot actually served
+    etag = make_etag(symbol, int(datetime.fromisoformat(data['fetched']).timestamp())) if 'fetched' in data else None
+    return tagged(json.dumps(data, cls=NumpyEncoder), etag)
+
+def get_smile_cache_stats():
+    return jsonify(fetch_option_data.cache.stats())
@@ -0,0 +1,136 @@
+"""
+Local store of smile snapshots.
+
+Every live chain download is written as one snapshot: a smile_snapshot
+row (symbol, fetch time as epoch seconds, failed expirations) and one
+smile_quote row per expiration/right/strike with its IV and last trade
+time. /get_smile_data answers from the newest snapshot while it is
+fresh, and from the newest snapshot at or before `asof` for history.
+"""
+import datetime
+import json
+import os
+import time
+
+import pandas as pd
+
+from db_writer import connect
+
+DB_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'options.db')
+
+# Kept in step with create_table.sql
+CREATE_TABLES = '''
+    CREATE TABLE IF NOT EXISTS smile_snapshot (
+        id INTEGER PRIMARY KEY,
+        symbol VARCHAR(10) NOT NULL,
+        fetched INTEGER NOT NULL,
+        failed TEXT
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_smile_snapshot_symbol ON smile_snapshot (symbol, fetched);
+
+    CREATE TABLE IF NOT EXISTS smile_quote (
+        snapshot_id INTEGER NOT NULL REFERENCES smile_snapshot (id),
+        expiration DATE NOT NULL,
+        right CHAR(1) NOT NULL,
+        strike REAL NOT NULL,
+        iv REAL,
+        last_trade INTEGER,
+        PRIMARY KEY (snapshot_id, expiration, right, strike)
+    ) WITHOUT ROWID;
+'''
+
+LATEST_SNAPSHOT = '''
+    SELECT id, fetched, failed FROM smile_snapshot
+    WHERE symbol = ? AND fetched <= ? ORDER BY fetched DESC LIMIT 1
+'''
+
+SNAPSHOT_QUOTES = '''
+    SELECT expiration, right, strike, iv, last_trade FROM smile_quote
+    WHERE snapshot_id = ? ORDER BY expiration, right, strike
+'''
+
+EPOCH = pd.Timestamp('1970-01-01', tz='UTC')
+
+_ready = set()
+
+
+def _connect(db_path=None):
+    db_path = db_path or DB_PATH
+    conn = connect(db_path)
+    if db_path not in _ready:
+        conn.executescript(CREATE_TABLES)
+        _ready.add(db_path)
+    return conn
+
+
+def parse_asof(asof):
+    """'YYYY-MM-DD' (end of that day) or an ISO date-time, local time, to epoch seconds."""
+    value = datetime.datetime.fromisoformat(asof)
+    if len(asof) <= 10:
+        value += datetime.timedelta(days=1) - datetime.timedelta(seconds=1)
+    return int(value.timestamp())
+
+
+def chain_quotes(chains):
+    """{expiration: chain with .calls/.puts} to rows of (expiration, right, strike, iv, last_trade)."""
+    frames = []
+    for expiration, chain in chains.items():
+        for right, side in (('C', chain.calls), ('P', chain.puts)):
+            if side is None or side.empty:
+                continue
+            frames.append(pd.DataFrame({
+                'expiration': expiration,
+                'right': right,
+                'strike': side['strike'].astype(float).to_numpy(),
+                'iv': side['impliedVolatility'].astype(float).to_numpy(),
+                'last_trade': ((pd.to_datetime(side['lastTradeDate'], utc=True) - EPOCH) // pd.Timedelta(seconds=1)).to_numpy(),
+            }))
+    if not frames:
+        return pd.DataFrame(columns=['expiration', 'right', 'strike', 'iv', 'last_trade'])
+    return pd.concat(frames, ignore_index=True)
+
+
+def save_snapshot(symbol, quotes, failed, fetched=None, db_path=None):
+    """Write chain_quotes() rows as one snapshot; returns its id."""
+    fetched = int(fetched or time.time())
+    conn = _connect(db_path)
+    try:
+        with conn:
+            snapshot_id = conn.execute('INSERT INTO smile_snapshot (symbol, fetched, failed) VALUES (?, ?, ?)',
+                                       (symbol, fetched, json.dumps(failed) if failed else None)).lastrowid
+            conn.executemany('INSERT OR REPLACE INTO smile_quote VALUES (?, ?, ?, ?, ?, ?)',
+                             [(snapshot_id, *row) for row in zip(
+                                 quotes['expiration'].tolist(), quotes['right'].tolist(), quotes['strike'].tolist(),
+                                 quotes['iv'].tolist(), quotes['last_trade'].tolist())])
+    finally:
+        conn.close()
+    return snapshot_id
+
+
+def latest_fetched(symbol, asof=None, db_path=None):
+    """(fetched, has failures) of the newest snapshot at or before asof, or None; no quotes are read."""
+    conn = _connect(db_path)
+    try:
+        snapshot = conn.execute(LATEST_SNAPSHOT, (symbol, asof if asof is not None else time.time())).fetchone()
+    finally:
+        conn.close()
+    return (snapshot[1], bool(snapshot[2])) if snapshot else None
+
+
+def load_snapshot(symbol, asof=None, max_age=None, db_path=None):
+    """(quotes DataFrame, fetched, failed) of the newest snapshot at or before asof, or None.
+
+    With max_age, snapshots older than that many seconds (relative to now) are ignored.
+    """
+    now = time.time()
+    conn = _connect(db_path)
+    try:
+        snapshot = conn.execute(LATEST_SNAPSHOT, (symbol, asof if asof is not None else now)).fetchone()
+        if snapshot is None or (max_age is not None and snapshot[1] < now - max_age):
+            return None
+        snapshot_id, fetched, failed = snapshot
+        quotes = pd.read_sql_query(SNAPSHOT_QUOTES, conn, params=(snapshot_id,))
+    finally:
+        conn.close()
+    return quotes, fetched, json.loads(failed) if failed else []
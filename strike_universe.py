@@ -0,0 +1,171 @@
+"""
+Which contracts an ingestion run should actually request.
+
+The chain goes up to STRIKE_PRICE_LIMIT, but the dashboard only looks at
+strikes around the current VIX level, and most deep out-of-the-money
+contracts never trade. A contract is fetched every run when its strike is
+within MONEYNESS_BAND times the latest VIX close in vix_data, and either
+it traded in one of the last QUIET_SESSIONS sessions of daily_option or we
+have never checked it (no watermark). Untraded hours produce no bars, so
+a checked contract without any volume in that window counts as quiet
+whether or not it has rows. Everything else is only refreshed once
+its watermark is SLOW_REFRESH_DAYS old, so it still gets picked up when
+VIX moves or it starts trading, just not on every run.
+
+prioritize() then orders the selection the way the dashboard looks at the
+chain: nearest expiration first, then by distance of the strike from the
+VIX level, then by recent volume. Each of the first PRIORITY_TIERS - 1
+expirations is a tier of its own and later expirations share the last
+tier. TierProgress records in ingest_meta when every contract of a tier
+has been handled, as 'tier_<n>_completed' next to 'ingest_started' (epoch
+seconds), so the front month is known to be fresh seconds into a run
+rather than at its end.
+
+    universe = StrikeUniverse.load(conn)
+    contracts = universe.select(contracts, watermarks, spec=option_spec)
+    contracts, tiers = universe.prioritize(contracts)
+    progress = TierProgress(map(option_spec, contracts), tiers, writer)
+"""
+import datetime
+import time
+from collections import Counter
+
+from watermarks import EASTERN, normalize_expiration
+
+MONEYNESS_BAND = (0.5, 2.5)  # strikes from 0.5x to 2.5x the VIX level
+QUIET_SESSIONS = 5  # sessions without volume before a contract counts as quiet
+SLOW_REFRESH_DAYS = 5  # how often out-of-band and quiet contracts are still fetched
+PRIORITY_TIERS = 3  # front month, next expiration, everything else
+
+LATEST_VIX_QUERY = "SELECT close FROM vix_data WHERE symbol = 'VIX' ORDER BY date DESC LIMIT 1"
+
+# The first of the last `QUIET_SESSIONS` daily_option sessions
+SESSION_START_QUERY = 'SELECT DISTINCT date FROM daily_option ORDER BY date DESC LIMIT 1 OFFSET ?'
+
+VOLUME_QUERY = '''
+    SELECT symbol, expiration, strike, right, COALESCE(SUM(volume), 0) FROM daily_option
+    WHERE quote_type = 'TRADES' AND date >= ?
+    GROUP BY symbol, expiration, strike, right
+'''
+
+META_UPSERT = '''
+    INSERT INTO ingest_meta (key, value) VALUES (?, ?)
+    ON CONFLICT (key) DO UPDATE SET value = excluded.value
+'''
+
+
+def option_spec(contract):
+    """(symbol, expiration, strike, right) of an ib_insync / ib_async Option, as daily_option stores it."""
+    return (contract.symbol, normalize_expiration(contract.lastTradeDateOrContractMonth), float(contract.strike),
+            contract.right)
+
+
+class StrikeUniverse:
+    def __init__(self, vix_level=None, traded=None, band=MONEYNESS_BAND, slow_refresh_days=SLOW_REFRESH_DAYS,
+                 volume=None):
+        self.vix_level = vix_level
+        # (symbol, expiration, strike, right) with volume in the last QUIET_SESSIONS sessions;
+        # None while daily_option holds fewer sessions than that
+        self.traded = set(traded) if traded is not None else None
+        self.volume = volume or {}  # same key -> volume over those sessions (or all we have)
+        self.band = band
+        self.slow_refresh = datetime.timedelta(days=slow_refresh_days)
+        self.counters = {'selected': 0, 'out_of_band': 0, 'quiet': 0, 'slow_refresh': 0, 'duplicates': 0}
+
+    @classmethod
+    def load(cls, conn, band=MONEYNESS_BAND, quiet_sessions=QUIET_SESSIONS, slow_refresh_days=SLOW_REFRESH_DAYS):
+        row = conn.execute(LATEST_VIX_QUERY).fetchone()
+        vix_level = float(row[0]) if row else None
+        start = conn.execute(SESSION_START_QUERY, (quiet_sessions - 1,)).fetchone()
+        volume = {(s, e, float(k), r): v for s, e, k, r, v in conn.execute(VOLUME_QUERY, (start[0] if start else '',))}
+        traded = [key for key, v in volume.items() if v > 0] if start else None
+        low, high = band
+        print(f"Strike universe: VIX {vix_level}, band {low}x-{high}x, "
+              f"{'no' if traded is None else len(traded)} contracts traded in {quiet_sessions} sessions")
+        return cls(vix_level, traded, band, slow_refresh_days, volume)
+
+    def strike_range(self):
+        if self.vix_level is None:
+            return None  # no VIX history yet: no band
+        low, high = self.band
+        return low * self.vix_level, high * self.vix_level
+
+    def due(self, latest, now):
+        # Contracts outside the universe are fetched when their last check is old enough
+        return latest is None or now - datetime.datetime.strptime(latest, '%Y-%m-%d %H:%M:%S') >= self.slow_refresh
+
+    def select(self, items, watermarks=None, spec=option_spec, quote_type='TRADES', now=None):
+        """The items worth requesting this run, in their original order; one per contract across exchanges."""
+        # Watermarks are US/Eastern wall-clock times, whatever the host's zone
+        now = now or datetime.datetime.now(EASTERN).replace(tzinfo=None)
+        strikes = self.strike_range()
+        selected, seen = [], set()
+        for item in items:
+            key = spec(item)
+            if key in seen:
+                self.counters['duplicates'] += 1
+                continue
+            seen.add(key)
+            latest = watermarks.latest.get((quote_type, *key)) if watermarks is not None else None
+            if strikes is not None and not strikes[0] <= key[2] <= strikes[1]:
+                reason = 'out_of_band'
+            elif latest is not None and self.traded is not None and key not in self.traded:
+                reason = 'quiet'
+            else:
+                reason = None
+            if reason is not None:
+                self.counters[reason] += 1
+                if not self.due(latest, now):
+                    continue
+                self.counters['slow_refresh'] += 1
+            self.counters['selected'] += 1
+            selected.append(item)
+        print(f"Strike universe: {self.counters}")
+        return selected
+
+    def prioritize(self, items, spec=option_spec, tiers=PRIORITY_TIERS):
+        """(items in ingestion order, tier of each): nearest expiration, closest to VIX, most traded first."""
+        spot = self.vix_level or 0.0
+        keyed = sorted(((spec(item), item) for item in items),
+                       key=lambda pair: (pair[0][1], abs(pair[0][2] - spot), -self.volume.get(pair[0], 0), pair[0][3]))
+        expirations = sorted({key[1] for key, _ in keyed})
+        rank = {expiration: min(i, tiers - 1) for i, expiration in enumerate(expirations)}
+        return [item for _, item in keyed], [rank[key[1]] for key, _ in keyed]
+
+
+class TierProgress:
+    """Counts down each tier as its contracts are handled and records when a tier is done."""
+
+    def __init__(self, keys, tiers, writer=None, before_complete=None):
+        self.tier_of = dict(zip(keys, tiers))
+        self.before_complete = before_complete  # e.g. queue buffered bars, so the timestamp commits after them
+        self.remaining = Counter(self.tier_of.values())
+        self.writer = writer
+        self.started = time.time()
+        self.completed = {}  # tier -> seconds after start
+        self.failed = Counter()
+        self._write([('ingest_started', int(self.started))])
+        for tier in sorted(self.remaining):
+            print(f"Tier {tier}: {self.remaining[tier]} contracts")
+
+    def _write(self, rows):
+        if self.writer is not None:
+            self.writer.write(META_UPSERT, rows)
+
+    def done(self, key, failed=False):
+        """Mark one contract handled (after its bars were stored or buffered); the tier it completed, or None."""
+        tier = self.tier_of.pop(key, None)
+        if tier is None:
+            return None  # a retry or an unknown contract
+        self.failed[tier] += failed
+        self.remaining[tier] -= 1
+        if self.remaining[tier]:
+            return None
+        if self.before_complete is not None:
+            self.before_complete()
+        now = time.time()
+        self.completed[tier] = now - self.started
+        self._write([(f'tier_{tier}_completed', int(now))])
+        failures = f", {self.failed[tier]} failed" if self.failed[tier] else ''
+        print(f"Tier {tier} complete {self.completed[tier]:.1f}s into the run{failures}")
+        return tier
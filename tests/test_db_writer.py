@@ -0,0 +1,60 @@
+"""DBWriter: batching into transactions, flush, the generation counter and failed statements."""
+import sqlite3
+
+import pytest
+
+import db_writer
+from db_writer import DBWriter
+
+INSERT = 'INSERT INTO t (id, value) VALUES (?, ?)'
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'options.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE t (id INTEGER PRIMARY KEY, value TEXT NOT NULL)')
+    conn.close()
+    return path
+
+
+def read(db_path, sql):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def test_batches_are_grouped_into_transactions(db_path):
+    with DBWriter(db_path, max_rows=100, max_delay=60) as writer:
+        for batch in range(10):
+            writer.write(INSERT, [(batch * 50 + i, 'x') for i in range(50)])
+    assert read(db_path, 'SELECT COUNT(*) FROM t') == [(500,)]
+    # Every 100 rows, not every executemany
+    assert writer.stats['transactions'] == 5 and writer.stats['rows'] == 500 and writer.stats['statements'] == 10
+    assert read(db_path, "SELECT value FROM ingest_meta WHERE key = 'generation'") == [(5,)]
+    assert read(db_path, 'PRAGMA journal_mode') == [('wal',)]
+
+
+def test_flush_commits_and_notifies_listeners(db_path, monkeypatch):
+    commits = []
+    monkeypatch.setattr(db_writer, 'commit_listeners', [lambda: commits.append(1)])
+    with DBWriter(db_path, max_rows=10000, max_delay=60) as writer:
+        writer.write(INSERT, [(1, 'a'), (2, 'b')])
+        writer.execute('UPDATE t SET value = ? WHERE id = ?', ('c', 2))
+        writer.flush()
+        # Visible to another connection while the writer is still running
+        assert read(db_path, 'SELECT value FROM t ORDER BY id') == [('a',), ('c',)]
+        assert commits == [1]
+        writer.flush()  # nothing new: no empty transaction
+        assert commits == [1]
+
+
+def test_failed_statement_does_not_lose_the_batch(db_path):
+    with DBWriter(db_path, max_delay=60) as writer:
+        writer.write(INSERT, [(1, 'a')])
+        writer.write(INSERT, [(2, None)])  # NOT NULL
+        writer.write(INSERT, [(3, 'c')])
+    assert writer.stats['errors'] == 1
+    assert read(db_path, 'SELECT id FROM t ORDER BY id') == [(1,), (3,)]
@@ -0,0 +1,97 @@
+"""Black-76 pricing, implied-volatility round trips and Greeks against finite differences."""
+import math
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import greeks
+from greeks import black76_greeks, black76_price, implied_vol, ndtr
+
+RATE = greeks.RISK_FREE_RATE
+
+
+def test_ndtr_matches_erf():
+    x = np.linspace(-8, 8, 1601)
+    exact = np.array([0.5 * (1 + math.erf(v / math.sqrt(2))) for v in x])
+    assert np.max(np.abs(ndtr(x) - exact)) < 1e-7
+
+
+def test_implied_vol_round_trip():
+    # Deep in and out of the money, short and long expiries, both rights
+    forward, strike, t, sigma, is_call = (a.ravel() for a in np.meshgrid(
+        [18.0], [8.0, 12.0, 18.0, 25.0, 45.0], [3 / 365, 0.1, 0.5], [0.3, 0.8, 1.5], [True, False], indexing='ij'))
+    price = black76_price(forward, strike, t, sigma, is_call, RATE)
+    # A price within a hair of intrinsic says next to nothing about the volatility
+    intrinsic = np.exp(-RATE * t) * np.maximum(np.where(is_call, forward - strike, strike - forward), 0)
+    usable = price - intrinsic > 1e-4
+    assert usable.sum() > len(price) // 2
+    args = forward[usable], strike[usable], t[usable], is_call[usable]
+    recovered = implied_vol(price[usable], *args, RATE)
+    # The solver stops on the price, so the IV error is tolerance / vega
+    assert np.allclose(black76_price(args[0], args[1], args[2], recovered, args[3], RATE), price[usable], atol=1e-7)
+    assert np.allclose(recovered, sigma[usable], atol=1e-4)
+
+
+def test_implied_vol_outside_no_arbitrage_bounds_is_nan():
+    discount = math.exp(-RATE * 0.25)
+    iv = implied_vol(
+        price=[0.9 * discount, 20.0, 2.0],  # below intrinsic, above the discounted forward, expired
+        forward=[21.0, 18.0, 18.0], strike=[20.0, 20.0, 18.0], t=[0.25, 0.25, 0.0],
+        is_call=True, rate=RATE)
+    assert np.isnan(iv).all()
+
+
+@pytest.mark.parametrize('is_call', [True, False])
+def test_greeks_match_finite_differences(is_call):
+    forward, strike, t, sigma = 19.0, 21.0, 0.2, 0.9
+    g = black76_greeks(forward, strike, t, sigma, is_call, RATE)
+
+    def price(f=forward, tt=t, s=sigma):
+        return float(black76_price(f, strike, tt, s, is_call, RATE))
+
+    h = 1e-4
+    assert g['delta'] == pytest.approx((price(f=forward + h) - price(f=forward - h)) / (2 * h), rel=1e-5)
+    assert g['gamma'] == pytest.approx((price(f=forward + h) - 2 * price() + price(f=forward - h)) / h ** 2, rel=1e-3)
+    assert g['vega'] == pytest.approx((price(s=sigma + h) - price(s=sigma - h)) / (2 * h) / 100, rel=1e-5)
+    # Per calendar day, as time to expiry runs down
+    assert g['theta'] == pytest.approx(-(price(tt=t + h) - price(tt=t - h)) / (2 * h) / 365, rel=1e-4)
+
+
+def test_compute_chain_implies_the_forward_from_parity():
+    expiration, forward, sigma = '2024-07-17', 17.5, 0.85
+    dates = ['2024-06-10', '2024-06-11']
+    rows = []
+    for date in dates:
+        t = greeks.years_to_expiry(pd.Series([date]), expiration)[0]
+        for strike in (15.0, 17.0, 18.0, 20.0, 25.0):
+            for right in 'CP':
+                rows.append((date, strike, right, float(black76_price(forward, strike, t, sigma, right == 'C', RATE))))
+    chain = pd.DataFrame(rows, columns=['date', 'strike', 'right', 'close'])
+    spot = pd.Series([15.0, 15.2], index=dates)  # the index level: not what VIX options price off
+
+    computed = greeks.compute_chain(chain, spot, expiration)
+    assert (computed['forward_source'] == 'parity').all()
+    assert np.allclose(computed['forward'], forward)
+    assert np.allclose(computed['iv'], sigma, atol=1e-6)
+
+    # Without a call/put pair the date falls back to the spot close
+    calls_only = greeks.compute_chain(chain[chain['right'] == 'C'], spot, expiration)
+    assert (calls_only['forward_source'] == 'spot').all()
+    assert np.allclose(calls_only['forward'], calls_only['date'].map(spot))
+
+
+def test_chain_history_falls_back_to_the_last_close_of_each_day():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE daily_option (symbol, expiration, strike, right, quote_type, date, close, volume)')
+    conn.execute('CREATE TABLE vix_data (symbol, date, close)')
+    conn.executemany('INSERT INTO daily_option VALUES (?, ?, ?, ?, ?, ?, ?, ?)', [
+        ('VIX', '2024-07-17', 20.0, 'C', 'TRADES', date, 1.5, 10) for date in ('2024-06-10', '2024-06-11')])
+    conn.executemany('INSERT INTO vix_data VALUES (?, ?, ?)', [
+        ('VIX', '2024-06-10 10:00:00', 14.0), ('VIX', '2024-06-10 15:00:00', 15.0),
+        ('VIX', '2024-06-11 09:30:00', 16.0), ('VIX', '2024-06-11 15:00:00', 17.0),
+        ('VIX', '2024-06-12 15:00:00', 30.0)])
+    history = greeks.chain_history(conn, 'VIX', '2024-07-17')
+    assert history['forward'].tolist() == [15.0, 17.0]
+    assert history['iv'].notna().all()
@@ -0,0 +1,44 @@
+"""run_pipeline: the sliding window, retries and give-ups."""
+import asyncio
+from collections import Counter
+
+from ingestion_pipeline import run_pipeline
+
+
+def test_window_never_exceeds_concurrency_and_slow_items_do_not_block():
+    running = []
+    peak = []
+    results = []
+
+    async def worker(item):
+        running.append(item)
+        peak.append(len(running))
+        await asyncio.sleep(0.2 if item == 0 else 0.001)
+        running.remove(item)
+        return item * 10
+
+    report = asyncio.run(run_pipeline(range(20), worker, lambda item, result: results.append(result), concurrency=3))
+    assert max(peak) == 3
+    assert sorted(results) == [item * 10 for item in range(20)]
+    # The straggler finishes last; everything else flowed past it through the other two slots
+    assert results[-1] == 0
+    assert report.succeeded == 20 and report.retried == 0 and not report.failed
+
+
+def test_failures_are_retried_then_given_up():
+    attempts = Counter()
+    given_up = []
+
+    async def worker(item):
+        attempts[item] += 1
+        if item == 'always' or (item == 'once' and attempts[item] == 1):
+            raise asyncio.TimeoutError()
+        return item
+
+    results = []
+    report = asyncio.run(run_pipeline(['ok', 'once', 'always'], worker, lambda item, result: results.append(item),
+                                      max_attempts=3, on_failure=lambda item, error: given_up.append(item)))
+    assert sorted(results) == ['ok', 'once']
+    assert attempts == {'ok': 1, 'once': 2, 'always': 3}
+    assert report.retried == 3 and report.succeeded == 2
+    assert list(report.failed) == ['always'] and given_up == ['always']
@@ -0,0 +1,102 @@
+"""MarketDataLineScheduler against a gateway with fewer lines than configured, on a virtual clock."""
+import asyncio
+import types
+
+import pytest
+from eventkit import Event
+
+import market_data_scheduler
+from market_data_scheduler import MarketDataLineScheduler
+
+real_sleep = asyncio.sleep
+
+
+class FakeIB:
+    """Answers snapshots after a few loop turns; error 101 for any beyond `lines` at once."""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.in_use = 0
+        self.rejected = 0
+        self.errorEvent = Event('errorEvent')
+
+    async def reqTickersAsync(self, contract):
+        self.in_use += 1
+        try:
+            if self.in_use > self.lines:
+                self.rejected += 1
+                self.errorEvent.emit(0, 101, 'Max number of tickers has been reached', contract)
+                return []
+            for _ in range(3):
+                await real_sleep(0)
+            return [contract]
+        finally:
+            self.in_use -= 1
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(now=0.0)
+
+    async def sleep(seconds):
+        clock.now += seconds
+        await real_sleep(0)
+
+    monkeypatch.setattr(market_data_scheduler, 'time', types.SimpleNamespace(monotonic=lambda: clock.now))
+    monkeypatch.setattr(market_data_scheduler.asyncio, 'sleep', sleep)
+    return clock
+
+
+def contracts(n):
+    return [types.SimpleNamespace(conId=i + 1, localSymbol=f'VIX {i}') for i in range(n)]
+
+
+async def refresh(scheduler, chain):
+    rejected = scheduler.ib.rejected
+    tickers, _ = await scheduler.refresh(chain)
+    return sum(ticker is not None for ticker in tickers), scheduler.ib.rejected - rejected
+
+
+async def learned_cap(clock):
+    ib = FakeIB(lines=20)
+    scheduler = MarketDataLineScheduler(ib, max_lines=30, initial_backoff=0.5, probe_interval=60)
+    chain = contracts(100)
+
+    quoted, rejected = await refresh(scheduler, chain)
+    assert quoted == 100 and rejected > 0
+    assert scheduler.line_limit == scheduler.line_cap <= 20
+
+    # Clean passes inside the probe interval stay at the cap instead of climbing back to 30
+    settled = scheduler.line_limit
+    for _ in range(5):
+        clock.now += 5
+        assert await refresh(scheduler, chain) == (100, 0)
+    assert scheduler.line_limit == settled
+
+
+def test_learned_cap_is_only_probed_after_the_interval(clock):
+    asyncio.run(learned_cap(clock))
+
+
+async def rejected_probe(clock):
+    ib = FakeIB(lines=20)
+    scheduler = MarketDataLineScheduler(ib, max_lines=20, initial_backoff=0.5, probe_interval=60)
+    scheduler.line_limit = scheduler.line_cap = 19  # as if another client had held a line earlier
+    scheduler.probe_after = clock.now + 60
+    chain = contracts(100)
+
+    await refresh(scheduler, chain)
+    assert scheduler.line_limit == 19
+    clock.now += 60
+    await refresh(scheduler, chain)  # interval over: probes the 20th line, which the gateway has
+    assert scheduler.line_limit == 20 and scheduler.probing
+
+    ib.lines = 19  # the account lost a line
+    quoted, rejected = await refresh(scheduler, chain)
+    assert quoted == 100 and rejected > 0
+    assert scheduler.line_cap == scheduler.line_limit <= 19
+    assert scheduler.probe_interval == 120 and not scheduler.probing
+
+
+def test_rejected_probe_doubles_the_wait(clock):
+    asyncio.run(rejected_probe(clock))
@@ -0,0 +1,93 @@
+"""HistoricalRequestScheduler against the fake gateway's pacing rules, on a virtual clock."""
+import asyncio
+import types
+
+import pytest
+from eventkit import Event
+
+import request_scheduler
+from fake_ib_gateway import HistoricalPacing
+
+PACING_MESSAGE = 'Historical Market Data Service error message:API historical data query cancelled: pacing violation'
+
+
+class Bars(list):
+    reqId = 0
+
+
+class FakeIB:
+    """Checks every request against HistoricalPacing at the moment it is sent."""
+
+    def __init__(self, clock, paced_once=()):
+        self.clock = clock
+        self.errorEvent = Event('errorEvent')
+        self.pacing = HistoricalPacing()
+        self.paced_once = set(paced_once)  # conIds answered with one pacing error
+        self.sent = 0
+        self.violations = 0
+
+    async def reqHistoricalDataAsync(self, contract, endDateTime='', durationStr='', **kwargs):
+        self.sent += 1
+        key = (contract.conId, endDateTime, durationStr)
+        if self.pacing.violates(contract.conId, key, self.clock.now):
+            self.violations += 1
+        bars = Bars([endDateTime])
+        bars.reqId = self.sent
+        if contract.conId in self.paced_once:
+            self.paced_once.discard(contract.conId)
+            self.errorEvent.emit(bars.reqId, 162, PACING_MESSAGE, contract)
+        return bars
+
+
+def option(con_id):
+    return types.SimpleNamespace(conId=con_id, symbol='VIX', lastTradeDateOrContractMonth='20261021',
+                                 strike=20.0, right='C', exchange='CBOE', localSymbol=f'VIX {con_id}')
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(now=0.0)
+    real_sleep = asyncio.sleep
+
+    async def sleep(seconds):
+        # Virtual time only moves forward, and the pacing check reads the same clock as the scheduler
+        clock.now += seconds
+        await real_sleep(0)
+
+    monkeypatch.setattr(request_scheduler, 'time', types.SimpleNamespace(monotonic=lambda: clock.now))
+    monkeypatch.setattr(request_scheduler.asyncio, 'sleep', sleep)
+    return clock
+
+
+def run(ib, requests, **kwargs):
+    scheduler = request_scheduler.HistoricalRequestScheduler(ib, **kwargs)
+
+    async def main():
+        return await asyncio.gather(*(scheduler.submit(contract, endDateTime=end, durationStr='1 D')
+                                      for contract, end in requests))
+    return scheduler, asyncio.run(main())
+
+
+def test_global_limit_over_several_windows(clock):
+    ib = FakeIB(clock)
+    scheduler, results = run(ib, [(option(i), '') for i in range(150)])
+    assert ib.sent == 150 and ib.violations == 0
+    assert all(results)
+    # 60 per 10 minutes: the last 30 requests can't go out before the third window
+    assert clock.now >= 1200
+
+
+def test_one_contract_and_identical_requests(clock):
+    ib = FakeIB(clock)
+    requests = [(option(1), f'20260{day % 9 + 1}01 16:00:00') for day in range(40)]
+    scheduler, results = run(ib, requests)
+    assert ib.sent == 40 and ib.violations == 0
+
+
+def test_pacing_error_is_retried_after_backoff(clock):
+    ib = FakeIB(clock, paced_once={7})
+    scheduler, results = run(ib, [(option(7), '')], initial_backoff=2.0)
+    assert results == [['']]
+    stats = scheduler.stats()
+    assert stats['pacing_errors'] == 1 and stats['retries'] == 1 and stats['completed'] == 1
+    assert ib.violations == 0 and clock.now >= 15  # the resend is identical, so it waits out the 15 s rule
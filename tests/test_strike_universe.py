@@ -0,0 +1,99 @@
+"""StrikeUniverse selection and ordering, and TierProgress bookkeeping."""
+import datetime
+import sqlite3
+import types
+
+import pytest
+
+from strike_universe import META_UPSERT, StrikeUniverse, TierProgress, option_spec
+
+NOW = datetime.datetime(2024, 6, 12, 12, 0)
+RECENT = '2024-06-11 15:00:00'
+OLD = '2024-06-01 15:00:00'
+
+
+def option(strike, right='C', expiration='20240717', exchange='CBOE'):
+    return types.SimpleNamespace(symbol='VIX', lastTradeDateOrContractMonth=expiration, strike=strike, right=right,
+                                 exchange=exchange)
+
+
+def watermarks(**latest_by_strike):
+    return types.SimpleNamespace(latest={('TRADES', 'VIX', '2024-07-17', float(strike[1:]), 'C'): latest
+                                         for strike, latest in latest_by_strike.items()})
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE vix_data (symbol, date, close)')
+    conn.execute('CREATE TABLE daily_option (symbol, expiration, strike, right, quote_type, date, volume)')
+    conn.executemany('INSERT INTO vix_data VALUES (?, ?, ?)',
+                     [('VIX', '2024-06-10 15:00:00', 14.0), ('VIX', '2024-06-11 15:00:00', 16.0)])
+    rows = []
+    for day in range(1, 12):
+        date = f'2024-06-{day:02d}'
+        rows.append(('VIX', '2024-07-17', 20.0, 'C', 'TRADES', date, 5 if day >= 7 else 0))
+        rows.append(('VIX', '2024-07-17', 25.0, 'C', 'TRADES', date, 3 if day < 7 else 0))  # went quiet
+    conn.executemany('INSERT INTO daily_option VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+    return conn
+
+
+def test_load_reads_the_vix_level_and_recent_volume(conn):
+    universe = StrikeUniverse.load(conn)
+    assert universe.vix_level == 16.0
+    assert universe.strike_range() == (8.0, 40.0)
+    assert universe.traded == {('VIX', '2024-07-17', 20.0, 'C')}
+
+
+def test_load_without_enough_sessions_treats_nothing_as_quiet(conn):
+    assert StrikeUniverse.load(conn, quiet_sessions=50).traded is None
+
+
+def test_select(conn):
+    universe = StrikeUniverse.load(conn)
+    items = [option(20), option(20, exchange='SMART'), option(25), option(30), option(45), option(50)]
+    marks = watermarks(s20=RECENT, s25=RECENT, s30=OLD, s45=RECENT, s50=OLD)
+    selected = universe.select(items, marks, now=NOW)
+    # 20 traded; 25 quiet and checked yesterday; 30 quiet but due; 45 out of band; 50 out of band but due
+    assert [item.strike for item in selected] == [20, 30, 50]
+    assert universe.counters == {'selected': 3, 'out_of_band': 2, 'quiet': 2, 'slow_refresh': 2, 'duplicates': 1}
+
+
+def test_never_checked_contracts_are_always_selected(conn):
+    universe = StrikeUniverse.load(conn)
+    assert len(universe.select([option(25), option(30)], watermarks(), now=NOW)) == 2
+
+
+def test_prioritize_orders_by_expiration_distance_and_volume():
+    universe = StrikeUniverse(vix_level=16.0, volume={('VIX', '2024-07-17', 17.0, 'C'): 100})
+    items = [option(30, expiration='20240821'), option(15), option(17), option(16, expiration='20240724'),
+             option(16, expiration='20240918'), option(16, 'P')]
+    ordered, tiers = universe.prioritize(items)
+    assert [(option_spec(item)[1], item.strike, item.right) for item in ordered] == [
+        ('2024-07-17', 16, 'P'), ('2024-07-17', 17, 'C'), ('2024-07-17', 15, 'C'),
+        ('2024-07-24', 16, 'C'), ('2024-08-21', 30, 'C'), ('2024-09-18', 16, 'C')]
+    assert tiers == [0, 0, 0, 1, 2, 2]
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.rows = []
+
+    def write(self, sql, rows):
+        assert sql == META_UPSERT
+        self.rows.extend(rows)
+
+
+def test_tier_progress_records_each_completed_tier():
+    writer = RecordingWriter()
+    flushed = []
+    progress = TierProgress(['a', 'b', 'c'], [0, 0, 1], writer, before_complete=lambda: flushed.append(len(writer.rows)))
+    assert [key for key, _ in writer.rows] == ['ingest_started']
+
+    assert progress.done('a') is None
+    assert progress.done('a') is None  # a retry of a handled contract
+    assert progress.done('c', failed=True) == 1
+    assert progress.done('b') == 0
+    assert [key for key, _ in writer.rows] == ['ingest_started', 'tier_1_completed', 'tier_0_completed']
+    assert flushed == [1, 2]  # buffered bars go out before each completion timestamp
+    assert progress.failed[1] == 1 and set(progress.completed) == {0, 1}
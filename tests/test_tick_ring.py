@@ -0,0 +1,52 @@
+"""TickRing: wrap-around, tick and overwrite counting, and the compacted rows."""
+import calendar
+import datetime
+
+import numpy as np
+
+from tick_ring import FIELDS, TickRing, eastern_ts
+
+CONTRACTS = [('VIX', '2024-07-17', 20.0, 'C'), ('VIX', '2024-07-17', 20.0, 'P')]
+START = calendar.timegm((2024, 6, 12, 14, 0, 0))  # 10:00 in New York (EDT)
+TICKS = len(CONTRACTS[0]) + len(FIELDS)  # position of the tick count in a compacted row
+
+
+def values(i, last=None):
+    row = np.full(len(FIELDS), np.nan)
+    row[0] = START + i
+    row[1:3] = 10 + i, 11 + i  # bid, ask
+    row[3] = np.nan if last is None else last
+    return row
+
+
+def test_eastern_ts_is_new_york_wall_clock():
+    assert eastern_ts(START) == calendar.timegm(datetime.datetime(2024, 6, 12, 10, 0).timetuple())
+
+
+def test_wrapped_ring_counts_every_tick_and_the_overwritten_ones():
+    ring = TickRing(CONTRACTS, capacity=4)
+    for i in range(10):
+        ring.record(0, values(i, last=float(i)))
+
+    [row] = ring.compact()
+    assert row[:4] == CONTRACTS[0]
+    assert row[4] == eastern_ts(START + 9)  # newest state
+    assert row[5:7] == (19.0, 20.0)
+    assert row[TICKS] == 10  # the true count, not just what is left in the ring
+    assert row[TICKS + 1:] == (9.0, 6.0)  # high/low of the last prices still in the ring
+    assert ring.overwritten == 6
+
+
+def test_compact_only_reports_what_is_new():
+    ring = TickRing(CONTRACTS, capacity=4)
+    ring.record(0, values(0, last=1.5))
+    ring.record(1, values(0))
+    assert len(ring.compact()) == 2
+    assert ring.compact() == []
+
+    for i in range(3):
+        ring.record(1, values(i + 1))  # quotes without a trade
+    [row] = ring.compact()
+    assert row[:4] == CONTRACTS[1]
+    assert row[TICKS:] == (3, None, None)
+    assert ring.overwritten == 0
@@ -0,0 +1,126 @@
+"""TTLCache: expiry, stale-while-revalidate, single flight, eviction and per-value TTLs."""
+import threading
+import types
+
+import pytest
+
+import ttl_cache
+from ttl_cache import TTLCache, cached
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(ttl_cache, 'time', types.SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+class Loader:
+    def __init__(self, *values, gate=None):
+        self.values = list(values)
+        self.calls = 0
+        self.gate = gate  # threading.Event the load waits for
+
+    def __call__(self):
+        self.calls += 1
+        if self.gate is not None:
+            assert self.gate.wait(5)
+        value = self.values.pop(0)
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+
+def test_expired_entry_is_served_stale_while_it_refreshes(clock):
+    cache = TTLCache(ttl=60, max_stale=600)
+    assert cache.get('VIX', Loader('v1')) == 'v1'
+    clock.now += 30
+    assert cache.get('VIX', Loader('unused')) == 'v1'
+
+    clock.now += 31
+    gate = threading.Event()
+    refresh = Loader('v2', gate=gate)
+    assert cache.get('VIX', refresh) == 'v1'  # stale, without waiting for the reload
+    future = cache.inflight['VIX']
+    assert cache.get('VIX', refresh) == 'v1'  # one refresh at a time
+    gate.set()
+    assert future.result(timeout=5) == 'v2'
+    assert cache.get('VIX', Loader('unused')) == 'v2'
+    assert refresh.calls == 1
+    assert cache.stats()['stale_hits'] == 2 and cache.stats()['refreshes'] == 1
+
+
+def test_too_stale_is_a_miss(clock):
+    cache = TTLCache(ttl=60, max_stale=600)
+    cache.get('VIX', Loader('v1'))
+    clock.now += 60 + 600
+    assert cache.get('VIX', Loader('v2')) == 'v2'
+    assert cache.stats()['misses'] == 2
+
+
+def test_failed_refresh_keeps_the_stale_value(clock):
+    cache = TTLCache(ttl=60, max_stale=600)
+    cache.get('VIX', Loader('v1'))
+    clock.now += 61
+    gate = threading.Event()
+    assert cache.get('VIX', Loader(RuntimeError('yahoo down'), gate=gate)) == 'v1'
+    failed = cache.inflight['VIX']
+    gate.set()
+    with pytest.raises(RuntimeError):
+        failed.result(timeout=5)
+    # Still served, and the next stale hit tries again
+    retry = Loader('v2')
+    assert cache.get('VIX', retry) == 'v1'
+    cache.inflight.get('VIX', failed).exception(timeout=5)
+    assert cache.stats()['refresh_errors'] == 1 and retry.calls == 1
+
+
+def test_concurrent_misses_share_one_load(clock):
+    cache = TTLCache(ttl=60)
+    gate = threading.Event()
+    loader = Loader('v1', gate=gate)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get('VIX', loader))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    gate.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == ['v1'] * 5 and loader.calls == 1
+    assert cache.stats()['misses'] + cache.stats()['deduplicated'] + cache.stats()['hits'] == 5
+
+
+def test_failed_load_is_not_cached(clock):
+    cache = TTLCache(ttl=60)
+    with pytest.raises(ValueError):
+        cache.get('VIX', Loader(ValueError('bad symbol')))
+    assert cache.get('VIX', Loader('v1')) == 'v1'
+
+
+def test_lru_eviction_and_ttl_for(clock):
+    cache = TTLCache(ttl=3600, maxsize=2, max_stale=0, ttl_for=lambda value: 5 if value.endswith('partial') else 3600)
+    cache.get('a', Loader('a'))
+    cache.get('b', Loader('b partial'))
+    cache.get('a', Loader('unused'))  # a is now the most recently used
+    cache.get('c', Loader('c'))
+    assert set(cache.entries) == {'a', 'c'} and cache.stats()['evictions'] == 1
+
+    cache.get('b', Loader('b partial'))
+    clock.now += 6
+    assert cache.get('b', Loader('b')) == 'b'  # the partial value expired after 5 s and max_stale is 0
+    assert cache.get('c', Loader('unused')) == 'c'
+
+
+def test_cached_decorator_keys_on_arguments(clock):
+    calls = []
+
+    @cached(ttl=60)
+    def square(x, scale=1):
+        calls.append(x)
+        return x * x * scale
+
+    assert [square(3), square(3), square(4), square(3, scale=2)] == [9, 9, 16, 18]
+    assert calls == [3, 4, 3]
+    square.cache.invalidate()
+    square(3)
+    assert calls == [3, 4, 3, 3]
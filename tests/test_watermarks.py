@@ -0,0 +1,64 @@
+"""WatermarkIndex: the reference bar, days_back and what record/flush write back."""
+import datetime
+
+import pandas as pd
+import pytest
+
+from watermarks import DEFAULT_DAYS_BACK, EASTERN, WatermarkIndex, market_reference_time
+
+
+def eastern(*args):
+    return EASTERN.localize(datetime.datetime(*args))
+
+
+@pytest.mark.parametrize('now, expected', [
+    (eastern(2024, 6, 12, 12, 30), eastern(2024, 6, 12, 11, 0)),  # Wednesday midday: the bar that just closed
+    (eastern(2024, 6, 12, 10, 15), eastern(2024, 6, 12, 9, 30)),
+    (eastern(2024, 6, 12, 17, 0), eastern(2024, 6, 12, 15, 0)),
+    (eastern(2024, 6, 10, 9, 0), eastern(2024, 6, 7, 15, 0)),  # Monday before the first bar closes: Friday
+    (eastern(2024, 6, 15, 12, 0), eastern(2024, 6, 14, 15, 0)),  # Saturday
+])
+def test_market_reference_time(now, expected):
+    assert market_reference_time(now) == expected
+
+
+def index(latest):
+    rows = [('TRADES', 'VIX', '2024-07-17', 20, 'C', latest)] if latest else []
+    return WatermarkIndex(rows, now=eastern(2024, 6, 12, 12, 30))
+
+
+@pytest.mark.parametrize('latest, expected', [
+    (None, DEFAULT_DAYS_BACK),
+    ('2024-06-12 11:00:00', 0),  # already has the reference bar
+    ('2024-06-12 10:00:00', 1),  # same day, a bar behind: still one day
+    ('2024-06-07 15:00:00', 3),  # Friday -> Wednesday, weekend skipped
+])
+def test_days_back(latest, expected):
+    # IB's YYYYMMDD expiration finds the row stored as YYYY-MM-DD
+    assert index(latest).days_back('VIX', '20240717', 20.0, 'C', 'TRADES') == expected
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.batches = []
+
+    def write(self, sql, rows):
+        self.batches.append((sql, list(rows)))
+
+
+def test_record_and_flush():
+    watermarks = index('2024-06-07 15:00:00')
+    bars = pd.DataFrame({'date': ['2024-06-11 15:00:00', '2024-06-12 11:00:00']})
+    watermarks.record('VIX', '20240717', 20, 'C', 'TRADES', bars)
+    watermarks.record('VIX', '20240717', 21, 'P', 'TRADES', pd.DataFrame({'date': []}))  # checked, nothing new
+
+    assert watermarks.days_back('VIX', '20240717', 20, 'C', 'TRADES') == 0
+    # The empty result is stamped with the current Eastern time, after the reference bar
+    assert watermarks.days_back('VIX', '20240717', 21, 'P', 'TRADES') == 0
+
+    writer = RecordingWriter()
+    assert watermarks.flush(writer) == 2
+    status_rows = writer.batches[-1][1]
+    assert [row[:5] for row in status_rows] == [('VIX', '2024-07-17', 20.0, 'C', 'TRADES'),
+                                                ('VIX', '2024-07-17', 21.0, 'P', 'TRADES')]
+    assert watermarks.flush(writer) == 0
@@ -0,0 +1,105 @@
+"""
+Preallocated per-contract ring buffers for streaming market data.
+
+Every tick batch ib_insync reports for a contract is written as one row of
+FIELDS into that contract's slot of a single (contracts, capacity, fields)
+float array, overwriting the oldest row once the ring is full, so memory
+stays fixed however long the capture runs. compact() turns everything
+written since the previous call into one quote_snapshot row per contract
+(the newest state plus the tick count and range of last prices) for the
+DBWriter.
+
+Not thread-safe: record() and compact() are meant to run on the IB event
+loop thread (see concurrent_get_current_quotes.capture).
+"""
+import calendar
+import datetime
+
+import numpy as np
+import pytz
+
+from bar_store import CONTRACT_ID
+
+EASTERN = pytz.timezone('US/Eastern')
+
+FIELDS = ('time', 'bid', 'ask', 'last', 'bid_size', 'ask_size', 'last_size',
+          'iv', 'delta', 'gamma', 'vega', 'theta', 'und_price')
+TIME, LAST = FIELDS.index('time'), FIELDS.index('last')
+
+DEFAULT_CAPACITY = 1024  # rows per contract
+
+# Kept in step with create_table.sql
+CREATE_QUOTE_SNAPSHOT = '''
+    CREATE TABLE IF NOT EXISTS quote_snapshot (
+        contract_id INTEGER NOT NULL REFERENCES contract (id),
+        ts INTEGER NOT NULL,
+        bid REAL,
+        ask REAL,
+        last REAL,
+        bid_size REAL,
+        ask_size REAL,
+        last_size REAL,
+        iv REAL,
+        delta REAL,
+        gamma REAL,
+        vega REAL,
+        theta REAL,
+        und_price REAL,
+        ticks INTEGER NOT NULL,
+        last_high REAL,
+        last_low REAL,
+        PRIMARY KEY (contract_id, ts)
+    ) WITHOUT ROWID
+'''
+
+QUOTE_SNAPSHOT_INSERT = f'''
+    INSERT OR REPLACE INTO quote_snapshot
+    (contract_id, ts, {', '.join(FIELDS[1:])}, ticks, last_high, last_low)
+    VALUES ({CONTRACT_ID}, ?, {', '.join('?' * (len(FIELDS) - 1))}, ?, ?, ?)
+'''
+
+
+def eastern_ts(epoch):
+    """Unix time to the ts convention of the bar table: US/Eastern wall-clock seconds."""
+    wall = datetime.datetime.fromtimestamp(epoch, EASTERN)
+    return calendar.timegm(wall.timetuple())
+
+
+def ticker_values(ticker, now):
+    """A row of FIELDS from an ib_insync Ticker; fields IB has not sent yet stay NaN."""
+    greeks = ticker.modelGreeks
+    return (now, ticker.bid, ticker.ask, ticker.last, ticker.bidSize, ticker.askSize, ticker.lastSize,
+            *((greeks.impliedVol, greeks.delta, greeks.gamma, greeks.vega, greeks.theta, greeks.undPrice)
+              if greeks else (np.nan,) * 6))
+
+
+class TickRing:
+    def __init__(self, contracts, capacity=DEFAULT_CAPACITY):
+        # contracts: (symbol, expiration, strike, right) in ring order
+        self.contracts = list(contracts)
+        self.capacity = capacity
+        self.data = np.full((len(self.contracts), capacity, len(FIELDS)), np.nan)
+        self.written = np.zeros(len(self.contracts), dtype=np.int64)  # rows ever written per contract
+        self.flushed = np.zeros(len(self.contracts), dtype=np.int64)  # written as of the last compact()
+        self.overwritten = 0  # rows lost because a ring wrapped between two flushes
+
+    def record(self, index, values):
+        self.data[index, self.written[index] % self.capacity] = values
+        self.written[index] += 1
+
+    def compact(self):
+        """quote_snapshot rows for every contract that ticked since the last call."""
+        rows = []
+        for index in np.flatnonzero(self.written > self.flushed):
+            ticks = int(self.written[index] - self.flushed[index])
+            count = min(ticks, self.capacity)  # rows still in the ring
+            self.overwritten += ticks - count
+            slots = np.arange(self.written[index] - count, self.written[index]) % self.capacity
+            window = self.data[index, slots]
+            latest = window[-1]
+            trades = window[:, LAST][~np.isnan(window[:, LAST])]
+            rows.append((*self.contracts[index], eastern_ts(latest[TIME]), *latest[1:].tolist(), ticks,
+                         float(trades.max()) if trades.size else None,
+                         float(trades.min()) if trades.size else None))
+        self.flushed[:] = self.written
+        return rows
@@ -0,0 +1,133 @@
+"""
+Thread-safe cache with a TTL per key, LRU eviction and stale-while-revalidate.
+
+- A fresh entry is returned straight away (hit).
+- An expired entry younger than `max_stale` is still returned straight
+  away (stale hit) while a single background thread reloads that key.
+- Anything else is a miss. Concurrent misses on the same key share one
+  call to the loader (single flight) instead of each downloading the
+  same data.
+
+    @cached(ttl=3600, maxsize=64)
+    def fetch_option_data(symbol): ...
+
+    fetch_option_data.cache.stats()
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import wraps
+
+
+class TTLCache:
+    def __init__(self, ttl, maxsize=128, max_stale=24 * 3600, name='cache', ttl_for=None):
+        self.ttl = ttl
+        self.ttl_for = ttl_for  # optional value -> ttl, e.g. to keep partial results for less time
+        self.maxsize = maxsize
+        self.max_stale = max_stale
+        self.name = name
+        self.entries = OrderedDict()  # key -> (value, expires)
+        self.inflight = {}  # key -> Future of the load in progress
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'deduplicated': 0,
+                         'refreshes': 0, 'refresh_errors': 0, 'load_errors': 0, 'evictions': 0}
+
+    def get(self, key, loader):
+        """Value for key, calling loader() on a miss or in the background once it is stale."""
+        with self.lock:
+            now = time.monotonic()
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if now < expires:
+                    self.counters['hits'] += 1
+                    self.entries.move_to_end(key)
+                    return value
+                if now < expires + self.max_stale:
+                    self.counters['stale_hits'] += 1
+                    self.entries.move_to_end(key)
+                    if key not in self.inflight:
+                        future = self.inflight[key] = Future()
+                        threading.Thread(target=self._refresh, args=(key, loader, future),
+                                         name=f'{self.name}-refresh', daemon=True).start()
+                    return value
+
+            future = self.inflight.get(key)
+            if future is None:
+                self.counters['misses'] += 1
+                future = self.inflight[key] = Future()
+                owner = True
+            else:
+                self.counters['deduplicated'] += 1
+                owner = False
+
+        if owner:
+            self._load(key, loader, future)
+        return future.result()
+
+    def _load(self, key, loader, future):
+        try:
+            value = loader()
+        except BaseException as e:
+            with self.lock:
+                self.counters['load_errors'] += 1
+                self.inflight.pop(key, None)
+            future.set_exception(e)
+            return
+        self._store(key, value)
+        future.set_result(value)
+
+    def _refresh(self, key, loader, future):
+        try:
+            value = loader()
+        except Exception as e:
+            # Keep serving the stale value; the next stale hit tries again
+            print(f"{self.name}: refresh of {key} failed: {str(e)}")
+            with self.lock:
+                self.counters['refresh_errors'] += 1
+                self.inflight.pop(key, None)
+            future.set_exception(e)
+            return
+        with self.lock:
+            self.counters['refreshes'] += 1
+        self._store(key, value)
+        future.set_result(value)
+
+    def _store(self, key, value):
+        with self.lock:
+            ttl = self.ttl if self.ttl_for is None else self.ttl_for(value)
+            self.entries[key] = (value, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            self.inflight.pop(key, None)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def invalidate(self, key=None):
+        with self.lock:
+            if key is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
+
+    def stats(self):
+        with self.lock:
+            return {**self.counters, 'size': len(self.entries), 'maxsize': self.maxsize,
+                    'ttl': self.ttl, 'refreshing': len(self.inflight)}
+
+
+def cached(ttl, maxsize=128, max_stale=24 * 3600, ttl_for=None):
+    """Decorator form of TTLCache, keyed on the call's arguments."""
+    def decorator(func):
+        cache = TTLCache(ttl, maxsize, max_stale, name=func.__name__, ttl_for=ttl_for)
+
+        @wraps(func)
+        def wrapped(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            return cache.get(key, lambda: func(*args, **kwargs))
+
+        wrapped.cache = cache
+        return wrapped
+
+    return decorator
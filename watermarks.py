@@ -0,0 +1,104 @@
+"""
+In-memory index of quote_status watermarks (latest stored bar per contract).
+
+Loaded with one SELECT at the start of an ingestion run, consulted instead
+of querying quote_status per contract, updated as results land and written
+back to bar_status as a single batch by flush().
+"""
+import datetime
+
+import numpy as np
+import pytz
+
+from bar_store import CONTRACT_UPSERT, QUOTE_TYPE_INSERT, STATUS_INSERT, to_epoch
+
+EASTERN = pytz.timezone('US/Eastern')
+DEFAULT_DAYS_BACK = 30  # history requested for contracts we have never stored
+
+
+def market_reference_time(now=None):
+    """Start time of the latest hourly RTH bar that has completed by `now`."""
+    current = now or datetime.datetime.now(EASTERN)
+    day, bar = current.date(), None
+    if current.weekday() < 5:
+        if current.time() >= datetime.time(16, 0):
+            bar = datetime.time(15, 0)
+        elif current.time() >= datetime.time(11, 0):
+            bar = datetime.time(current.hour - 1, 0)
+        elif current.time() >= datetime.time(10, 0):
+            bar = datetime.time(9, 30)
+    if bar is None:
+        # Before 10:00 or on a weekend: the last bar of the previous session
+        day -= datetime.timedelta(days=1)
+        while day.weekday() >= 5:
+            day -= datetime.timedelta(days=1)
+        bar = datetime.time(15, 0)
+    return EASTERN.localize(datetime.datetime.combine(day, bar))
+
+
+def normalize_expiration(expiration):
+    # IB uses YYYYMMDD, the database stores YYYY-MM-DD
+    if len(expiration) == 8 and expiration.isdigit():
+        return f'{expiration[:4]}-{expiration[4:6]}-{expiration[6:]}'
+    return expiration
+
+
+class WatermarkIndex:
+    def __init__(self, rows=(), now=None):
+        # (quote_type, symbol, expiration, strike, right) -> latest 'YYYY-MM-DD HH:MM:SS'
+        self.latest = {}
+        for quote_type, symbol, expiration, strike, right, latest in rows:
+            self.latest[(quote_type, symbol, expiration, float(strike), right)] = latest
+        self.dirty = set()
+        self.reference = market_reference_time(now)
+
+    @classmethod
+    def load(cls, conn, now=None):
+        rows = conn.execute('SELECT quote_type, symbol, expiration, strike, right, latest FROM quote_status').fetchall()
+        print(f"Loaded {len(rows)} watermarks")
+        return cls(rows, now)
+
+    @staticmethod
+    def key(symbol, expiration, strike, right, quote_type):
+        return (quote_type, symbol, normalize_expiration(expiration), float(strike), right)
+
+    def days_back(self, symbol, expiration, strike, right, quote_type):
+        """Number of trading days to request so that only missing bars are fetched."""
+        latest = self.latest.get(self.key(symbol, expiration, strike, right, quote_type))
+        if latest is None:
+            print('No previous data')
+            return DEFAULT_DAYS_BACK
+
+        latest = EASTERN.localize(datetime.datetime.strptime(latest, '%Y-%m-%d %H:%M:%S'))
+        if latest >= self.reference:
+            return 0
+        days_back = int(np.busday_count(latest.date(), self.reference.date()))
+        return max(days_back, 1)  # Ensure we always request at least one day of data if there's a gap
+
+    def record(self, symbol, expiration, strike, right, quote_type, df):
+        """Advance the watermark after df was stored; an empty result marks the contract as checked now."""
+        if df is not None and not df.empty:
+            latest = df['date'].max()
+        else:
+            # Eastern wall-clock time, like the bar dates and market_reference_time()
+            latest = datetime.datetime.now(EASTERN).strftime('%Y-%m-%d %H:%M:%S')
+        key = self.key(symbol, expiration, strike, right, quote_type)
+        if self.latest.get(key) != latest:
+            self.latest[key] = latest
+            self.dirty.add(key)
+
+    def flush(self, writer):
+        """Queue changed watermarks on the DBWriter as one batch, after the bars they cover."""
+        if not self.dirty:
+            return 0
+        keys = sorted(self.dirty)
+        # Contracts that were checked but had no bars are not in the contract table yet
+        writer.write(QUOTE_TYPE_INSERT, sorted({(quote_type,) for quote_type, *_ in keys}))
+        writer.write(CONTRACT_UPSERT, [(None, symbol, expiration, strike, right)
+                                       for _, symbol, expiration, strike, right in keys])
+        rows = [(symbol, expiration, strike, right, quote_type, to_epoch(self.latest[key]))
+                for key in keys
+                for quote_type, symbol, expiration, strike, right in [key]]
+        writer.write(STATUS_INSERT, rows)
+        self.dirty.clear()
+        return len(rows)